@@ -0,0 +1,210 @@
+# action_profiles.py
+"""
+Declarative generation profiles cho các quick action (summary/explain/...).
+
+Mỗi profile mô tả prompt + tham số sinh cho một action và được dùng chung
+bởi mọi provider. Người dùng có thể ghi đè từng khóa trong mục "actions"
+của config.json; khóa không ghi đè lấy từ DEFAULT_ACTIONS.
+
+System prompt luôn bắt đầu bằng BASE_SYSTEM (không đổi giữa các action và
+các lần gọi), nội dung biến đổi (văn bản người dùng) luôn nằm cuối cùng,
+để server tái sử dụng KV-cache của phần prefix.
+"""
+import copy
+import logging
+from typing import Any, Dict, List, Optional
+
+# Prefix chung cho mọi action - KHÔNG chèn thời gian/biến động vào đây.
+BASE_SYSTEM = {
+    "vi": "Bạn là trợ lý AI chạy cục bộ trong ứng dụng AI Summarizer. Luôn trả lời bằng tiếng Việt.",
+    "en": "You are a local AI assistant inside the AI Summarizer app. Always answer in English.",
+}
+
+DEFAULT_ACTIONS: Dict[str, Dict[str, Any]] = {
+    "summary": {
+        "system": {
+            "vi": "Nhiệm vụ: tóm tắt ngắn gọn, ưu tiên bullet points, giữ từ khóa quan trọng, nêu hành động chính.",
+            "en": "Task: summarize concisely, prefer bullet points, preserve key terms and main actions.",
+        },
+        "template": "{text}",
+        "max_tokens": 512,
+        "temperature": 0.2,
+        "stop": [],
+        "num_ctx": 8192,
+        "latency": {"first_token_ms": 2000, "total_ms": 20000},
+        "think": False,
+        # Input dài hơn ngân sách này được rút gọn trích xuất trước (text_reducer)
+        "reduce_tokens": 6000,
+    },
+    "explain": {
+        "system": {
+            "vi": "Nhiệm vụ: giải thích dễ hiểu, ngắn gọn, kèm ví dụ thực tế.",
+            "en": "Task: explain simply and concisely, with practical examples.",
+        },
+        "template": "{text}",
+        "max_tokens": 768,
+        "temperature": 0.3,
+        "stop": [],
+        "num_ctx": 8192,
+        "latency": {"first_token_ms": 2000, "total_ms": 25000},
+        "think": False,
+        "reduce_tokens": 6000,
+    },
+    "translate": {
+        "system": {
+            "vi": "Nhiệm vụ: dịch nội dung sang tiếng Việt, giữ nguyên thuật ngữ. Chỉ trả về bản dịch.",
+            "en": "Task: translate the content to English, preserve terms. Return only the translation.",
+        },
+        "template": "{text}",
+        # Bản dịch không nên dài hơn nhiều so với bản gốc
+        "max_tokens": 1024,
+        "max_tokens_ratio": 2.0,
+        "temperature": 0.1,
+        "stop": [],
+        "num_ctx": 8192,
+        "latency": {"first_token_ms": 1500, "total_ms": 15000},
+        "think": False,
+    },
+    "rewrite": {
+        "system": {
+            "vi": "Nhiệm vụ: viết lại văn bản rõ ràng, mạch lạc, chuyên nghiệp hơn nhưng giữ nguyên ý nghĩa. Chỉ trả về văn bản đã viết lại.",
+            "en": "Task: rewrite the text to be clearer, more coherent and more professional while preserving its meaning. Return only the rewritten text.",
+        },
+        "template": "{text}",
+        "max_tokens": 1024,
+        "max_tokens_ratio": 2.0,
+        "temperature": 0.4,
+        "stop": [],
+        "num_ctx": 8192,
+        "latency": {"first_token_ms": 2000, "total_ms": 20000},
+        "think": False,
+    },
+    "custom": {
+        "system": {"vi": "", "en": ""},
+        "template": "{prompt}\n\nNội dung:\n{text}",
+        "max_tokens": 1024,
+        "temperature": 0.2,
+        "stop": [],
+        "num_ctx": 8192,
+        "latency": {"first_token_ms": 2000, "total_ms": 30000},
+        # None = để model tự quyết (prompt tự do có thể cần suy luận)
+        "think": None,
+    },
+}
+
+# Các khóa profile được map sang cfg của provider.
+# "think": False yêu cầu model reasoning bỏ qua bước suy luận (Ollama think=false,
+# LM Studio thêm /no_think) - quick action cần câu trả lời nhanh.
+GENERATION_KEYS = ("temperature", "max_tokens", "stop", "num_ctx", "think")
+
+
+def get_profile(action: str, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Trả về profile của action (đã merge với config người dùng).
+    Action không biết sẽ dùng profile "custom"."""
+    base = DEFAULT_ACTIONS.get(action, DEFAULT_ACTIONS["custom"])
+    profile = copy.deepcopy(base)
+    user = (overrides or {}).get(action) or {}
+    for key, value in user.items():
+        if isinstance(value, dict) and isinstance(profile.get(key), dict):
+            profile[key].update(value)
+        else:
+            profile[key] = value
+    profile["name"] = action
+    return profile
+
+
+_SAME = object()
+
+
+def _diff(value: Any, default: Any) -> Any:
+    """Phần của value khác default (dict so sánh từng khóa); _SAME nếu giống hệt."""
+    if isinstance(value, dict) and isinstance(default, dict):
+        out = {k: _diff(v, default.get(k, _SAME)) for k, v in value.items()}
+        out = {k: v for k, v in out.items() if v is not _SAME}
+        return out or _SAME
+    return _SAME if value == default else value
+
+
+def action_overrides(actions: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Chỉ các khóa người dùng thực sự đổi so với DEFAULT_ACTIONS - phần được
+    lưu trong config.json. Config cũ chứa bản sao đầy đủ của profile mặc định
+    sẽ được thu gọn, để thay đổi DEFAULT_ACTIONS sau này tới được người dùng."""
+    out: Dict[str, Any] = {}
+    for action, user in (actions or {}).items():
+        base = DEFAULT_ACTIONS.get(action, DEFAULT_ACTIONS["custom"])
+        changed = _diff(user, base) if isinstance(user, dict) else user
+        if changed is not _SAME:
+            out[action] = changed
+    return out
+
+
+def system_prompt(profile: Dict[str, Any], lang: str) -> str:
+    """BASE_SYSTEM + chỉ dẫn riêng của action; giống hệt nhau giữa các lần gọi."""
+    base = BASE_SYSTEM.get(lang, BASE_SYSTEM["en"])
+    task = profile.get("system", {})
+    if isinstance(task, dict):
+        task = task.get(lang) or task.get("en", "")
+    return f"{base}\n{task}".strip() if task else base
+
+
+def build_messages(profile: Dict[str, Any], text: str, lang: str, prompt: str = "") -> List[Dict[str, str]]:
+    """Dựng messages [system, user] theo profile."""
+    user = profile.get("template", "{text}").format(text=text, prompt=prompt.strip())
+    return [
+        {"role": "system", "content": system_prompt(profile, lang)},
+        {"role": "user", "content": user},
+    ]
+
+
+FOLLOWUP_NOTE = {
+    "vi": "Áp dụng cho nội dung đã gửi ở trên.",
+    "en": "Apply this to the content given above.",
+}
+
+
+def followup_prompt(profile: Dict[str, Any], lang: str, prompt: str = "") -> str:
+    """Chỉ dẫn cho action nối tiếp trên văn bản đã có trong context (không gửi lại văn bản)."""
+    task = prompt.strip() if "{prompt}" in profile.get("template", "") else ""
+    if not task:
+        task = profile.get("system", {})
+        if isinstance(task, dict):
+            task = task.get(lang) or task.get("en", "")
+    note = FOLLOWUP_NOTE.get(lang, FOLLOWUP_NOTE["en"])
+    return f"{task}\n{note}".strip()
+
+
+def build_shared_prefix_messages(profile: Dict[str, Any], text: str, lang: str,
+                                 prompt: str = "") -> List[Dict[str, str]]:
+    """Messages cho nhiều action chạy trên cùng một văn bản (popup "Chạy tất cả"):
+    system chỉ có BASE_SYSTEM, user là văn bản rồi mới tới chỉ dẫn của action.
+    Mọi action có chung prefix (system + văn bản) nên server giữ KV-cache chỉ
+    phải evaluate văn bản một lần."""
+    base = BASE_SYSTEM.get(lang, BASE_SYSTEM["en"])
+    return [
+        {"role": "system", "content": base},
+        {"role": "user", "content": f"{text}\n\n---\n{followup_prompt(profile, lang, prompt)}"},
+    ]
+
+
+def apply_profile(provider_cfg: Dict[str, Any], profile: Dict[str, Any], text: str = "") -> Dict[str, Any]:
+    """Ghi đè tham số sinh của provider bằng tham số của profile."""
+    cfg = provider_cfg.copy()
+    for key in GENERATION_KEYS:
+        if profile.get(key) is not None:
+            cfg[key] = profile[key]
+    # Giới hạn output theo độ dài input (ước lượng ~4 ký tự / token)
+    ratio = profile.get("max_tokens_ratio")
+    if ratio and text:
+        cfg["max_tokens"] = max(64, min(cfg["max_tokens"], int(len(text) / 4 * ratio) + 32))
+    return cfg
+
+
+def check_latency(profile: Dict[str, Any], elapsed_ms: float, first_token_ms: Optional[float] = None):
+    """Ghi log cảnh báo khi action vượt latency target của profile."""
+    targets = profile.get("latency") or {}
+    total = targets.get("total_ms")
+    first = targets.get("first_token_ms")
+    if total and elapsed_ms > total:
+        logging.warning(f"[Action:{profile.get('name')}] total {elapsed_ms:.0f}ms > target {total}ms")
+    if first and first_token_ms is not None and first_token_ms > first:
+        logging.warning(f"[Action:{profile.get('name')}] first token {first_token_ms:.0f}ms > target {first}ms")
@@ -3,51 +3,57 @@ import sys, json, time, datetime
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 import threading
-
-from PySide6 import QtWidgets, QtGui, QtCore
-from pynput import mouse, keyboard
-import win32clipboard as wcb
-import win32con
-import requests
 import logging
 
+from startup_report import StartupReport
+
+# Đo từ đây: import + các giai đoạn khởi động được ghi vào startup_report.json
+STARTUP = StartupReport()
+
 # Setup logging
 logging.basicConfig(filename="debug.log", level=logging.DEBUG, format="%(asctime)s - %(message)s")
 
-# MCP (optional, enabled via config)
-# MCP (optional, enabled via config)
-import asyncio
-# from contextlib import AsyncExitStack
-# from mcp import ClientSession, StdioServerParameters
-# from mcp.client.stdio import stdio_client
-
-from mcp_manager import MCPManager
-from ui_components import PopupPanel, MCPPanel
-from chat_window import ChatWindow
+from action_profiles import action_overrides
+from provider_registry import PROVIDERS, load_plugins, provider_info
 
 CONFIG_PATH = Path("config.json")
 
 DEFAULT_CONFIG = {
-    "provider": "ollama",   # "ollama" | "lmstudio"
-    "ollama": {
-        "endpoint": "http://127.0.0.1:11434",
-        "model": "gemma:2b",
-        "temperature": 0.2,
-        "max_tokens": 1024
-    },
-    "lmstudio": {
-        "endpoint": "http://127.0.0.1:1234/v1",
-        "model": "Meta-Llama-3.1-8B-Instruct-Q4_K_M",
-        "temperature": 0.2,
-        "max_tokens": 1024
-    },
+    "provider": "ollama",   # tên trong provider_registry: "ollama" | "lmstudio" | "llamacpp"
+    # Config mặc định của từng provider (endpoint, model, ...)
+    **{name: dict(info["defaults"]) for name, info in PROVIDERS.items()},
+    # Module Python đăng ký thêm provider (provider_registry.register_provider)
+    "provider_plugins": [],
     "ui": {
         "summary_language": "vi",  # "vi" or "en"
         "trigger": {"modifier": "win", "button": "right"},
         "hotkey": "<alt>+q"
     },
+    # Per-action overrides of action_profiles.DEFAULT_ACTIONS (prompt, max_tokens, stop,
+    # temperature, num_ctx, latency); only changed keys are stored
+    "actions": {},
+    # Concurrency of model calls + result cache shared by tray, daemon and chat.
+    # max_concurrency "auto": one worker per provider slot (llama.cpp --parallel), else 1
+    # context_reuse: follow-up actions on the same text reuse Ollama context tokens
+    # semantic_index: embed past summaries/chat/MCP results for retrieval (needs NumPy)
+    "engine": {"max_concurrency": "auto", "cache": True, "context_reuse": True, "semantic_index": True},
+    # Popup "🧩 Chạy tất cả": actions run together on the selected text, one result tab each
+    "fanout": {"actions": ["summary", "explain", "translate"]},
+    # Chat (window and daemon) sends the last history_messages + retrieval_k snippets from the semantic index
+    "chat": {"history_messages": 8, "retrieval_k": 4},
+    # Local HTTP API for the Chrome extension / other clients (python app.py --daemon)
+    "daemon": {"enabled": False, "host": "127.0.0.1", "port": 8765},
+    # Pre-summarize new/changed files while the user is idle (folders default to MCP ROOT_PATH)
+    "prefetch": {"enabled": False, "folders": [], "idle_seconds": 120, "max_cpu_percent": 50,
+                 "poll_seconds": 30},
+    # Tray menu "🩺 Profiling": stack sampling of all threads + UI stall detection (profiles/)
+    "profiling": {"interval_ms": 5, "stall_ms": 200, "top_n": 25, "dir": "profiles"},
+    # Record provider traffic (traces/*.jsonl.gz) for offline replay: python traffic_trace.py replay <file>
+    "trace": {"record": False, "dir": "traces"},
     "mcp": {
         "enabled": True,
+        # MCP results longer than this are reduced extractively before use
+        "max_result_tokens": 1500,
         "servers": [
             {
                 "name": "filesystem",
@@ -59,215 +65,46 @@ DEFAULT_CONFIG = {
     }
 }
 
-# -------- Providers ----------
-
-class ProviderBase:
-    def summarize(self, text: str, cfg: Dict[str, Any]) -> str:
-        raise NotImplementedError()
-    
-    def chat(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]) -> str:
-        """Chat with LLM using message history.
-        messages = [{"role": "system"|"user"|"assistant", "content": "..."}]
-        """
-        raise NotImplementedError()
-    
-    def chat_stream(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]):
-        """Stream chat response from LLM.
-        Yields: {"type": "thinking"|"content", "text": "..."}
-        """
-        raise NotImplementedError()
-
-class OllamaProvider(ProviderBase):
-    def summarize(self, text: str, cfg: Dict[str, Any]) -> str:
-        endpoint = cfg["endpoint"].rstrip("/")
-        model = cfg["model"]
-        temperature = cfg.get("temperature", 0.2)
-        max_tokens = cfg.get("max_tokens", 1024)
-        lang = cfg.get("summary_language", "vi")
-        if lang == "vi":
-            sys_prompt = (
-                "Bạn là trợ lý tóm tắt. Hãy tóm tắt ngắn gọn bằng tiếng Việt, "
-                "ưu tiên bullet points, giữ từ khóa quan trọng, nêu hành động chính."
-            )
-        else:
-            sys_prompt = (
-                "You are a summarization assistant. Summarize concisely in English, "
-                "prefer bullet points, preserve key terms and main actions."
-            )
-        prompt = f"{sys_prompt}\n\nNội dung cần tóm tắt:\n{text}\n\nTóm tắt:"
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": temperature,
-                "num_predict": max_tokens
-            }
-        }
-        url = f"{endpoint}/api/generate"
-        r = requests.post(url, json=payload, timeout=120)
-        r.raise_for_status()
-        data = r.json()
-        return data.get("response", "").strip()
-    
-    def chat(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]) -> str:
-        endpoint = cfg["endpoint"].rstrip("/")
-        model = cfg["model"]
-        temperature = cfg.get("temperature", 0.2)
-        max_tokens = cfg.get("max_tokens", 1024)
-        
-        payload = {
-            "model": model,
-            "messages": messages,
-            "stream": False,
-            "options": {
-                "temperature": temperature,
-                "num_predict": max_tokens
-            }
-        }
-        url = f"{endpoint}/api/chat"
-        r = requests.post(url, json=payload, timeout=120)
-        r.raise_for_status()
-        data = r.json()
-        return data.get("message", {}).get("content", "").strip()
-    
-    def chat_stream(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]):
-        endpoint = cfg["endpoint"].rstrip("/")
-        model = cfg["model"]
-        temperature = cfg.get("temperature", 0.2)
-        max_tokens = cfg.get("max_tokens", 1024)
-        
-        payload = {
-            "model": model,
-            "messages": messages,
-            "stream": True,
-            "options": {
-                "temperature": temperature,
-                "num_predict": max_tokens
-            }
-        }
-        url = f"{endpoint}/api/chat"
-        
-        with requests.post(url, json=payload, stream=True, timeout=120) as r:
-            r.raise_for_status()
-            for line in r.iter_lines():
-                if line:
-                    data = json.loads(line)
-                    if "message" in data:
-                        content = data["message"].get("content", "")
-                        if content:
-                            yield {"type": "content", "text": content}
-
-class LMStudioProvider(ProviderBase):
-    def summarize(self, text: str, cfg: Dict[str, Any]) -> str:
-        base = cfg["endpoint"].rstrip("/")
-        model = cfg["model"]
-        temperature = cfg.get("temperature", 0.2)
-        max_tokens = cfg.get("max_tokens", 1024)
-        lang = cfg.get("summary_language", "vi")
-        if lang == "vi":
-            sys_prompt = (
-                "Bạn là trợ lý tóm tắt. Tóm tắt ngắn gọn bằng tiếng Việt, "
-                "dùng bullet points, giữ từ khóa và điểm chính."
-            )
-        else:
-            sys_prompt = (
-                "You are a summarization assistant. Summarize concisely in English, "
-                "use bullet points, preserve key terms and key points."
-            )
-        messages = [
-            {"role": "system", "content": sys_prompt},
-            {"role": "user", "content": text}
-        ]
-        url = f"{base}/chat/completions"
-        payload = {
-            "model": model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "stream": False,
-        }
-        r = requests.post(url, json=payload, timeout=120)
-        r.raise_for_status()
-        data = r.json()
-        try:
-            return data["choices"][0]["message"]["content"].strip()
-        except Exception:
-            return json.dumps(data, ensure_ascii=False)
-    
-    def chat(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]) -> str:
-        base = cfg["endpoint"].rstrip("/")
-        model = cfg["model"]
-        temperature = cfg.get("temperature", 0.2)
-        max_tokens = cfg.get("max_tokens", 1024)
-        
-        url = f"{base}/chat/completions"
-        payload = {
-            "model": model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "stream": False,
-        }
-        r = requests.post(url, json=payload, timeout=120)
-        r.raise_for_status()
-        data = r.json()
-        try:
-            return data["choices"][0]["message"]["content"].strip()
-        except Exception:
-            return json.dumps(data, ensure_ascii=False)
-    
-    def chat_stream(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]):
-        base = cfg["endpoint"].rstrip("/")
-        model = cfg["model"]
-        temperature = cfg.get("temperature", 0.2)
-        max_tokens = cfg.get("max_tokens", 1024)
-        
-        url = f"{base}/chat/completions"
-        payload = {
-            "model": model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "stream": True,
-        }
-        
-        with requests.post(url, json=payload, stream=True, timeout=120) as r:
-            r.raise_for_status()
-            for line in r.iter_lines():
-                if line:
-                    line_str = line.decode('utf-8')
-                    if line_str.startswith('data: '):
-                        data_str = line_str[6:]
-                        if data_str == '[DONE]':
-                            break
-                        try:
-                            data = json.loads(data_str)
-                            delta = data.get("choices", [{}])[0].get("delta", {})
-                            content = delta.get("content", "")
-                            if content:
-                                # Parse thinking tokens for Qwen3
-                                if "<think>" in content or "</think>" in content:
-                                    yield {"type": "thinking", "text": content}
-                                else:
-                                    yield {"type": "content", "text": content}
-                        except json.JSONDecodeError:
-                            continue
-
-# -------- Utilities ----------
-
 def load_config() -> Dict[str, Any]:
     if CONFIG_PATH.exists():
         try:
-            return json.loads(CONFIG_PATH.read_text(encoding="utf-8"))
+            cfg = json.loads(CONFIG_PATH.read_text(encoding="utf-8"))
         except Exception:
-            pass
-    CONFIG_PATH.write_text(json.dumps(DEFAULT_CONFIG, indent=2, ensure_ascii=False), encoding="utf-8")
-    return DEFAULT_CONFIG
+            cfg = None
+        if cfg is not None:
+            # Config cũ chứa cả profile mặc định: chỉ giữ khóa người dùng đã đổi
+            actions = action_overrides(cfg.get("actions"))
+            if actions != cfg.get("actions", {}):
+                cfg["actions"] = actions
+                save_config(cfg)
+            return cfg
+    cfg = json.loads(json.dumps(DEFAULT_CONFIG))
+    save_config(cfg)
+    return cfg
 
 def save_config(cfg: Dict[str, Any]):
+    cfg = {**cfg, "actions": action_overrides(cfg.get("actions"))}
     CONFIG_PATH.write_text(json.dumps(cfg, indent=2, ensure_ascii=False), encoding="utf-8")
 
+# Headless daemon (`python app.py --daemon`): chỉ cần config + engine, không
+# import Qt / input hooks (máy chủ không có GUI hoặc không phải Windows)
+if __name__ == "__main__" and "--daemon" in sys.argv:
+    from daemon import run_daemon
+    run_daemon(load_config())
+    sys.exit(0)
+
+# Chỉ import những gì cần để hiện tray icon và bắt input. Engine (requests,
+# sqlite, NumPy), MCP SDK, ChatWindow, daemon... được import khi cần, xem
+# TrayApp._start_services.
+with STARTUP.stage("import:qt"):
+    from PySide6 import QtWidgets, QtGui, QtCore
+with STARTUP.stage("import:input"):
+    from pynput import mouse, keyboard
+    import win32clipboard as wcb
+    import win32con
+
+# -------- Utilities ----------
+
 def get_clipboard_text() -> Optional[str]:
     try:
         wcb.OpenClipboard()
@@ -371,30 +208,69 @@ def simulate_double_click():
 
 class TrayApp(QtWidgets.QSystemTrayIcon):
     show_popup_signal = QtCore.Signal(str)
+    future_done_signal = QtCore.Signal(object, object)  # callback, Future
 
     def __init__(self, app: QtWidgets.QApplication):
         icon = app.style().standardIcon(QtWidgets.QStyle.SP_ComputerIcon)
         super().__init__(icon)
         self.app = app
         self.menu = QtWidgets.QMenu()
-        self.cfg = load_config()
-
-        self.popup = PopupPanel()
-        self.provider = self._make_provider()
+        with STARTUP.stage("config"):
+            self.cfg = load_config()
+            load_plugins(self.cfg.get("provider_plugins", []))
+
+        # Khởi động theo giai đoạn: tray icon + input hook trước; engine, MCP,
+        # daemon, prefetch dựng ở thread nền (_start_services); popup và chat
+        # window dựng khi dùng lần đầu.
+        self._engine = None
+        self._engine_error: Optional[Exception] = None
+        self._engine_ready = threading.Event()
+        self._popup = None
         self.chat_window = None
+        self.fanout_window = None
+        self.mcp = None
+        self.mcp_context = ""
+        self.daemon = None
+        self.prefetcher = None
+        self.profile_session = None
+
+        with STARTUP.stage("menu"):
+            self._build_menu()
+        self.activated.connect(self._on_tray_activated)
+
+        # Start Input Listener
+        with STARTUP.stage("input_listener"):
+            self.input_listener = InputListener(self.cfg)
+            self.input_listener.trigger.connect(self._on_trigger)
+            self.input_listener.start()
+        
+        self.show_popup_signal.connect(self._show_popup_safe)
+        self.future_done_signal.connect(self._on_future_done)
+        self.app.aboutToQuit.connect(self._on_exit)
+
+        self.setContextMenu(self.menu)
+        self._update_tooltip()
+        self.show()
+        STARTUP.mark("tray_visible")
+
+        # Giai đoạn 2 chạy khi event loop đã chạy (tray đã vẽ xong)
+        QtCore.QTimer.singleShot(0, lambda: threading.Thread(
+            target=self._start_services, name="startup", daemon=True).start())
 
+    def _build_menu(self):
         # Unified Menu (cả left/right click)
         # Chat
         actChat = self.menu.addAction("💬 Mở Chat")
         self.menu.addSeparator()
         
-        # Provider Submenu
+        # Provider Submenu (một mục cho mỗi provider trong provider_registry)
         menuProvider = self.menu.addMenu("🔄 Provider")
-        self.actProvOllama = menuProvider.addAction("🦙 Ollama")
-        self.actProvOllama.setCheckable(True)
-        self.actProvLM = menuProvider.addAction("🏠 LM Studio")
-        self.actProvLM.setCheckable(True)
-        # Future: self.actProvOpenAI = menuProvider.addAction("🤖 OpenAI")
+        self.provider_actions: Dict[str, QtGui.QAction] = {}
+        for name, info in PROVIDERS.items():
+            act = menuProvider.addAction(info["label"])
+            act.setCheckable(True)
+            act.triggered.connect(lambda _checked=False, n=name: self._set_provider(n))
+            self.provider_actions[name] = act
         self._update_provider_checkmarks()
         
         self.menu.addSeparator()
@@ -404,64 +280,121 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
         actMcpTools = self.menu.addAction("📋 Liệt kê MCP Tools")
         self.menu.addSeparator()
         
+        # Profiling theo yêu cầu (đính kèm vào bug report)
+        self.actProfile = self.menu.addAction("🩺 Bắt đầu profiling")
+        
         # Settings
         actCfg = self.menu.addAction("⚙️ Cấu hình…")
         actQuit = self.menu.addAction("❌ Thoát")
 
         # Connect signals
         actChat.triggered.connect(self._open_chat_window)
-        self.actProvOllama.triggered.connect(lambda: self._set_provider("ollama"))
-        self.actProvLM.triggered.connect(lambda: self._set_provider("lmstudio"))
         actCfg.triggered.connect(self._open_config_dialog)
         actQuit.triggered.connect(lambda: self.app.quit())
         actMcpPanel.triggered.connect(self._open_mcp_panel)
         actMcpTools.triggered.connect(self._show_mcp_tools)
+        self.actProfile.triggered.connect(self._toggle_profiling)
+
+    def _start_services(self):
+        """Giai đoạn 2 (thread nền): engine, MCP, daemon, prefetch; rồi ghi startup report."""
+        try:
+            with STARTUP.stage("engine"):
+                from engine import SummarizerEngine
+                self._engine = SummarizerEngine(self.cfg)
+        except Exception as e:
+            logging.error(f"[Startup] Engine failed: {e}", exc_info=True)
+            self._engine_error = e
+        finally:
+            self._engine_ready.set()
 
-        self.activated.connect(self._on_tray_activated)
-        
         # MCP init
-        self.mcp: Optional[MCPManager] = None
         if self.cfg.get("mcp", {}).get("enabled"):
-            self.mcp = MCPManager(self.cfg["mcp"].get("servers", []))
-            self.mcp.start()
-        self.mcp_context = ""
-
-        # Start Input Listener
-        self.input_listener = InputListener(self.cfg)
-        self.input_listener.trigger.connect(self._on_trigger)
-        self.input_listener.start()
-        
-        self.show_popup_signal.connect(self._show_popup_safe)
-        self.app.aboutToQuit.connect(self._on_exit)
-
-        self.setContextMenu(self.menu)
-        self._update_tooltip()
-        self.show()
+            try:
+                with STARTUP.stage("mcp"):
+                    from mcp_manager import MCPManager
+                    self.mcp = MCPManager(self.cfg["mcp"].get("servers", []))
+                    self.mcp.start()
+                if self.chat_window:
+                    self.chat_window.mcp = self.mcp
+            except Exception as e:
+                logging.error(f"[Startup] MCP failed: {e}", exc_info=True)
+
+        if self._engine:
+            # Local HTTP daemon (shares engine: scheduler, cache, chat history)
+            dcfg = self.cfg.get("daemon", {})
+            if dcfg.get("enabled"):
+                with STARTUP.stage("daemon"):
+                    from daemon import DaemonServer
+                    self.daemon = DaemonServer(self._engine, dcfg.get("host", "127.0.0.1"), dcfg.get("port", 8765))
+                    self.daemon.start_in_thread()
+
+            # Background pre-summarization of watched folders (low priority, idle only)
+            if self.cfg.get("prefetch", {}).get("enabled"):
+                with STARTUP.stage("prefetch"):
+                    from idle_prefetch import IdlePrefetcher
+                    self.prefetcher = IdlePrefetcher(self._engine, self.cfg)
+                    self.prefetcher.start()
+
+        # Nạp trước module của popup để lần trigger đầu không phải chờ import
+        with STARTUP.stage("import:ui"):
+            import ui_components  # noqa: F401
+
+        STARTUP.mark("services_ready")
+        STARTUP.write()
+
+    @property
+    def engine(self):
+        """Engine dựng ở thread nền; lần dùng đầu ngay sau khởi động có thể phải chờ."""
+        if not self._engine_ready.is_set():
+            QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+            try:
+                self._engine_ready.wait()
+            finally:
+                QtWidgets.QApplication.restoreOverrideCursor()
+        if self._engine is None:
+            raise RuntimeError(f"Engine chưa khởi tạo được: {self._engine_error}")
+        return self._engine
+
+    @property
+    def popup(self):
+        if self._popup is None:
+            from ui_components import PopupPanel
+            self._popup = PopupPanel()
+        return self._popup
 
     def _on_tray_activated(self, reason):
         if reason == QtWidgets.QSystemTrayIcon.Trigger:
             self.menu.popup(QtGui.QCursor.pos())
 
     def _on_exit(self):
+        if self.profile_session:
+            self.profile_session.stop()
         if self.input_listener:
             self.input_listener.stop()
+        if self.daemon:
+            self.daemon.stop()
+        if self.prefetcher:
+            self.prefetcher.stop()
+        if self._engine:
+            self._engine.shutdown()
 
     def _set_provider(self, name: str):
-        self.cfg["provider"] = name
+        self.engine.set_provider(name)
         save_config(self.cfg)
-        self.provider = self._make_provider()
+        if self.chat_window:
+            self.chat_window.provider = self.engine.provider
         self._update_provider_checkmarks()
         self._update_tooltip()
-        self.showMessage("Provider Changed", f"Đang dùng: {name.title()}", 
+        self.showMessage("Provider Changed", f"Đang dùng: {provider_info(name)['label']}", 
                         QtWidgets.QSystemTrayIcon.Information, 2000)
     
     def _update_provider_checkmarks(self):
         current = self.cfg["provider"]
-        self.actProvOllama.setChecked(current == "ollama")
-        self.actProvLM.setChecked(current == "lmstudio")
+        for name, act in self.provider_actions.items():
+            act.setChecked(name == current)
     
     def _update_tooltip(self):
-        provider = self.cfg["provider"].title()
+        provider = provider_info(self.cfg["provider"])["label"]
         self.setToolTip(f"AI Summarizer\nProvider: {provider}\nShift+Right Click để tóm tắt")
     
     def _open_chat_window(self):
@@ -469,10 +402,14 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
         try:
             if not self.chat_window:
                 logging.info("Instantiating ChatWindow...")
+                from chat_window import ChatWindow
                 self.chat_window = ChatWindow(
-                    provider=self.provider,
+                    provider=self.engine.provider,
                     mcp_manager=self.mcp,
-                    config=self.cfg
+                    config=self.cfg,
+                    store=self.engine.conversations,
+                    memory=self.engine.memory,
+                    activity=self.engine.interactive
                 )
                 logging.info("ChatWindow instantiated.")
             
@@ -485,11 +422,6 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
             logging.error(f"Failed to open chat window: {e}", exc_info=True)
             QtWidgets.QMessageBox.critical(None, "Error", f"Failed to open chat window:\n{e}")
 
-    def _make_provider(self) -> ProviderBase:
-        if self.cfg["provider"] == "lmstudio":
-            return LMStudioProvider()
-        return OllamaProvider()
-
     def _on_trigger(self):
         """
         Called when Shift+RightClick is detected.
@@ -502,7 +434,7 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
         # Since we need to sleep/wait, using a QTimer sequence or a background worker is better.
         # But for simplicity, we can use a small delay loop here, BUT we must be careful not to freeze UI too long.
         # Better: Use a separate thread for the copy sequence to keep UI responsive.
-        threading.Thread(target=self._smart_copy_sequence, daemon=True).start()
+        threading.Thread(target=self._smart_copy_sequence, name="smart-copy", daemon=True).start()
 
     def _smart_copy_sequence(self):
         # 1. Clear clipboard to detect new copy
@@ -547,53 +479,118 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
             time.sleep(0.05)
         return None
 
+    def _when_done(self, fut, callback):
+        """Gọi callback(fut) trên GUI thread khi future của engine xong."""
+        fut.add_done_callback(lambda f: self.future_done_signal.emit(callback, f))
+
+    @QtCore.Slot(object, object)
+    def _on_future_done(self, callback, fut):
+        callback(fut)
+
     def _handle_action(self, action: str, text: str):
         # Lưu văn bản gốc cho action translate
         original_text = text
-        
-        # Bơm ngữ cảnh MCP nếu có
-        if self.mcp_context:
-            text = (text + "\n\n---\nNgữ cảnh MCP:\n" + self.mcp_context).strip()
-            self.mcp_context = ""
-
-        cfg = self.cfg[self.cfg["provider"]].copy()
-        cfg["summary_language"] = self.cfg["ui"].get("summary_language", "vi")
-
-        if action == "summary":
-            result = self._call_provider(lambda: self.provider.summarize(text, cfg))
-        elif action == "explain":
-            t2 = f"Hãy giải thích dễ hiểu (tiếng Việt, ngắn gọn, ví dụ thực tế):\n\n{text}" if cfg["summary_language"] == "vi" else f"Explain simply (English, concise, practical examples):\n\n{text}"
-            result = self._call_provider(lambda: self.provider.summarize(t2, cfg))
-        elif action == "translate":
-            t2 = f"Dịch nội dung sau sang tiếng Việt, giữ thuật ngữ:\n\n{text}" if cfg["summary_language"] == "vi" else f"Translate the following to English, preserve terms:\n\n{text}"
-            translation = self._call_provider(lambda: self.provider.summarize(t2, cfg))
-            # Format kết quả: Văn bản gốc + Bản dịch
-            separator = "=" * 60
-            result = f"📄 VĂN BẢN GỐC:\n{separator}\n{original_text}\n\n🌐 BẢN DỊCH:\n{separator}\n{translation}"
-        elif action == "rewrite":
-            t2 = f"Hãy viết lại văn bản sau cho rõ ràng hơn, mạch lạc hơn, chuyên nghiệp hơn nhưng giữ nguyên ý nghĩa:\n\n{text}" if cfg["summary_language"] == "vi" else f"Rewrite the following text to be clearer, more coherent, and more professional while preserving the original meaning:\n\n{text}"
-            rewritten = self._call_provider(lambda: self.provider.summarize(t2, cfg))
-            # Format kết quả: Văn bản gốc + Bản viết lại
-            separator = "=" * 60
-            result = f"📄 VĂN BẢN GỐC:\n{separator}\n{original_text}\n\n✍️ BẢN VIẾT LẠI:\n{separator}\n{rewritten}"
-        else:
+
+        # Ngữ cảnh MCP nếu có: rút gọn và ghép vào văn bản trong worker của engine
+        context, self.mcp_context = self.mcp_context, ""
+
+        if action == "fanout":
+            self._run_fanout(text, context)
+            return
+
+        prompt = ""
+        if action not in ("summary", "explain", "translate", "rewrite"):
             prompt, ok = QtWidgets.QInputDialog.getMultiLineText(None, "Prompt tùy biến", "Nhập prompt (ứng dụng sẽ chèn nội dung đã chọn phía dưới):", "Hãy tóm tắt ngắn gọn, dùng bullet, giữ từ khóa…")
             if not ok: return
-            t2 = f"{prompt.strip()}\n\nNội dung:\n{text}"
-            result = self._call_provider(lambda: self.provider.summarize(t2, cfg))
+            action = "custom"
+
+        # Không chờ kết quả trên GUI thread: cửa sổ kết quả mở khi job xong
+        def show(fut):
+            res = self._action_result(fut)
+            result = self._format_result(action, original_text, res)
+            notes = []
+            if res.get("reduced"):
+                from text_reducer import retained_note
+                notes.append(retained_note(res["reduced"]))
+            regenerate = None
+            if res.get("similar"):
+                notes.append("♻️ Dùng lại kết quả từ văn bản tương tự đã xử lý trước đó.")
+                # Kết quả lấy từ một lần chọn gần giống -> cho phép chạy lại với văn bản hiện tại
+                def regenerate(done):
+                    fresh = self.engine.submit_action(action, text, prompt, use_cache=False, context=context)
+                    self._when_done(fresh, lambda f: done(self._format_result(action, original_text,
+                                                                              self._action_result(f))))
+            self._copy_to_clipboard(result)
+            self._show_result(result, regenerate, notes)
 
-        self._show_result(result)
-        self._copy_to_clipboard(result)
+        try:
+            fut = self.engine.submit_action(action, text, prompt, context=context)
+        except Exception as e:
+            self._show_result(f"❌ Lỗi gọi model: {e}")
+            return
+        self._when_done(fut, show)
+
+    def _run_fanout(self, text: str, context: str = ""):
+        """Chạy các action trong cfg["fanout"] cùng lúc, kết quả stream vào một cửa sổ tab."""
+        from fanout_window import FanoutRun, FanoutWindow
+        actions = self.cfg.get("fanout", {}).get("actions") or ["summary", "explain", "translate"]
+        if self.fanout_window:
+            self.fanout_window.close()
+        run = FanoutRun(self.engine, actions, text, context)
+        w = FanoutWindow(run, self.engine.scheduler.max_concurrency)
+
+        def open_chat_with_context(content: str):
+            self._open_chat_window()
+            if self.chat_window:
+                self.chat_window.add_context(content)
 
-    def _call_provider(self, fn):
+        w.chatRequested.connect(open_chat_with_context)
+        def forget_window():
+            # Cửa sổ cũ bị xóa sau khi cửa sổ mới đã được gán
+            if self.fanout_window is w:
+                self.fanout_window = None
+
+        w.destroyed.connect(forget_window)
+        self.fanout_window = w
+        w.show(); w.activateWindow(); w.raise_()
+        run.start()
+
+    def _format_result(self, action: str, original_text: str, res: Dict[str, Any]) -> str:
+        output = res["text"]
+        separator = "=" * 60
+        if action == "translate":
+            # Format kết quả: Văn bản gốc + Bản dịch (+ thống kê bộ nhớ dịch)
+            tm = ""
+            if res.get("tm_segments"):
+                tm = f" ({res['tm_hits']}/{res['tm_segments']} câu từ bộ nhớ dịch, tiết kiệm ~{res['tm_saved_tokens']} token)"
+            return f"📄 VĂN BẢN GỐC:\n{separator}\n{original_text}\n\n🌐 BẢN DỊCH{tm}:\n{separator}\n{output}"
+        if action == "rewrite":
+            # Format kết quả: Văn bản gốc + Bản viết lại
+            return f"📄 VĂN BẢN GỐC:\n{separator}\n{original_text}\n\n✍️ BẢN VIẾT LẠI:\n{separator}\n{output}"
+        return output
+
+    def _action_result(self, fut) -> Dict[str, Any]:
         try:
-            return fn()
+            return fut.result()
         except Exception as e:
-            return f"❌ Lỗi gọi model: {e}"
+            return {"text": f"❌ Lỗi gọi model: {e}"}
 
-    def _show_result(self, content: str):
+    def _show_result(self, content: str, regenerate=None, notes: Optional[List[str]] = None):
+        """notes: các dòng thông báo phía trên kết quả (văn bản đã rút gọn, dùng lại
+        kết quả tương tự...). regenerate(done): chạy lại và gọi done(kết quả mới)
+        trên GUI thread khi xong (nút tạo lại)."""
         w = QtWidgets.QDialog(); w.setWindowTitle("Kết quả AI")
         lay = QtWidgets.QVBoxLayout(w)
+        if notes or regenerate:
+            notice = QtWidgets.QWidget()
+            nlay = QtWidgets.QHBoxLayout(notice); nlay.setContentsMargins(0, 0, 0, 0)
+            lbl = QtWidgets.QLabel("\n".join(notes or []))
+            lbl.setStyleSheet("color: #856404;")
+            nlay.addWidget(lbl); nlay.addStretch(1)
+            if regenerate:
+                btnRegen = QtWidgets.QPushButton("🔄 Tạo lại")
+                nlay.addWidget(btnRegen)
+            lay.addWidget(notice)
         txt = QtWidgets.QPlainTextEdit(); txt.setPlainText(content); lay.addWidget(txt)
         
         btns = QtWidgets.QHBoxLayout()
@@ -612,13 +609,30 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
             self._open_chat_window()
             # Add context to chat
             if self.chat_window:
-                self.chat_window.add_context(content)
+                self.chat_window.add_context(txt.toPlainText())
             w.accept()
             
         def open_mcp_from_result():
             self._open_mcp_panel()
             # w.accept() # Keep result open or close? User might want to use tool then check result again. Keep open.
 
+        if regenerate:
+            def regenerated(fresh: str):
+                QtWidgets.QApplication.restoreOverrideCursor()
+                if not w.isVisible():
+                    return
+                txt.setPlainText(fresh)
+                self._copy_to_clipboard(fresh)
+                # Bỏ thông báo "dùng lại", giữ các thông báo khác
+                lbl.setText("\n".join(n for n in notes or [] if not n.startswith("♻️")))
+                btnRegen.hide()
+
+            def do_regenerate():
+                btnRegen.setEnabled(False)
+                QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+                regenerate(regenerated)
+            btnRegen.clicked.connect(do_regenerate)
+
         btnChat.clicked.connect(open_chat_with_context)
         btnMCP.clicked.connect(open_mcp_from_result)
         btnCopy.clicked.connect(lambda: self._copy_to_clipboard(txt.toPlainText()))
@@ -639,6 +653,7 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
         if not self.mcp:
             QtWidgets.QMessageBox.warning(None, "MCP", "MCP chưa bật hoặc chưa có server.")
             return
+        from ui_components import MCPPanel
         dlg = MCPPanel(self.mcp)
         if dlg.exec() == QtWidgets.QDialog.Accepted:
             self.mcp_context = dlg.extra_context or ""
@@ -653,6 +668,37 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
             items.append(f"{name}: {', '.join(tools)}")
         QtWidgets.QMessageBox.information(None, "MCP Tools", "\n".join(items) or "Không có tool")
 
+    def _toggle_profiling(self):
+        from profiler import ProfileSession
+        if self.profile_session is None:
+            self.profile_session = ProfileSession(self.cfg.get("profiling", {}))
+            self.profile_session.start()
+            self.actProfile.setText("⏹ Dừng profiling")
+            self.showMessage("Profiling", "Đang ghi profile. Thực hiện lại thao tác bị chậm rồi chọn Dừng profiling.",
+                             QtWidgets.QSystemTrayIcon.Information, 3000)
+            return
+        session, self.profile_session = self.profile_session, None
+        self.actProfile.setText("🩺 Bắt đầu profiling")
+        try:
+            path, summary = session.stop()
+        except Exception as e:
+            logging.error(f"[Profiler] Failed to write profile: {e}", exc_info=True)
+            QtWidgets.QMessageBox.warning(None, "Profiling", f"Không ghi được profile:\n{e}")
+            return
+        self._show_profile(path, summary)
+
+    def _show_profile(self, path: Path, summary: str):
+        w = QtWidgets.QDialog(); w.setWindowTitle(f"Profile - {path.name}")
+        lay = QtWidgets.QVBoxLayout(w)
+        lay.addWidget(QtWidgets.QLabel(f"Đính kèm {path.name} và {path.with_suffix('.collapsed').name} vào bug report:"))
+        txt = QtWidgets.QPlainTextEdit(); txt.setReadOnly(True); txt.setPlainText(summary)
+        txt.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont)); lay.addWidget(txt)
+        btns = QtWidgets.QHBoxLayout(); btnOpen = QtWidgets.QPushButton("📂 Mở thư mục"); btnClose = QtWidgets.QPushButton("Đóng")
+        btns.addWidget(btnOpen); btns.addStretch(1); btns.addWidget(btnClose); lay.addLayout(btns)
+        btnOpen.clicked.connect(lambda: QtGui.QDesktopServices.openUrl(QtCore.QUrl.fromLocalFile(str(path.parent.resolve()))))
+        btnClose.clicked.connect(w.accept)
+        w.resize(900, 600); w.exec()
+
     def _open_config_dialog(self):
         w = QtWidgets.QDialog(); w.setWindowTitle("Cấu hình")
         lay = QtWidgets.QVBoxLayout(w)
@@ -666,7 +712,11 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
     def _save_cfg_from_text(self, content: str, dlg: QtWidgets.QDialog):
         try:
             cfg = json.loads(content)
-            save_config(cfg); self.cfg = cfg; dlg.accept()
+            save_config(cfg); self.cfg = cfg
+            self.engine.cfg = cfg; self.engine.set_provider(cfg["provider"])
+            if self.chat_window:
+                self.chat_window.cfg = cfg; self.chat_window.provider = self.engine.provider
+            dlg.accept()
         except Exception as e:
             QtWidgets.QMessageBox.warning(dlg, "JSON lỗi", f"Không parse được config: {e}")
 
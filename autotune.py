@@ -0,0 +1,294 @@
+# autotune.py
+"""
+Tự chỉnh tham số inference theo phần cứng (không import Qt/pynput/win32).
+
+    python autotune.py                    # provider + model trong config.json
+    python autotune.py --provider ollama --model qwen3:4b --quick
+    python autotune.py --dry-run          # chỉ in kết quả, không ghi config
+
+Chạy một workload chuẩn (prompt ~1200 token, sinh 64 token) với từng bộ
+tham số và đo tốc độ đọc prompt (prompt-eval tok/s), tốc độ sinh (tok/s) và
+bộ nhớ model (/api/ps).
+
+Ollama: quét lần lượt num_thread -> num_batch -> num_ctx trong giới hạn an
+toàn (num_ctx lớn nhất mà tốc độ sinh không giảm quá 10% và RAM còn trống).
+Profile tốt nhất được ghi vào config.json ở `ollama.tuning.<model>` và
+providers.py tự áp dụng cho mọi request của model đó.
+
+LM Studio: context length, số thread và batch size chỉ đặt được lúc load
+model (LM Studio UI / `lms load`), API OpenAI-compatible không có tham số
+tương ứng theo request. Tuner chỉ đo model đang load và ghi số liệu vào
+`lmstudio.tuning.<model>` để so sánh giữa các lần chỉnh tay.
+
+llama.cpp server: tương tự LM Studio (--threads, --batch-size, --ctx-size
+đặt khi chạy llama-server), đo qua /v1/chat/completions với số liệu
+`timings` của server, ghi vào `llamacpp.tuning.<model>`.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from provider_registry import provider_config
+
+try:
+    import psutil
+except ImportError:  # psutil không bắt buộc
+    psutil = None
+
+GEN_TOKENS = 64
+CTX_CANDIDATES = (2048, 4096, 8192, 16384, 32768)
+BATCH_CANDIDATES = (128, 256, 512, 1024)
+# num_ctx lớn hơn chỉ được chọn nếu tốc độ sinh giảm không quá mức này
+MAX_CTX_SLOWDOWN = 0.10
+# Dừng tăng num_ctx khi RAM còn trống dưới mức này (tỉ lệ tổng RAM)
+MIN_FREE_RAM = 0.10
+
+WORKLOAD_TEXT = (
+    "Hệ thống điều phối kho hàng nhận đơn từ ba kênh bán hàng và gom chúng theo khu vực giao. "
+    "Mỗi sáng, bộ lập lịch chia đơn thành các đợt lấy hàng sao cho quãng đường đi trong kho là ngắn nhất. "
+    "Khi một mặt hàng hết, đơn được tách và phần còn lại vẫn được giao đúng hẹn. "
+    "The dispatcher reports late shipments, stock shortages and picker utilization every hour. "
+    "Managers review the report, adjust staffing and reorder fast-moving items before the evening peak. "
+)
+
+
+def thread_candidates() -> List[int]:
+    """Số thread thử: quanh số nhân vật lý (Ollama mặc định dùng số nhân vật lý)."""
+    logical = os.cpu_count() or 1
+    physical = (psutil.cpu_count(logical=False) if psutil else None) or max(1, logical // 2)
+    cands = {max(1, physical // 2), max(1, physical * 3 // 4), physical, logical}
+    return sorted(cands)
+
+
+def workload_prompt(run: int, target_tokens: int = 1200) -> str:
+    """Prompt chuẩn; số run ở đầu để server không lấy prefix từ KV cache của lần trước."""
+    body = WORKLOAD_TEXT * max(1, target_tokens * 4 // len(WORKLOAD_TEXT))
+    return f"[run {run}] Tóm tắt ngắn gọn văn bản sau.\n\n{body}"
+
+
+def _free_ram_ratio() -> Optional[float]:
+    if psutil is None:
+        return None
+    vm = psutil.virtual_memory()
+    return vm.available / vm.total
+
+
+class OllamaTuner:
+    def __init__(self, cfg: Dict[str, Any], timeout: float = 600):
+        self.endpoint = cfg["endpoint"].rstrip("/")
+        self.model = cfg["model"]
+        self.timeout = timeout
+        self._run = 0
+
+    def _generate(self, options: Dict[str, Any], prompt: str, num_predict: int) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {**options, "num_predict": num_predict, "temperature": 0, "seed": 0},
+        }
+        r = requests.post(f"{self.endpoint}/api/generate", json=payload, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def _memory_mb(self) -> Optional[float]:
+        try:
+            r = requests.get(f"{self.endpoint}/api/ps", timeout=10)
+            r.raise_for_status()
+            for m in r.json().get("models", []):
+                if m.get("name") == self.model or m.get("model") == self.model:
+                    return round(m.get("size", 0) / 2**20, 1)
+        except requests.RequestException:
+            pass
+        return None
+
+    def measure(self, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Một lần đo; None nếu server lỗi (vd. thiếu RAM với num_ctx này)."""
+        self._run += 1
+        try:
+            # Đổi options làm Ollama load lại model: lần gọi đầu chỉ để load
+            self._generate(options, f"[warmup {self._run}]", 1)
+            data = self._generate(options, workload_prompt(self._run), GEN_TOKENS)
+        except requests.RequestException as e:
+            logging.warning(f"[Tune] {options} failed: {e}")
+            return None
+        prompt_s = data.get("prompt_eval_duration", 0) / 1e9
+        gen_s = data.get("eval_duration", 0) / 1e9
+        result = {
+            **options,
+            "prompt_tps": round(data.get("prompt_eval_count", 0) / prompt_s, 1) if prompt_s else 0.0,
+            "gen_tps": round(data.get("eval_count", 0) / gen_s, 1) if gen_s else 0.0,
+            "workload_s": round(prompt_s + gen_s, 3),
+            "memory_mb": self._memory_mb(),
+        }
+        logging.info(f"[Tune] {result}")
+        return result
+
+    def tune(self, quick: bool = False) -> Dict[str, Any]:
+        base = {"num_ctx": 4096, "num_batch": 512}
+        measured: List[Dict[str, Any]] = []
+
+        def best(runs):
+            runs = [r for r in runs if r and r["workload_s"] > 0]
+            measured.extend(runs)
+            return min(runs, key=lambda r: r["workload_s"]) if runs else None
+
+        threads = thread_candidates()
+        if quick:
+            threads = threads[-2:]
+        top = best(self.measure({**base, "num_thread": t}) for t in threads)
+        if top is None:
+            raise RuntimeError(f"Không đo được model {self.model} tại {self.endpoint}")
+
+        batches = (256, 512) if quick else BATCH_CANDIDATES
+        top = best(self.measure({**base, "num_thread": top["num_thread"], "num_batch": b}) for b in batches) or top
+
+        # num_ctx: tăng dần tới khi chậm đi rõ rệt, server lỗi hoặc RAM sắp hết
+        chosen = top
+        for ctx in CTX_CANDIDATES:
+            if ctx <= chosen["num_ctx"]:
+                continue
+            run = self.measure({**base, "num_thread": top["num_thread"], "num_batch": top["num_batch"], "num_ctx": ctx})
+            if run is None:
+                break
+            measured.append(run)
+            free = _free_ram_ratio()
+            if run["gen_tps"] < top["gen_tps"] * (1 - MAX_CTX_SLOWDOWN) or (free is not None and free < MIN_FREE_RAM):
+                break
+            chosen = run
+            if quick:
+                break
+
+        profile = {k: chosen[k] for k in ("num_thread", "num_batch", "num_ctx", "prompt_tps", "gen_tps", "memory_mb")}
+        profile["runs"] = len(measured)
+        profile["tuned_at"] = time.strftime("%Y-%m-%d %H:%M")
+        return profile
+
+
+class LMStudioTuner:
+    """Chỉ đo model đang load (xem docstring module)."""
+
+    def __init__(self, cfg: Dict[str, Any], timeout: float = 600):
+        self.base = cfg["endpoint"].rstrip("/")
+        self.model = cfg["model"]
+        self.timeout = timeout
+
+    def _payload(self, prompt: str) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True,
+            "max_tokens": GEN_TOKENS,
+            "temperature": 0,
+            "stream_options": {"include_usage": True},
+        }
+
+    def tune(self, quick: bool = False) -> Dict[str, Any]:
+        runs = [self._measure(i) for i in range(1 if quick else 2)]
+        best = max(runs, key=lambda r: r["gen_tps"])
+        return {**best, "tuned_at": time.strftime("%Y-%m-%d %H:%M")}
+
+    def _measure(self, run: int) -> Dict[str, Any]:
+        prompt = workload_prompt(run)
+        payload = self._payload(prompt)
+        started = time.perf_counter()
+        first = None
+        chunks = 0
+        usage: Dict[str, Any] = {}
+        timings: Dict[str, Any] = {}
+        with requests.post(f"{self.base}/chat/completions", json=payload, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if not line.startswith(b"data: ") or line == b"data: [DONE]":
+                    continue
+                data = json.loads(line[6:])
+                usage = data.get("usage") or usage
+                timings = data.get("timings") or timings
+                if any((c.get("delta") or {}).get("content") for c in data.get("choices", [])):
+                    first = first or time.perf_counter()
+                    chunks += 1
+        end = time.perf_counter()
+        first = first or end
+        # Không có thời gian đo từ server: TTFT ~ thời gian đọc prompt
+        prompt_tokens = usage.get("prompt_tokens") or len(prompt) // 4
+        gen_tokens = usage.get("completion_tokens") or chunks
+        result = {
+            "prompt_tps": round(prompt_tokens / max(first - started, 1e-6), 1),
+            "gen_tps": round(max(gen_tokens - 1, 0) / max(end - first, 1e-6), 1),
+            "ttft_ms": round((first - started) * 1000),
+        }
+        # llama.cpp báo tốc độ đo trong server (không gồm thời gian mạng/HTTP)
+        if timings.get("prompt_per_second"):
+            result["prompt_tps"] = round(timings["prompt_per_second"], 1)
+        if timings.get("predicted_per_second"):
+            result["gen_tps"] = round(timings["predicted_per_second"], 1)
+        logging.info(f"[Tune] {result}")
+        return result
+
+
+class LlamaCppTuner(LMStudioTuner):
+    """llama-server: chỉ đo cấu hình đang chạy (tham số đặt khi khởi động server)."""
+
+    def __init__(self, cfg: Dict[str, Any], timeout: float = 600):
+        super().__init__(cfg, timeout)
+        root = self.base[:-3] if self.base.endswith("/v1") else self.base
+        self.base = f"{root}/v1"
+
+    def _payload(self, prompt: str) -> Dict[str, Any]:
+        # Không lấy prefix từ KV cache của slot: đo cả tốc độ đọc prompt
+        return {**super()._payload(prompt), "cache_prompt": False}
+
+
+TUNERS = {"ollama": OllamaTuner, "lmstudio": LMStudioTuner, "llamacpp": LlamaCppTuner}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="AI Summarizer - hardware auto-tuner")
+    ap.add_argument("--config", default="config.json")
+    ap.add_argument("--provider", choices=sorted(TUNERS), help="ghi đè provider trong config")
+    ap.add_argument("--model", help="ghi đè model trong config")
+    ap.add_argument("--quick", action="store_true", help="ít bộ tham số hơn (nhanh hơn)")
+    ap.add_argument("--dry-run", action="store_true", help="không ghi config.json")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s", stream=sys.stderr)
+
+    cfg_path = Path(args.config)
+    if not cfg_path.exists():
+        print(f"Không tìm thấy {cfg_path}. Chạy app.py một lần để tạo config.", file=sys.stderr)
+        return 2
+    full_cfg = json.loads(cfg_path.read_text(encoding="utf-8"))
+    provider_name = args.provider or full_cfg["provider"]
+    if provider_name not in TUNERS:
+        print(f"Provider {provider_name!r} chưa hỗ trợ autotune (hỗ trợ: {', '.join(sorted(TUNERS))}).",
+              file=sys.stderr)
+        return 2
+    cfg = provider_config(full_cfg, provider_name)
+    if args.model:
+        cfg["model"] = args.model
+
+    try:
+        profile = TUNERS[provider_name](cfg).tune(quick=args.quick)
+    except (requests.RequestException, RuntimeError) as e:
+        print(f"Tune thất bại: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps({cfg["model"]: profile}, indent=2, ensure_ascii=False))
+
+    if not args.dry_run:
+        # Đọc lại config ngay trước khi ghi để không đè thay đổi trong lúc tune
+        full_cfg = json.loads(cfg_path.read_text(encoding="utf-8"))
+        full_cfg.setdefault(provider_name, {}).setdefault("tuning", {})[cfg["model"]] = profile
+        cfg_path.write_text(json.dumps(full_cfg, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Đã ghi profile vào {cfg_path} ({provider_name}.tuning)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+# batch_cli.py
+"""
+Headless batch summarizer (không import Qt/pynput/win32).
+
+Ví dụ:
+    python batch_cli.py docs/ -o results.jsonl --action summary --workers 4
+    python batch_cli.py report.txt notes.md -o out.jsonl --lang en
+    python batch_cli.py requests.jsonl -o out.jsonl --resume
+
+Input:
+  - file văn bản: mỗi file là một tài liệu (id = đường dẫn)
+  - thư mục: duyệt đệ quy theo --ext
+  - file .jsonl: mỗi dòng {"id"?, "text" | "path" | "body", "action"?, "prompt"?}
+
+Output: JSONL, mỗi dòng ghi ngay khi tài liệu xong (flush từng dòng).
+--resume bỏ qua các id đã có kết quả thành công trong file output.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Any, Dict, Iterator, Set
+
+from provider_registry import PARALLEL_SLOTS, load_plugins, provider_config
+from providers import make_provider
+from traffic_trace import start_recording
+
+DEFAULT_EXTS = ".txt,.md,.rst,.html,.htm,.csv,.json,.log"
+
+
+def _iter_requests(inputs, exts, default_action: str) -> Iterator[Dict[str, Any]]:
+    """Sinh các request {"id", "text", "action", "prompt"} theo thứ tự input (lazy)."""
+    for raw in inputs:
+        p = Path(raw)
+        if p.is_dir():
+            for f in sorted(p.rglob("*")):
+                if f.is_file() and f.suffix.lower() in exts:
+                    yield _file_request(f, default_action)
+        elif p.suffix.lower() == ".jsonl":
+            with p.open(encoding="utf-8") as fh:
+                for n, line in enumerate(fh, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        logging.error(f"[Batch] {p}:{n} JSON lỗi: {e}")
+                        continue
+                    yield _jsonl_request(item, f"{p}:{n}", default_action)
+        elif p.is_file():
+            yield _file_request(p, default_action)
+        else:
+            logging.error(f"[Batch] Không tìm thấy input: {raw}")
+
+
+def _file_request(path: Path, action: str) -> Dict[str, Any]:
+    return {"id": str(path), "path": str(path), "action": action, "prompt": ""}
+
+
+def _jsonl_request(item: Dict[str, Any], fallback_id: str, action: str) -> Dict[str, Any]:
+    req = {
+        "id": str(item.get("id") or item.get("request_id") or fallback_id),
+        "action": item.get("action", action),
+        "prompt": item.get("prompt", ""),
+    }
+    if item.get("text") or item.get("body"):
+        req["text"] = item.get("text") or item.get("body")
+    elif item.get("path"):
+        req["path"] = item["path"]
+    else:
+        req["text"] = ""
+    return req
+
+
+def _load_done_ids(out_path: Path) -> Set[str]:
+    done: Set[str] = set()
+    if not out_path.exists():
+        return done
+    with out_path.open(encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # dòng cuối có thể bị cắt dở khi bị ngắt
+            if not rec.get("error"):
+                done.add(rec.get("id"))
+    return done
+
+
+def _ends_mid_line(path: Path) -> bool:
+    with path.open("rb") as fh:
+        fh.seek(0, 2)
+        if fh.tell() == 0:
+            return False
+        fh.seek(-1, 2)
+        return fh.read(1) != b"\n"
+
+
+def _run_one(provider, cfg: Dict[str, Any], req: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    rec = {"id": req["id"], "action": req["action"], "model": cfg.get("model")}
+    try:
+        text = req.get("text")
+        if text is None:
+            text = Path(req["path"]).read_text(encoding="utf-8", errors="replace")
+        if not text.strip():
+            raise ValueError("empty document")
+        res = provider.complete_action(req["action"], text, cfg, req.get("prompt", ""))
+        rec.update(
+            output=res["text"],
+            prompt_tokens=res.get("prompt_tokens", 0),
+            completion_tokens=res.get("completion_tokens", 0),
+        )
+    except Exception as e:
+        logging.error(f"[Batch] {req['id']}: {e}")
+        rec["error"] = str(e)
+    rec["elapsed_ms"] = round((time.perf_counter() - started) * 1000)
+    return rec
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="AI Summarizer - batch mode")
+    ap.add_argument("inputs", nargs="+", help="file, thư mục hoặc file .jsonl")
+    ap.add_argument("-o", "--output", required=True, help="file kết quả .jsonl")
+    ap.add_argument("-a", "--action", default="summary", help="summary|explain|translate|rewrite|custom")
+    ap.add_argument("-w", "--workers", type=int, help="số request song song (mặc định: số slot của provider)")
+    ap.add_argument("--config", default="config.json")
+    ap.add_argument("--provider", help="ghi đè provider trong config")
+    ap.add_argument("--lang", help="ghi đè ui.summary_language")
+    ap.add_argument("--ext", default=DEFAULT_EXTS, help="đuôi file khi duyệt thư mục")
+    ap.add_argument("--resume", action="store_true", help="bỏ qua id đã xử lý thành công")
+    ap.add_argument("--record", metavar="DIR", help="ghi traffic provider vào DIR (traffic_trace.py)")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s", stream=sys.stderr)
+
+    cfg_path = Path(args.config)
+    if not cfg_path.exists():
+        print(f"Không tìm thấy {cfg_path}. Chạy app.py một lần để tạo config.", file=sys.stderr)
+        return 2
+    full_cfg = json.loads(cfg_path.read_text(encoding="utf-8"))
+    load_plugins(full_cfg.get("provider_plugins", []))
+    provider_name = args.provider or full_cfg["provider"]
+    cfg = provider_config(full_cfg, provider_name)
+    cfg["summary_language"] = args.lang or full_cfg.get("ui", {}).get("summary_language", "vi")
+    cfg["actions"] = full_cfg.get("actions", {})
+    provider = make_provider(provider_name)
+    if args.record:
+        start_recording(args.record)
+
+    out_path = Path(args.output)
+    done = _load_done_ids(out_path) if args.resume else set()
+    exts = {e.strip().lower() for e in args.ext.split(",") if e.strip()}
+    # llama.cpp: một worker cho mỗi slot; provider không chạy song song: 2
+    # (request kế tiếp đã sẵn sàng ngay khi request trước xong)
+    workers = max(1, args.workers or (provider.parallel_slots(cfg) if provider.has(PARALLEL_SLOTS) else 2))
+
+    stats = {"ok": 0, "error": 0, "skipped": 0, "completion_tokens": 0}
+    started = time.perf_counter()
+    mode = "a" if args.resume else "w"
+    with out_path.open(mode, encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        if mode == "a" and _ends_mid_line(out_path):
+            out.write("\n")  # dòng cuối bị cắt dở khi bị ngắt
+        pending = set()
+
+        def drain(futures):
+            for fut in futures:
+                rec = fut.result()
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                out.flush()
+                if rec.get("error"):
+                    stats["error"] += 1
+                else:
+                    stats["ok"] += 1
+                    stats["completion_tokens"] += rec.get("completion_tokens", 0)
+
+        for req in _iter_requests(args.inputs, exts, args.action):
+            if req["id"] in done:
+                stats["skipped"] += 1
+                continue
+            # Giới hạn số request đang chờ để không đọc hết input vào RAM
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                drain(finished)
+            pending.add(pool.submit(_run_one, provider, cfg, req))
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            drain(finished)
+
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    print(
+        f"Done: {stats['ok']} ok, {stats['error']} lỗi, {stats['skipped']} bỏ qua (resume) trong {elapsed:.1f}s | "
+        f"{stats['ok'] / elapsed * 60:.1f} docs/min | {stats['completion_tokens'] / elapsed:.1f} tokens/s",
+        file=sys.stderr,
+    )
+    return 1 if stats["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+# bench/mock_llm.py
+"""
+Mock LLM server tất định cho benchmark (không cần model thật).
+
+Nói cả hai giao thức stream mà app dùng:
+    POST /api/chat, /api/generate     Ollama NDJSON (stream hoặc không)
+    POST /api/embed                   Ollama embeddings
+    GET  /api/ps                      Ollama model đang load (kích thước cố định)
+    POST /v1/chat/completions         OpenAI/LM Studio SSE (stream hoặc không)
+    POST /v1/embeddings               OpenAI embeddings
+    GET  /props, POST /tokenize       llama.cpp server (số slot, tokenizer)
+
+Câu trả lời luôn giống nhau với cùng cấu hình: `tokens` token lấy lần lượt
+từ WORDS, token đầu sau `first_token_ms`, các token sau cách nhau
+1/`tokens_per_s` giây.
+
+    python bench/mock_llm.py --port 11500 --first-token-ms 200 --tps 50
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, Optional
+
+WORDS = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua.\n\n- Ut enim ad minim veniam,\n"
+         "- quis nostrud exercitation ullamco laboris.\n").split(" ")
+EMBED_DIM = 64
+
+
+class MockConfig:
+    def __init__(self, first_token_ms: float = 100.0, tokens_per_s: float = 50.0, tokens: int = 100,
+                 thinking_tokens: int = 0, slots: int = 4):
+        self.first_token_ms = first_token_ms
+        self.tokens_per_s = tokens_per_s
+        self.tokens = tokens
+        # Số token đầu tiên được trả trong <think>...</think>
+        self.thinking_tokens = thinking_tokens
+        # llama.cpp: total_slots trả về ở /props (server tự xử lý song song)
+        self.slots = slots
+
+    def pieces(self) -> Iterator[str]:
+        for i in range(self.tokens):
+            word = WORDS[i % len(WORDS)]
+            piece = word if i == 0 else " " + word
+            if self.thinking_tokens:
+                if i == 0:
+                    piece = "<think>" + piece
+                if i == self.thinking_tokens - 1:
+                    piece += "</think>"
+            yield piece
+
+    def text(self) -> str:
+        return "".join(self.pieces())
+
+    def paced(self) -> Iterator[str]:
+        """pieces() với độ trễ token đầu và tốc độ token cấu hình."""
+        start = time.perf_counter()
+        interval = 1.0 / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+        for i, piece in enumerate(self.pieces()):
+            due = start + self.first_token_ms / 1000.0 + i * interval
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield piece
+
+
+def _embedding(text: str):
+    digest = hashlib.sha256(text.encode("utf-8")).digest() * (EMBED_DIM // 32 + 1)
+    return [(b - 128) / 128.0 for b in digest[:EMBED_DIM]]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = MockConfig()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] == "/api/ps":
+            self._send_json({"models": [{"name": "mock", "model": "mock", "size": 2**30, "size_vram": 0}]})
+            return
+        if self.path.split("?", 1)[0] == "/props":
+            self._send_json({"total_slots": self.config.slots, "model_path": "mock.gguf"})
+            return
+        self._send_json({"error": f"unknown path {self.path}"}, 404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.split("?", 1)[0]
+        routes = {
+            "/api/chat": self._ollama,
+            "/api/generate": self._ollama,
+            "/api/embed": self._ollama_embed,
+            "/v1/chat/completions": self._openai,
+            "/chat/completions": self._openai,
+            "/v1/embeddings": self._openai_embed,
+            "/embeddings": self._openai_embed,
+            "/tokenize": self._tokenize,
+        }
+        handler = routes.get(path)
+        if not handler:
+            self._send_json({"error": f"unknown path {path}"}, 404)
+            return
+        handler(path, body)
+
+    # ---- helpers ----
+
+    def _send_json(self, data: Dict[str, Any], status: int = 200):
+        out = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def _start_chunked(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _prompt_tokens(self, body: Dict[str, Any]) -> int:
+        if "messages" in body:
+            return sum(len(str(m.get("content", "")).split()) for m in body["messages"])
+        return len(str(body.get("prompt", "")).split())
+
+    # ---- Ollama ----
+
+    def _ollama(self, path: str, body: Dict[str, Any]):
+        cfg = self.config
+        key = "message" if path == "/api/chat" else "response"
+        usage = {
+            "prompt_eval_count": self._prompt_tokens(body),
+            "eval_count": cfg.tokens,
+            # Thời gian (ns) như Ollama báo: token đầu ~ đọc prompt, phần còn lại ~ sinh
+            "prompt_eval_duration": int(cfg.first_token_ms * 1e6),
+            "eval_duration": int(cfg.tokens / cfg.tokens_per_s * 1e9) if cfg.tokens_per_s > 0 else 0,
+        }
+        if path == "/api/generate":
+            usage["context"] = list(range(usage["prompt_eval_count"] + cfg.tokens))
+
+        def payload(text: str) -> Any:
+            return {"role": "assistant", "content": text} if key == "message" else text
+
+        if not body.get("stream", True):
+            list(cfg.paced())
+            self._send_json({"model": body.get("model"), key: payload(cfg.text()), "done": True, **usage})
+            return
+        self._start_chunked("application/x-ndjson")
+        try:
+            for piece in cfg.paced():
+                self._chunk((json.dumps({key: payload(piece), "done": False}) + "\n").encode("utf-8"))
+            self._chunk((json.dumps({key: payload(""), "done": True, **usage}) + "\n").encode("utf-8"))
+            self._end_chunked()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _ollama_embed(self, path: str, body: Dict[str, Any]):
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        self._send_json({"embeddings": [_embedding(t) for t in inputs]})
+
+    # ---- OpenAI / LM Studio ----
+
+    def _openai(self, path: str, body: Dict[str, Any]):
+        cfg = self.config
+        usage = {"prompt_tokens": self._prompt_tokens(body), "completion_tokens": cfg.tokens}
+        if not body.get("stream"):
+            list(cfg.paced())
+            self._send_json({"choices": [{"index": 0, "message": {"role": "assistant", "content": cfg.text()},
+                                          "finish_reason": "stop"}], "usage": usage})
+            return
+        self._start_chunked("text/event-stream")
+        try:
+            for piece in cfg.paced():
+                event = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+                self._chunk(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n")
+            final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+            self._chunk(b"data: " + json.dumps(final).encode("utf-8") + b"\n\n")
+            self._chunk(b"data: [DONE]\n\n")
+            self._end_chunked()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _tokenize(self, path: str, body: Dict[str, Any]):
+        self._send_json({"tokens": list(range(len(str(body.get("content", "")).split())))})
+
+    def _openai_embed(self, path: str, body: Dict[str, Any]):
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        self._send_json({"data": [{"index": i, "embedding": _embedding(t)} for i, t in enumerate(inputs)]})
+
+
+class MockServer:
+    """Chạy mock trong thread nền (dùng trong benchmark)."""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        handler = type("Handler", (MockHandler,), {"config": config or MockConfig()})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def config(self) -> MockConfig:
+        return self.httpd.RequestHandlerClass.config
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm", daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Deterministic mock Ollama/OpenAI server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11500)
+    ap.add_argument("--first-token-ms", type=float, default=100.0)
+    ap.add_argument("--tps", type=float, default=50.0, help="tokens per second")
+    ap.add_argument("--tokens", type=int, default=100)
+    ap.add_argument("--thinking-tokens", type=int, default=0)
+    args = ap.parse_args()
+    cfg = MockConfig(args.first_token_ms, args.tps, args.tokens, args.thinking_tokens)
+    server = MockServer(cfg, args.host, args.port)
+    print(f"Mock LLM on {server.url} (Ollama: {server.url}, OpenAI: {server.url}/v1)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+# bench/run_bench.py
+"""
+Benchmark streaming/render với mock LLM server (bench/mock_llm.py).
+
+    python bench/run_bench.py                 # chạy, so với bench/baselines.json
+    python bench/run_bench.py --update        # ghi kết quả hiện tại làm baseline
+    python bench/run_bench.py --only provider
+
+Đo:
+  - provider_*: time to first token (phần overhead của app so với độ trễ mock),
+    throughput khi mock stream ở tốc độ tối đa, bộ nhớ cấp phát đỉnh (tracemalloc)
+  - chat_*: chi phí render mỗi token của ChatWindow (Qt offscreen), tổng thời
+    gian một lượt chat, bộ nhớ đỉnh
+  - decoder_*: tốc độ parse của stream_decoder (NDJSON / SSE, mỗi backend JSON)
+    trên dữ liệu trong bộ nhớ, không có mạng
+
+Exit code 1 nếu một chỉ số tệ hơn baseline quá --tolerance (mặc định 25%).
+Baseline phụ thuộc máy: ghi lại bằng --update trên máy dùng để so sánh.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_llm import MockConfig, MockServer  # noqa: E402
+from providers import LlamaCppProvider, LMStudioProvider, OllamaProvider  # noqa: E402
+import stream_decoder  # noqa: E402
+
+BASELINES = Path(__file__).resolve().parent / "baselines.json"
+FIRST_TOKEN_MS = 50.0
+MESSAGES = [{"role": "user", "content": "Summarize the benchmark text please."}]
+
+# metric -> True nếu càng cao càng tốt
+HIGHER_IS_BETTER = {
+    "tokens_per_s": True,
+    "mb_s": True,
+    "events_per_s": True,
+}
+# Chênh lệch tuyệt đối nhỏ hơn mức này là nhiễu đo, không tính là regression
+NOISE_FLOOR = {
+    "ttft_overhead_ms": 1.0,
+    "render_per_token_ms": 0.2,
+    "send_total_ms": 100.0,
+    "peak_kb": 64.0,
+}
+
+
+def _provider_cfg(name: str, url: str) -> Dict[str, Any]:
+    if name in ("ollama", "llamacpp"):
+        return {"endpoint": url, "model": "mock", "temperature": 0.2, "max_tokens": 1024}
+    return {"endpoint": url + "/v1", "model": "mock", "temperature": 0.2, "max_tokens": 1024}
+
+
+def _stream(provider, cfg) -> Dict[str, float]:
+    started = time.perf_counter()
+    first = None
+    chunks = 0
+    for chunk in provider.chat_stream(MESSAGES, cfg):
+        if chunk.type == "done":
+            continue
+        if first is None:
+            first = time.perf_counter()
+        chunks += 1
+    end = time.perf_counter()
+    return {"ttft_ms": (first - started) * 1000, "total_ms": (end - started) * 1000,
+            "chunks": chunks, "stream_s": end - first}
+
+
+def bench_provider(name: str, provider_cls) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    # Độ trễ: mock chờ FIRST_TOKEN_MS, phần còn lại là overhead của client
+    with MockServer(MockConfig(first_token_ms=FIRST_TOKEN_MS, tokens_per_s=0, tokens=20)) as server:
+        cfg = _provider_cfg(name, server.url)
+        provider = provider_cls()
+        _stream(provider, cfg)  # warm-up (kết nối, import)
+        runs = [_stream(provider, cfg) for _ in range(5)]
+        results["ttft_overhead_ms"] = min(r["ttft_ms"] for r in runs) - FIRST_TOKEN_MS
+
+    # Throughput: mock không giới hạn tốc độ -> đo khả năng parse của client
+    with MockServer(MockConfig(first_token_ms=0, tokens_per_s=0, tokens=5000)) as server:
+        cfg = _provider_cfg(name, server.url)
+        provider = provider_cls()
+        tracemalloc.start()
+        _stream(provider, cfg)
+        _cur, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results["peak_kb"] = peak / 1024
+        # tracemalloc làm chậm parse: đo throughput riêng, lấy lần tốt nhất
+        runs = [_stream(provider, cfg) for _ in range(5)]
+        results["tokens_per_s"] = max(r["chunks"] / max(r["stream_s"], 1e-9) for r in runs)
+    return {f"provider_{name}.{k}": round(v, 3) for k, v in results.items()}
+
+
+def _chat_turn(app, window, text: str):
+    from PySide6 import QtCore
+
+    window.txtInput.setPlainText(text)
+    window._send_message()
+    while window._generation is not None:
+        app.processEvents(QtCore.QEventLoop.WaitForMoreEvents)
+
+
+def bench_chat() -> Dict[str, float]:
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6 import QtWidgets
+    from chat_window import ChatWindow
+    from conversation_store import ConversationStore
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp, \
+            MockServer(MockConfig(first_token_ms=0, tokens_per_s=0, tokens=300)) as server:
+        cfg = {"provider": "ollama", "ollama": _provider_cfg("ollama", server.url),
+               "ui": {"summary_language": "vi"}}
+        store = ConversationStore(str(Path(tmp) / "history.jsonl"))
+        # Lịch sử có sẵn; cửa sổ được show (offscreen) để đo cả layout + vẽ
+        for i in range(20):
+            store.append({"role": "user", "content": f"Question {i}"}, save=False)
+            store.append({"role": "assistant", "content": MockConfig(tokens=80).text()}, save=False)
+        window = ChatWindow(OllamaProvider(), None, cfg, store=store)
+        window.show()
+        app.processEvents()
+
+        # Chi phí render mỗi token (không có mạng)
+        text = ""
+        pieces = list(MockConfig(tokens=200).pieces())
+        started = time.perf_counter()
+        for piece in pieces:
+            text += piece
+            window._update_streaming_message("", text)
+            app.processEvents()
+        results["render_per_token_ms"] = (time.perf_counter() - started) * 1000 / len(pieces)
+
+        # Một lượt chat đầy đủ qua mock (generation chạy ở worker thread)
+        tracemalloc.start()
+        _chat_turn(app, window, "Benchmark question")
+        _cur, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results["peak_kb"] = peak / 1024
+        totals = []
+        for i in range(3):
+            started = time.perf_counter()
+            _chat_turn(app, window, f"Benchmark question {i}")
+            totals.append((time.perf_counter() - started) * 1000)
+        results["send_total_ms"] = min(totals)
+        window.close()
+    return {f"chat.{k}": round(v, 3) for k, v in results.items()}
+
+
+def _decoder_payload(kind: str, tokens: int = 20000) -> bytes:
+    """Stream giống hệt mock_llm trả về, ghép sẵn thành bytes."""
+    out = []
+    for piece in MockConfig(tokens=tokens).pieces():
+        if kind == "ndjson":
+            out.append(json.dumps({"message": {"role": "assistant", "content": piece}, "done": False}) + "\n")
+        else:
+            out.append("data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": piece}}]}) + "\n\n")
+    if kind == "sse":
+        out.append("data: [DONE]\n\n")
+    return "".join(out).encode("utf-8")
+
+
+def _decode(kind: str, chunks: List[bytes]) -> int:
+    events = 0
+    if kind == "ndjson":
+        for _obj in stream_decoder.iter_ndjson(chunks):
+            events += 1
+    else:
+        for ev in stream_decoder.iter_sse(chunks):
+            if ev.data != b"[DONE]":
+                ev.json()
+            events += 1
+    return events
+
+
+def bench_decoder() -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    backends = ["json"] + (["orjson"] if stream_decoder.orjson is not None else [])
+    previous = stream_decoder.JSON_BACKEND
+    try:
+        for kind in ("ndjson", "sse"):
+            data = _decoder_payload(kind)
+            # Khối 16 KB cắt ngang dòng/event như khi đọc socket
+            chunks = [data[i:i + 16384] for i in range(0, len(data), 16384)]
+            for backend in backends:
+                stream_decoder.set_json_backend(backend)
+                best = float("inf")
+                for _ in range(5):
+                    started = time.perf_counter()
+                    events = _decode(kind, chunks)
+                    best = min(best, time.perf_counter() - started)
+                prefix = f"decoder_{kind}_{backend}"
+                results[f"{prefix}.mb_s"] = round(len(data) / best / 1e6, 3)
+                results[f"{prefix}.events_per_s"] = round(events / best, 3)
+    finally:
+        stream_decoder.set_json_backend(previous)
+    return results
+
+
+BENCHES: Dict[str, Callable[[], Dict[str, float]]] = {
+    "provider": lambda: {**bench_provider("ollama", OllamaProvider),
+                         **bench_provider("lmstudio", LMStudioProvider),
+                         **bench_provider("llamacpp", LlamaCppProvider)},
+    "chat": bench_chat,
+    "decoder": bench_decoder,
+}
+
+
+def compare(results: Dict[str, float], baselines: Dict[str, float], tolerance: float) -> List[str]:
+    """Danh sách chỉ số tệ hơn baseline quá tolerance."""
+    failures = []
+    for metric, base in baselines.items():
+        if metric not in results or not base:
+            continue
+        value = results[metric]
+        name = metric.rsplit(".", 1)[-1]
+        higher = HIGHER_IS_BETTER.get(name, False)
+        worse = value < base * (1 - tolerance) if higher else value > base * (1 + tolerance)
+        if worse and abs(value - base) > NOISE_FLOOR.get(name, 0.0):
+            failures.append(f"{metric}: {value:.3f} vs baseline {base:.3f}")
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description="AI Summarizer benchmarks (mock LLM)")
+    ap.add_argument("--only", choices=sorted(BENCHES), action="append", help="chỉ chạy nhóm này")
+    ap.add_argument("--update", action="store_true", help="ghi kết quả làm baseline mới")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="mức tệ hơn cho phép (0.25 = 25%%)")
+    ap.add_argument("--output", help="ghi kết quả ra file JSON")
+    args = ap.parse_args()
+
+    results: Dict[str, float] = {}
+    for name in args.only or sorted(BENCHES):
+        try:
+            results.update(BENCHES[name]())
+        except ImportError as e:
+            print(f"[skip] {name}: {e}", file=sys.stderr)
+
+    width = max(map(len, results), default=10)
+    for metric, value in sorted(results.items()):
+        print(f"{metric:<{width}}  {value:>12.3f}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    baselines = json.loads(BASELINES.read_text(encoding="utf-8")) if BASELINES.exists() else {}
+    if args.update:
+        baselines.update(results)
+        BASELINES.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"Baselines written to {BASELINES}")
+        return
+    failures = compare(results, baselines, args.tolerance)
+    if failures:
+        print("\nRegressions:", *failures, sep="\n  ")
+        sys.exit(1)
+    print("\nNo regressions" if baselines else "\nNo baselines yet (run with --update)")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,8 @@ import os
 block_cipher = None
 
 a = Analysis(
-    ['app.py', 'ui_components.py', 'mcp_manager.py', 'chat_window.py'],
+    ['app.py', 'ui_components.py', 'mcp_manager.py', 'chat_window.py', 'chat_view.py', 'fanout_window.py', 'action_profiles.py', 'provider_registry.py', 'providers.py',
+     'engine.py', 'scheduler.py', 'result_cache.py', 'conversation_store.py', 'sessions.py', 'semantic_index.py', 'near_duplicate.py', 'translation_memory.py', 'text_reducer.py', 'idle_prefetch.py', 'startup_report.py', 'traffic_trace.py', 'stream_decoder.py', 'profiler.py', 'daemon.py'],
     pathex=[os.getcwd()],
     binaries=[],
     datas=[],
@@ -0,0 +1,339 @@
+# chat_view.py
+"""
+View lịch sử chat dạng model/view (thay cho một QTextEdit chứa cả lịch sử).
+
+- ChatModel: list model trên trang tin nhắn đang có trong RAM của
+  ConversationStore, cộng một dòng "đang gõ" khi model đang stream.
+  Cuộn lên đầu danh sách thì đọc thêm một trang cũ hơn từ store.
+- MessageDelegate: vẽ từng tin nhắn thành bong bóng bằng QTextDocument.
+  Chỉ giữ layout của một số ít tin nhắn vừa vẽ (LRU, ~ các dòng đang hiển
+  thị); các dòng khác chỉ nhớ chiều cao.
+
+Thời gian mở cửa sổ và bộ nhớ chỉ phụ thuộc số tin nhắn đã đọc, không phụ
+thuộc độ dài toàn bộ lịch sử.
+"""
+import html
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from PySide6 import QtCore, QtGui, QtWidgets
+
+from conversation_store import ConversationStore, Message
+
+# Tool result / thinking dài hơn mức này chỉ hiển thị phần đầu (Export có đầy đủ)
+DISPLAY_CHARS = 6000
+# Số QTextDocument đã layout được giữ lại
+DOC_CACHE = 48
+
+BUBBLE = {
+    # role: (nền, viền, chữ, tiêu đề)
+    "user": ("#0084ff", None, "white", "👤 You:"),
+    "assistant": ("#e4e6eb", None, "black", "🤖 AI:"),
+    "tool": ("#fff3cd", "#ffc107", "#856404", "🔧 Tool Result:"),
+}
+PAD = 10
+MARGIN = 6
+
+
+def _bubble_width(view_width: int) -> int:
+    return max(120, int(view_width * 0.75))
+
+
+def escape_html(text: str) -> str:
+    """Escape HTML but preserve newlines"""
+    return html.escape(text).replace("\n", "<br>")
+
+
+def _thinking_html(thinking: str) -> str:
+    thinking = thinking.replace("<think>", "").replace("</think>", "").strip()
+    if not thinking:
+        return ""
+    return ("<table width='100%' cellpadding='4' bgcolor='#fff3cd' style='margin: 4px 0;'><tr>"
+            f"<td style='font-size: 9pt; color: #856404;'>💭 {escape_html(thinking)}</td></tr></table>")
+
+
+def message_html(msg: Message) -> str:
+    title = BUBBLE.get(msg.role, BUBBLE["assistant"])[3]
+    if msg.role == "tool":
+        return f"<b>{title}</b><pre style='margin: 5px 0; font-size: 9pt;'>{html.escape(msg.preview(DISPLAY_CHARS))}</pre>"
+    body = escape_html(msg.preview(DISPLAY_CHARS))
+    thinking = _thinking_html(msg.preview(DISPLAY_CHARS, "thinking")) if msg.role == "assistant" else ""
+    return f"<b>{title}</b>{thinking or '<br>'}{body}"
+
+
+def pending_html(thinking: str, content: str) -> str:
+    return (f"<b>🤖 AI:</b> <i style='color: #666;'>typing...</i>"
+            f"{_thinking_html(thinking) or '<br>'}{escape_html(content)}▊")
+
+
+class ChatModel(QtCore.QAbstractListModel):
+    def __init__(self, store: ConversationStore, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self._rows: List[Message] = []
+        self._pending: Optional[Tuple[str, str]] = None
+        self.sync()
+
+    def rowCount(self, parent=QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self._rows) + (self._pending is not None)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        value = self.value(index.row())
+        if isinstance(value, tuple):
+            return value[1]
+        return value.preview(DISPLAY_CHARS) if value is not None else None
+
+    def value(self, row: int):
+        """Message của dòng, hoặc tuple (thinking, content) với dòng đang stream.
+        Delegate đọc trực tiếp thay vì qua data() để không tạo QVariant mỗi lần."""
+        if 0 <= row < len(self._rows):
+            return self._rows[row]
+        if row == len(self._rows):
+            return self._pending
+        return None
+
+    def message(self, row: int) -> Optional[Message]:
+        return self._rows[row] if 0 <= row < len(self._rows) else None
+
+    def sync(self):
+        """Đồng bộ với store.messages: tin mới ở cuối, trang cũ ở đầu, hoặc reset."""
+        with self.store.lock:
+            current = list(self.store.messages)
+        rows = self._rows
+        n, m = len(rows), len(current)
+        if n and m >= n and current[0] is rows[0] and current[n - 1] is rows[-1]:
+            if m > n:
+                self.beginInsertRows(QtCore.QModelIndex(), n, m - 1)
+                self._rows = current
+                self.endInsertRows()
+        elif n and m > n and current[m - n] is rows[0] and current[-1] is rows[-1]:
+            self.beginInsertRows(QtCore.QModelIndex(), 0, m - n - 1)
+            self._rows = current
+            self.endInsertRows()
+        else:
+            self.beginResetModel()
+            self._rows = current
+            self._pending = None
+            self.endResetModel()
+
+    def has_older(self) -> bool:
+        return self.store.older_count() > 0
+
+    def fetch_older(self) -> int:
+        added = self.store.load_older()
+        if added:
+            self.sync()
+        return added
+
+    def has_pending(self) -> bool:
+        return self._pending is not None
+
+    def set_pending(self, thinking: str, content: str, notify: bool = True):
+        """Nội dung dòng đang stream. notify=False: chỉ đổi dữ liệu, view tự vẽ lại
+        (dataChanged làm QListView layout lại mọi dòng đã load)."""
+        if self._pending is None:
+            row = len(self._rows)
+            self.beginInsertRows(QtCore.QModelIndex(), row, row)
+            self._pending = (thinking, content)
+            self.endInsertRows()
+            return
+        self._pending = (thinking, content)
+        if notify:
+            index = self.index(len(self._rows))
+            self.dataChanged.emit(index, index)
+
+    def clear_pending(self):
+        if self._pending is not None:
+            row = len(self._rows)
+            self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+            self._pending = None
+            self.endRemoveRows()
+
+
+class MessageDelegate(QtWidgets.QStyledItemDelegate):
+    """Vẽ một tin nhắn thành bong bóng. Layout (QTextDocument) chỉ được giữ
+    cho DOC_CACHE tin nhắn vẽ gần nhất; chiều cao được nhớ theo dòng và bề
+    rộng (bỏ khi dòng dịch chỗ: chèn trang cũ ở đầu, xoá, reset model)."""
+
+    def __init__(self, view: QtWidgets.QListView):
+        super().__init__(view)
+        self.view = view
+        self._docs: "OrderedDict[Tuple[int, int], Tuple[Message, QtGui.QTextDocument]]" = OrderedDict()
+        self._heights: Dict[int, Tuple[int, int]] = {}
+        self._pending_doc: Optional[Tuple[tuple, int, QtGui.QTextDocument]] = None
+
+    def reset(self):
+        self._docs.clear()
+        self._heights.clear()
+        self._pending_doc = None
+
+    def rows_moved(self, _parent, first: int, _last: int):
+        """Dòng từ first trở đi đã đổi tin nhắn: bỏ chiều cao đã nhớ của chúng."""
+        for row in [r for r in self._heights if r >= first]:
+            del self._heights[row]
+
+    def _layout(self, html_text: str, color: str, width: int) -> QtGui.QTextDocument:
+        doc = QtGui.QTextDocument()
+        doc.setDefaultFont(self.view.font())
+        doc.setDefaultStyleSheet(f"body {{ color: {color}; }}")
+        doc.setDocumentMargin(0)
+        doc.setHtml(f"<body>{html_text}</body>")
+        doc.setTextWidth(width - 2 * PAD)
+        ideal = doc.idealWidth()
+        if ideal < width - 2 * PAD:
+            doc.setTextWidth(ideal + 1)
+        return doc
+
+    def _document(self, value, width: int) -> Tuple[QtGui.QTextDocument, str]:
+        if isinstance(value, tuple):
+            # Dòng đang stream đổi mỗi token: chỉ giữ layout của nội dung hiện tại
+            cached = self._pending_doc
+            if not (cached and cached[0] is value and cached[1] == width):
+                doc = self._layout(pending_html(*value), BUBBLE["assistant"][2], width)
+                cached = self._pending_doc = (value, width, doc)
+            return cached[2], "assistant"
+        role = value.role if value.role in BUBBLE else "assistant"
+        key = (id(value), width)
+        cached = self._docs.get(key)
+        if cached and cached[0] is value:
+            self._docs.move_to_end(key)
+            return cached[1], role
+        doc = self._layout(message_html(value), BUBBLE[role][2], width)
+        self._docs[key] = (value, doc)
+        while len(self._docs) > DOC_CACHE:
+            self._docs.popitem(last=False)
+        return doc, role
+
+    def sizeHint(self, option, index) -> QtCore.QSize:
+        # Gọi cho mọi dòng đã load mỗi lần view layout lại: đường cache phải rẻ
+        value = self.view.chat_model.value(index.row())
+        if value is None:
+            return QtCore.QSize()
+        view_width = self.view.viewport().width()
+        width = _bubble_width(view_width)
+        pending = isinstance(value, tuple)
+        if not pending:
+            cached = self._heights.get(index.row())
+            if cached and cached[0] == width:
+                return QtCore.QSize(view_width, cached[1])
+        doc, _role = self._document(value, width)
+        height = int(doc.size().height()) + 2 * PAD + 2 * MARGIN
+        if not pending:
+            self._heights[index.row()] = (width, height)
+        return QtCore.QSize(view_width, height)
+
+    def paint(self, painter, option, index):
+        width = _bubble_width(self.view.viewport().width())
+        value = self.view.chat_model.value(index.row())
+        if value is None:
+            return
+        doc, role = self._document(value, width)
+        bg, border, _color, _title = BUBBLE[role]
+        w = int(doc.textWidth()) + 2 * PAD
+        h = int(doc.size().height()) + 2 * PAD
+        rect = option.rect
+        x = rect.right() - w - MARGIN if role == "user" else rect.left() + MARGIN
+        bubble = QtCore.QRectF(x, rect.top() + MARGIN, w, h)
+        painter.save()
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        pen = QtGui.QPen(QtGui.QColor(border), 1, QtCore.Qt.DashLine) if border else QtCore.Qt.NoPen
+        painter.setPen(pen)
+        painter.setBrush(QtGui.QColor(bg))
+        if option.state & QtWidgets.QStyle.State_Selected:
+            painter.setBrush(QtGui.QColor(bg).darker(110))
+        painter.drawRoundedRect(bubble, 12, 12)
+        painter.translate(bubble.left() + PAD, bubble.top() + PAD)
+        doc.drawContents(painter)
+        painter.restore()
+
+
+class ChatView(QtWidgets.QListView):
+    """Danh sách tin nhắn: tự cuộn theo tin mới nếu đang ở cuối, đọc thêm
+    trang cũ khi cuộn lên đầu (giữ nguyên tin nhắn đang nhìn)."""
+
+    def __init__(self, store: ConversationStore, parent=None):
+        super().__init__(parent)
+        self.chat_model = ChatModel(store, self)
+        self.delegate = MessageDelegate(self)
+        self.setModel(self.chat_model)
+        self.setItemDelegate(self.delegate)
+        self.setVerticalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.setResizeMode(QtWidgets.QListView.Adjust)
+        self.setUniformItemSizes(False)
+        self.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
+        self.customContextMenuRequested.connect(self._context_menu)
+        self.chat_model.modelReset.connect(self.delegate.reset)
+        self.chat_model.rowsInserted.connect(self.delegate.rows_moved)
+        self.chat_model.rowsRemoved.connect(self.delegate.rows_moved)
+        self.verticalScrollBar().valueChanged.connect(self._on_scroll)
+        self._fetching = False
+
+    def at_bottom(self) -> bool:
+        sb = self.verticalScrollBar()
+        return sb.value() >= sb.maximum() - 4
+
+    def sync(self):
+        """Bỏ dòng đang gõ, nhận tin nhắn mới từ store và cuộn xuống cuối."""
+        self.chat_model.clear_pending()
+        self.chat_model.sync()
+        self.scrollToBottom()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.scrollToBottom()
+
+    def set_pending(self, thinking: str, content: str):
+        follow = self.at_bottom()
+        model = self.chat_model
+        if model.has_pending():
+            # Chiều cao không đổi (phần lớn các token): chỉ vẽ lại dòng này
+            model.set_pending(thinking, content, notify=False)
+            index = model.index(model.rowCount() - 1)
+            rect = self.visualRect(index)
+            if self.delegate.sizeHint(QtWidgets.QStyleOptionViewItem(), index).height() == rect.height():
+                self.viewport().update(rect)
+                return
+            model.set_pending(thinking, content)
+        else:
+            model.set_pending(thinking, content)
+        if follow:
+            self.scrollToBottom()
+
+    def _on_scroll(self, value: int):
+        if value > self.verticalScrollBar().minimum() or self._fetching or not self.chat_model.has_older():
+            return
+        self._fetching = True
+        try:
+            anchor = self.indexAt(QtCore.QPoint(0, 0)).row()
+            added = self.chat_model.fetch_older()
+            if added and anchor >= 0:
+                self.scrollTo(self.chat_model.index(anchor + added), QtWidgets.QAbstractItemView.PositionAtTop)
+        finally:
+            self._fetching = False
+
+    def _context_menu(self, pos):
+        msg = self.chat_model.message(self.indexAt(pos).row())
+        if msg is None:
+            return
+        menu = QtWidgets.QMenu(self)
+        act_copy = menu.addAction("📋 Copy")
+        act_thinking = menu.addAction("💭 Copy thinking") if msg.get("thinking") else None
+        chosen = menu.exec(self.viewport().mapToGlobal(pos))
+        if chosen is act_copy:
+            QtWidgets.QApplication.clipboard().setText(msg.content)
+        elif act_thinking is not None and chosen is act_thinking:
+            QtWidgets.QApplication.clipboard().setText(msg.thinking)
+
+    def keyPressEvent(self, event):
+        if event.matches(QtGui.QKeySequence.Copy):
+            msg = self.chat_model.message(self.currentIndex().row())
+            if msg is not None:
+                QtWidgets.QApplication.clipboard().setText(msg.content)
+                return
+        super().keyPressEvent(event)
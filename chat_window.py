@@ -1,29 +1,117 @@
 # chat_window.py
-import json
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 from datetime import datetime
+import contextlib
 import logging
+import threading
 
 from PySide6 import QtWidgets, QtGui, QtCore
 from ui_components import MCPPanel
+from chat_view import ChatView
+from conversation_store import ConversationStore, Message
+from provider_registry import provider_config
+from providers import StreamCancel
+from semantic_index import SemanticMemory
+from text_reducer import reduce_text, retained_note
+
+
+class ChatGeneration(QtCore.QObject):
+    """Một lần sinh câu trả lời ở thread nền (dựng context + chat_stream).
+
+    Chunk được gom lại trong worker; GUI chỉ có tối đa một signal `progress`
+    đang chờ trong event queue và tự lấy phần đã gom bằng take(). Mạng nhanh
+    hơn GUI thì các token dồn vào một lần vẽ, không làm ngập event loop và
+    thread mạng không bao giờ phải chờ GUI.
+    """
+    progress = QtCore.Signal()
+    finished = QtCore.Signal(str)  # "" hoặc thông báo lỗi
+
+    def __init__(self, provider, cfg: Dict[str, Any], user: Message, build_context,
+                 context: Optional[List[Dict[str, str]]] = None, activity=contextlib.nullcontext):
+        super().__init__()
+        self.provider = provider
+        # Context manager bao lời gọi model (engine.interactive: prefetch nhường server)
+        self._activity = activity
+        self.cfg = cfg
+        self.user = user
+        self.context = context
+        self._build_context = build_context
+        self.cancel = StreamCancel()
+        self._lock = threading.Lock()
+        self._thinking: List[str] = []
+        self._content: List[str] = []
+        self._signalled = False
+
+    def start(self):
+        threading.Thread(target=self._run, name="chat-generate", daemon=True).start()
+
+    def stop(self):
+        self.cancel.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel.cancelled
+
+    def take(self):
+        """(thinking, content) đã nhận tới giờ; cho phép worker báo progress tiếp."""
+        with self._lock:
+            self._signalled = False
+            return "".join(self._thinking), "".join(self._content)
+
+    def _run(self):
+        error = ""
+        try:
+            with self._activity():
+                if self.context is None:
+                    self.context = self._build_context()
+                for chunk in self.provider.chat_stream(self.context, self.cfg, cancel=self.cancel):
+                    if self.cancel.cancelled:
+                        break  # đóng generator -> đóng HTTP stream
+                    if chunk.type == "done":
+                        continue
+                    with self._lock:
+                        (self._thinking if chunk.type == "thinking" else self._content).append(chunk.text)
+                        notify = not self._signalled
+                        self._signalled = True
+                    if notify:
+                        self.progress.emit()
+        except Exception as e:
+            if not self.cancel.cancelled:
+                logging.error(f"Chat stream error: {e}", exc_info=True)
+                error = str(e) or type(e).__name__
+        self.finished.emit(error)
+
 
 class ChatWindow(QtWidgets.QDialog):
-    def __init__(self, provider, mcp_manager, config: Dict[str, Any]):
+    def __init__(self, provider, mcp_manager, config: Dict[str, Any], store: Optional[ConversationStore] = None,
+                 memory: Optional[SemanticMemory] = None, activity=contextlib.nullcontext):
         logging.info("ChatWindow.__init__ started")
         super().__init__()
         self.provider = provider
+        # engine.interactive: báo cho prefetch / lane embed khi đang sinh câu trả lời
+        self.activity = activity
         self.mcp = mcp_manager
         self.cfg = config
+        # Semantic index: thay lịch sử dài bằng vài đoạn liên quan nhất
+        self.memory = memory
         
         self.setWindowTitle("💬 AI Chat")
         self.resize(720, 580)
         
-        # Message history: [{"role": "user"|"assistant"|"tool", "content": "..."}]
-        self.messages: List[Dict[str, str]] = []
+        # Message history (shared with the HTTP daemon through the store):
+        # Message(role="user"|"assistant"|"tool", content=..., thinking=...)
+        # Only the most recent page is in memory, older pages load on scroll-up.
+        self.store = store or ConversationStore()
+        self.messages: List[Message] = self.store.messages
+        # Generation đang chạy; trong lúc đó lịch sử không được sửa từ cửa sổ này
+        self._generation: Optional[ChatGeneration] = None
+        # (user message, context đã gửi) của lượt cuối, dùng lại khi Regenerate
+        self._last_context: Optional[tuple] = None
+        self._deferred_context: List[str] = []
         
-        # Load chat history if exists
-        self._load_history()
+        # The store already holds the latest page of the history
+        self._index_history()
         
         self._init_ui()
         self._display_messages()
@@ -41,19 +129,18 @@ class ChatWindow(QtWidgets.QDialog):
         layout.addLayout(toolbar)
         
         # Message display area
-        self.chatDisplay = QtWidgets.QTextEdit()
-        self.chatDisplay.setReadOnly(True)
-        self.chatDisplay.setStyleSheet("""
-            QTextEdit {
+        self.chatView = ChatView(self.store)
+        self.chatView.setStyleSheet("""
+            QListView {
                 background-color: #f5f5f5;
                 border: 1px solid #ddd;
                 border-radius: 5px;
-                padding: 10px;
+                padding: 4px;
                 font-family: 'Segoe UI', Arial;
                 font-size: 10pt;
             }
         """)
-        layout.addWidget(self.chatDisplay, 3)
+        layout.addWidget(self.chatView, 3)
         
         # Input area
         inputLabel = QtWidgets.QLabel("Your message:")
@@ -76,15 +163,22 @@ class ChatWindow(QtWidgets.QDialog):
         # Buttons
         btnLayout = QtWidgets.QHBoxLayout()
         self.btnMCP = QtWidgets.QPushButton("📎 MCP Tools")
+        self.btnRegenerate = QtWidgets.QPushButton("🔄 Regenerate")
+        self.btnStop = QtWidgets.QPushButton("⏹ Stop")
+        self.btnStop.setVisible(False)
         self.btnSend = QtWidgets.QPushButton("📤 Send")
         self.btnSend.setDefault(True)
         btnLayout.addWidget(self.btnMCP)
         btnLayout.addStretch(1)
+        btnLayout.addWidget(self.btnRegenerate)
+        btnLayout.addWidget(self.btnStop)
         btnLayout.addWidget(self.btnSend)
         layout.addLayout(btnLayout)
         
         # Connect signals
         self.btnSend.clicked.connect(self._send_message)
+        self.btnStop.clicked.connect(self._stop_generation)
+        self.btnRegenerate.clicked.connect(self._regenerate)
         self.btnClear.clicked.connect(self._clear_history)
         self.btnExport.clicked.connect(self._export_chat)
         self.btnMCP.clicked.connect(self._open_mcp_tools)
@@ -104,182 +198,98 @@ class ChatWindow(QtWidgets.QDialog):
         return super().eventFilter(obj, event)
     
     def _display_messages(self):
-        """Display all messages in chat history"""
-        html_parts = []
-        for msg in self.messages:
-            role = msg["role"]
-            content = msg["content"]
-            
-            if role == "user":
-                html_parts.append(f"""
-                <div style='margin: 10px 0; text-align: right;'>
-                    <span style='background: #0084ff; color: white; padding: 8px 12px; 
-                                 border-radius: 15px; display: inline-block; max-width: 70%;
-                                 text-align: left;'>
-                        <b>👤 You:</b><br>{self._escape_html(content)}
-                    </span>
-                </div>
-                """)
-            elif role == "assistant":
-                thinking = msg.get("thinking", "")
-                # Remove <think></think> tags from thinking
-                thinking_clean = thinking.replace("<think>", "").replace("</think>", "").strip()
-                
-                html_parts.append(f"""
-                <div style='margin: 10px 0;'>
-                    <span style='background: #e4e6eb; color: black; padding: 8px 12px; 
-                                 border-radius: 15px; display: inline-block; max-width: 70%;'>
-                        <b>🤖 AI:</b><br>
-                        {f"<details style='margin: 5px 0;'><summary style='color: #856404; cursor: pointer; font-size: 9pt;'>💭 Thinking...</summary><div style='background: #fff3cd; padding: 6px 8px; margin-top: 5px; border-radius: 5px; font-size: 9pt; color: #856404;'>{self._escape_html(thinking_clean)}</div></details>" if thinking_clean else ""}
-                        {self._escape_html(content)}
-                    </span>
-                </div>
-                """)
-            elif role == "tool":
-                html_parts.append(f"""
-                <div style='margin: 10px 0;'>
-                    <span style='background: #fff3cd; color: #856404; padding: 8px 12px; 
-                                 border-radius: 15px; display: inline-block; max-width: 70%;
-                                 border: 1px dashed #ffc107;'>
-                        <b>🔧 Tool Result:</b><br><pre style='margin: 5px 0; font-size: 9pt;'>{self._escape_html(content)}</pre>
-                    </span>
-                </div>
-                """)
-        
-        html = "<html><body style='font-family: Segoe UI, Arial;'>" + "".join(html_parts) + "</body></html>"
-        self.chatDisplay.setHtml(html)
-        
-        # Scroll to bottom
-        cursor = self.chatDisplay.textCursor()
-        cursor.movePosition(QtGui.QTextCursor.End)
-        self.chatDisplay.setTextCursor(cursor)
-    
-    def _escape_html(self, text: str) -> str:
-        """Escape HTML but preserve newlines"""
-        import html
-        return html.escape(text).replace("\n", "<br>")
+        """Show messages added to the store and scroll to the bottom"""
+        self.chatView.sync()
     
+    def _provider_cfg(self) -> Dict[str, Any]:
+        provider_cfg = provider_config(self.cfg, self.cfg["provider"])
+        provider_cfg["summary_language"] = self.cfg["ui"].get("summary_language", "vi")
+        return provider_cfg
+
     def _send_message(self):
+        if self._generation:
+            return
         user_msg = self.txtInput.toPlainText().strip()
         if not user_msg:
             return
         
         # Add user message
-        self.messages.append({"role": "user", "content": user_msg})
+        self.store.append({"role": "user", "content": user_msg})
         self.txtInput.clear()
         self._display_messages()
-        self._save_history()
-        
-        # Disable send button
-        self.btnSend.setEnabled(False)
-        self.btnMCP.setEnabled(False)
-        
-        # Stream AI response
-        try:
-            provider_cfg = self.cfg[self.cfg["provider"]].copy()
-            provider_cfg["summary_language"] = self.cfg["ui"].get("summary_language", "vi")
-            
-            # Accumulate streaming content
-            thinking_text = ""
-            content_text = ""
-            
-            # Stream chunks
-            for chunk in self.provider.chat_stream(self.messages, provider_cfg):
-                if chunk["type"] == "thinking":
-                    thinking_text += chunk["text"]
-                else:
-                    content_text += chunk["text"]
-                
-                # Update display in real-time
-                self._update_streaming_message(thinking_text, content_text)
-                QtWidgets.QApplication.processEvents()
-            
-            # Finalize message
-            self.messages.append({
-                "role": "assistant",
-                "content": content_text,
-                "thinking": thinking_text
-            })
-            self._display_messages()
-            self._save_history()
-        
-        except Exception as e:
-            logging.error(f"Chat stream error: {e}", exc_info=True)
-            error_msg = f"❌ Error: {str(e)}"
-            self.messages.append({"role": "assistant", "content": error_msg})
-            self._display_messages()
-        
-        finally:
-            self.btnSend.setEnabled(True)
-            self.btnMCP.setEnabled(True)
+        self._start_generation(self.messages[-1])
     
+    def _regenerate(self):
+        """Bỏ câu trả lời cuối và sinh lại, dùng lại context đã dựng cho lượt đó."""
+        if self._generation or len(self.messages) < 2:
+            return
+        user, answer = self.messages[-2], self.messages[-1]
+        if user.role != "user" or answer.role != "assistant":
+            return
+        context = None
+        if self._last_context and self._last_context[0] is user:
+            context = self._last_context[1]
+        self.store.pop()
+        self._display_messages()
+        self._start_generation(user, context)
+
+    def _start_generation(self, user: Message, context: Optional[List[Dict[str, str]]] = None):
+        gen = ChatGeneration(self.provider, self._provider_cfg(), user,
+                             lambda: self._context_messages(user.content), context, self.activity)
+        gen.progress.connect(self._on_generation_progress)
+        gen.finished.connect(self._on_generation_finished)
+        self._generation = gen
+        self._set_generating(True)
+        gen.start()
+
+    def _stop_generation(self):
+        if self._generation:
+            self._generation.stop()
+
+    def _on_generation_progress(self):
+        if self._generation:
+            self._update_streaming_message(*self._generation.take())
+
+    def _on_generation_finished(self, error: str):
+        gen, self._generation = self._generation, None
+        if gen is None:
+            return
+        thinking, content = gen.take()
+        if gen.context is not None:
+            self._last_context = (gen.user, gen.context)
+        if error:
+            self.store.append({"role": "assistant", "content": f"❌ Error: {error}"}, save=False)
+        elif content or thinking:
+            # Dừng giữa chừng vẫn giữ phần đã nhận
+            self.store.append({"role": "assistant", "content": content, "thinking": thinking})
+            if not gen.cancelled:
+                self._remember_turn(gen.user.content, content)
+        self._set_generating(False)
+        self._display_messages()
+        deferred, self._deferred_context = self._deferred_context, []
+        for text in deferred:
+            self.add_context(text)
+
+    def _set_generating(self, running: bool):
+        self.btnSend.setVisible(not running)
+        self.btnStop.setVisible(running)
+        for btn in (self.btnRegenerate, self.btnClear, self.btnMCP):
+            btn.setEnabled(not running)
+
+    def hideEvent(self, event):
+        # Đóng cửa sổ giữa chừng: dừng stream, phần đã nhận vẫn được lưu
+        self._stop_generation()
+        super().hideEvent(event)
+
     def _update_streaming_message(self, thinking: str, content: str):
-        """Update chat display with streaming content"""
-        # Build HTML for streaming message
-        thinking_clean = thinking.replace("<think>", "").replace("</think>", "").strip()
-        
-        html_parts = []
-        for msg in self.messages:
-            role = msg["role"]
-            msg_content = msg["content"]
-            
-            if role == "user":
-                html_parts.append(f"""
-                <div style='margin: 10px 0; text-align: right;'>
-                    <span style='background: #0084ff; color: white; padding: 8px 12px; 
-                                 border-radius: 15px; display: inline-block; max-width: 70%;
-                                 text-align: left;'>
-                        <b>👤 You:</b><br>{self._escape_html(msg_content)}
-                    </span>
-                </div>
-                """)
-            elif role == "assistant":
-                msg_thinking = msg.get("thinking", "")
-                msg_thinking_clean = msg_thinking.replace("<think>", "").replace("</think>", "").strip()
-                html_parts.append(f"""
-                <div style='margin: 10px 0;'>
-                    <span style='background: #e4e6eb; color: black; padding: 8px 12px; 
-                                 border-radius: 15px; display: inline-block; max-width: 70%;'>
-                        <b>🤖 AI:</b><br>
-                        {f"<details style='margin: 5px 0;'><summary style='color: #856404; cursor: pointer; font-size: 9pt;'>💭 Thinking...</summary><div style='background: #fff3cd; padding: 6px 8px; margin-top: 5px; border-radius: 5px; font-size: 9pt; color: #856404;'>{self._escape_html(msg_thinking_clean)}</div></details>" if msg_thinking_clean else ""}
-                        {self._escape_html(msg_content)}
-                    </span>
-                </div>
-                """)
-            elif role == "tool":
-                html_parts.append(f"""
-                <div style='margin: 10px 0;'>
-                    <span style='background: #fff3cd; color: #856404; padding: 8px 12px; 
-                                 border-radius: 15px; display: inline-block; max-width: 70%;
-                                 border: 1px dashed #ffc107;'>
-                        <b>🔧 Tool Result:</b><br><pre style='margin: 5px 0; font-size: 9pt;'>{self._escape_html(msg_content)}</pre>
-                    </span>
-                </div>
-                """)
-        
-        # Add streaming message
+        """Update the in-progress AI message (only that row is re-laid out)"""
         if content or thinking:
-            html_parts.append(f"""
-            <div style='margin: 10px 0;'>
-                <span style='background: #e4e6eb; color: black; padding: 8px 12px; 
-                             border-radius: 15px; display: inline-block; max-width: 70%;'>
-                    <b>🤖 AI:</b> <i style='color: #666;'>typing...</i><br>
-                    {f"<div style='background: #fff3cd; padding: 4px 8px; margin: 4px 0; border-radius: 5px; font-size: 9pt; color: #856404;'>💭 {self._escape_html(thinking_clean)}</div>" if thinking_clean else ""}
-                    {self._escape_html(content)}<span style='animation: blink 1s infinite;'>▊</span>
-                </span>
-            </div>
-            """)
-        
-        html = "<html><head><style>@keyframes blink { 50% { opacity: 0; } }</style></head><body style='font-family: Segoe UI, Arial;'>" + "".join(html_parts) + "</body></html>"
-        self.chatDisplay.setHtml(html)
-        
-        # Scroll to bottom
-        cursor = self.chatDisplay.textCursor()
-        cursor.movePosition(QtGui.QTextCursor.End)
-        self.chatDisplay.setTextCursor(cursor)
+            self.chatView.set_pending(thinking, content)
     
     def _open_mcp_tools(self):
         """Open MCP tools dialog and add result to chat"""
+        if self._generation:
+            return
         if not self.mcp or not self.mcp.sessions:
             QtWidgets.QMessageBox.warning(self, "MCP", "MCP chưa được kích hoạt hoặc không có server nào kết nối.")
             return
@@ -290,24 +300,30 @@ class ChatWindow(QtWidgets.QDialog):
         dlg = MCPPanel(self.mcp, self)
         if dlg.exec() == QtWidgets.QDialog.Accepted:
             if dlg.extra_context:
-                # Add tool result as a message
-                self.messages.append({"role": "tool", "content": dlg.extra_context})
+                # Add tool result as a message (rút gọn nếu quá dài)
+                content, reduced = reduce_text(dlg.extra_context, self.cfg.get("mcp", {}).get("max_result_tokens", 1500))
+                if reduced:
+                    content = f"{retained_note(reduced)}\n\n{content}"
+                self.store.append({"role": "tool", "content": content})
+                if self.memory:
+                    self.memory.remember("mcp", dlg.extra_context)
                 self._display_messages()
-                self._save_history()
     
     def _clear_history(self):
+        if self._generation:
+            return
         reply = QtWidgets.QMessageBox.question(
             self, "Clear History",
             "Bạn có chắc muốn xóa toàn bộ lịch sử chat?",
             QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
         )
-        if reply == QtWidgets.QMessageBox.Yes:
-            self.messages = []
+        if reply == QtWidgets.QMessageBox.Yes and not self._generation:
+            self._last_context = None
+            self.store.clear()
             self._display_messages()
-            self._save_history()
     
     def _export_chat(self):
-        if not self.messages:
+        if not self.messages and not self.store.older_count():
             QtWidgets.QMessageBox.information(self, "Export", "Không có tin nhắn để export.")
             return
         
@@ -323,7 +339,7 @@ class ChatWindow(QtWidgets.QDialog):
             content.append("=" * 50)
             content.append("")
             
-            for msg in self.messages:
+            for msg in self.store.snapshot():
                 role = msg["role"]
                 if role == "user":
                     content.append("👤 YOU:")
@@ -337,35 +353,65 @@ class ChatWindow(QtWidgets.QDialog):
             Path(path).write_text("\n".join(content), encoding="utf-8")
             QtWidgets.QMessageBox.information(self, "Export", f"Chat đã được export: {path}")
     
-    def _load_history(self):
-        """Load chat history from file"""
-        history_path = Path("chat_history.json")
-        if history_path.exists():
-            try:
-                data = json.loads(history_path.read_text(encoding="utf-8"))
-                self.messages = data.get("messages", [])
-            except Exception:
-                self.messages = []
-        else:
-            self.messages = []
-    
-    def _save_history(self):
-        """Save chat history to file"""
-        history_path = Path("chat_history.json")
-        data = {"messages": self.messages}
-        history_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    def _context_messages(self, user_msg: str) -> List[Dict[str, str]]:
+        """Messages gửi cho model: vài lượt gần nhất + các đoạn liên quan từ
+        semantic index (chèn vào câu hỏi cuối). Chạy trên worker của generation."""
+        chat_cfg = self.cfg.get("chat", {})
+        return self.store.context_messages(user_msg, self.memory, chat_cfg.get("history_messages", 8),
+                                           chat_cfg.get("retrieval_k", 4))
+
+    def _remember_turn(self, question: str, answer: str):
+        if self.memory and answer:
+            return self.memory.remember("chat", f"User: {question}\nAssistant: {answer}", question=question)
+        return None
+
+    def _index_history(self):
+        """Đưa các lượt chat cũ vào index (lượt đã có sẽ được bỏ qua). Đọc cả
+        lịch sử nên chạy ở thread nền, không chặn lúc mở cửa sổ."""
+        if not self.memory:
+            return
+        threading.Thread(target=self._index_messages, name="history-index", daemon=True).start()
+
+    def _index_messages(self):
+        """Chỉ đọc các tin nhắn sau lần index trước (vị trí lưu trong state của
+        index); lịch sử ngắn hơn vị trí đó (đã Clear) thì index lại từ đầu.
+        Vị trí chỉ tiến tới hết các lượt đã embed xong: lượt embed lỗi (server
+        tắt, chưa có embed model) được thử lại ở lần sau."""
+        history = self.store.snapshot()
+        start = self.memory.index.state.get("chat_history", 0)
+        if start > len(history):
+            start = 0
+        question = None
+        queued = []  # (vị trí sau tin nhắn, Future hoặc None)
+        for i in range(start, len(history)):
+            msg = history[i]
+            if msg["role"] == "user":
+                question = msg["content"]
+                continue
+            fut = None
+            if msg["role"] == "assistant" and question:
+                fut = self._remember_turn(question, msg["content"])
+            elif msg["role"] == "tool":
+                fut = self.memory.remember("mcp", msg["content"])
+            question = None
+            queued.append((i + 1, fut))
+        done = start
+        for end, fut in queued:
+            if fut is not None and not fut.result():
+                break
+            done = end
+        if done != start:
+            self.memory.index.set_state("chat_history", done)
 
     def add_context(self, text: str):
         """Add context (e.g. summary result) as an AI message if not already present"""
+        if self._generation:
+            # Không chen vào giữa câu hỏi và câu trả lời đang sinh
+            self._deferred_context.append(text)
+            return
         # Check if the last message is the same to avoid duplicates
         if self.messages and self.messages[-1]["content"] == text:
             return
             
-        self.messages.append({"role": "assistant", "content": text})
+        self.store.append({"role": "assistant", "content": text})
         self._display_messages()
-        self._save_history()
-        
-        # Scroll to bottom
-        cursor = self.chatDisplay.textCursor()
-        cursor.movePosition(QtGui.QTextCursor.End)
-        self.chatDisplay.setTextCursor(cursor)
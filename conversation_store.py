@@ -0,0 +1,413 @@
+# conversation_store.py
+"""
+Lịch sử chat dùng chung giữa ChatWindow và daemon HTTP (chat_history.jsonl).
+
+Store giữ list messages duy nhất trong RAM; mọi thay đổi đi qua các method
+có lock để ChatWindow và daemon không ghi đè lẫn nhau. Khi load chỉ đọc trang
+cuối (page_size tin nhắn); các dòng cũ hơn chỉ được đánh dấu vị trí byte
+trong file và đọc theo trang bằng load_older() khi người dùng cuộn lên.
+
+Mỗi tin nhắn là một Message (__slots__, role được intern). Nội dung lớn
+(kết quả tool, phần thinking) nằm trong BlobStore trên đĩa, đánh địa chỉ
+theo sha256; Message chỉ giữ hash và đọc lại khi cần (hiển thị, dựng
+context, export). File lịch sử là JSONL ghi nối tiếp: thêm một tin nhắn chỉ
+ghi thêm một dòng thay vì serialize lại toàn bộ. Blob không còn dòng nào
+trỏ tới (tin nhắn bị pop, ghi lại file) được dọn khi load() và save().
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
+
+# Nội dung dài hơn mức này được đưa ra blob store
+INLINE_CHARS = 4096
+# Thinking không bao giờ được gửi lại cho model, chỉ hiển thị khi mở ra
+INLINE_THINKING_CHARS = 256
+# Số tin nhắn đọc vào RAM khi mở lịch sử / mỗi lần cuộn lên
+PAGE_SIZE = 100
+_REF_KEYS = ("content_ref", "thinking_ref")
+
+
+def _record_refs(line: bytes) -> Iterable[str]:
+    """Hash blob mà một dòng JSONL trỏ tới (chỉ parse dòng có khoá *_ref)."""
+    if b'_ref"' not in line:
+        return ()
+    try:
+        rec = json.loads(line)
+    except ValueError:
+        return ()
+    return [rec[k] for k in _REF_KEYS if rec.get(k)]
+
+
+class BlobStore:
+    """Kho nội dung theo hash (sha256) trong một thư mục, có LRU nhỏ trong RAM."""
+
+    def __init__(self, root: Union[str, Path], cache_entries: int = 32):
+        self.root = Path(root)
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key[2:]
+
+    def put(self, text: str) -> str:
+        data = text.encode("utf-8")
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return key
+
+    def get(self, key: str) -> str:
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        try:
+            text = self._path(key).read_text(encoding="utf-8")
+        except OSError as e:
+            logging.error(f"[History] Missing blob {key}: {e}")
+            return ""
+        with self._lock:
+            self._cache[key] = text
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return text
+
+    def head(self, key: str, chars: int) -> str:
+        """chars ký tự đầu, không đọc cả blob (dùng để hiển thị rút gọn)."""
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key][:chars]
+        try:
+            with self._path(key).open("rb") as fh:
+                return fh.read(chars * 4).decode("utf-8", errors="ignore")[:chars]
+        except OSError:
+            return ""
+
+    def sweep(self, live: Set[str]) -> int:
+        """Xoá các blob không có trong live (mark-and-sweep); trả về số blob đã xoá."""
+        removed = 0
+        if not self.root.is_dir():
+            return removed
+        for folder in self.root.iterdir():
+            if not folder.is_dir():
+                continue
+            for path in folder.iterdir():
+                key = folder.name + path.name
+                # .tmp: put() đang ghi dở
+                if path.suffix == ".tmp" or key in live:
+                    continue
+                try:
+                    path.unlink()
+                    removed += 1
+                except OSError:
+                    continue
+                with self._lock:
+                    self._cache.pop(key, None)
+            try:
+                folder.rmdir()  # chỉ xoá được khi đã rỗng
+            except OSError:
+                pass
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class Message:
+    """Một tin nhắn chat. Đọc như dict (msg["role"], msg.get("thinking", ""))
+    để view, context builder, exporter và daemon dùng chung một giao diện."""
+
+    __slots__ = ("role", "_content", "content_ref", "content_len", "_thinking", "thinking_ref", "_blobs")
+
+    def __init__(self, role: str, content: str = "", thinking: str = "", blobs: Optional[BlobStore] = None,
+                 content_ref: Optional[str] = None, content_len: Optional[int] = None,
+                 thinking_ref: Optional[str] = None):
+        self.role = sys.intern(role)
+        self._blobs = blobs
+        content, thinking = content or "", thinking or ""
+        if content_ref is None and blobs is not None and len(content) > INLINE_CHARS:
+            content_ref = blobs.put(content)
+        self.content_ref = content_ref
+        self._content = None if content_ref else content
+        self.content_len = len(content) if content_len is None else content_len
+        if thinking_ref is None and blobs is not None and len(thinking) > INLINE_THINKING_CHARS:
+            thinking_ref = blobs.put(thinking)
+        self.thinking_ref = thinking_ref
+        self._thinking = None if thinking_ref else thinking
+
+    @property
+    def content(self) -> str:
+        return self._content if self.content_ref is None else self._blobs.get(self.content_ref)
+
+    @property
+    def thinking(self) -> str:
+        return self._thinking if self.thinking_ref is None else self._blobs.get(self.thinking_ref)
+
+    def preview(self, chars: int, field: str = "content") -> str:
+        """Nội dung (hoặc thinking) rút gọn để hiển thị; blob lớn chỉ đọc phần đầu."""
+        ref = self.content_ref if field == "content" else self.thinking_ref
+        if ref is None:
+            text = self._content if field == "content" else self._thinking
+            if len(text) <= chars:
+                return text
+            return f"{text[:chars]}\n… ({len(text):,} ký tự)"
+        size = self.content_len if field == "content" else None
+        if size is not None and size <= chars:
+            return self._blobs.get(ref)
+        head = self._blobs.head(ref, chars + 1)
+        if len(head) <= chars:
+            return head
+        return f"{head[:chars]}\n… ({f'{size:,} ký tự, ' if size else ''}xem đầy đủ khi Export)"
+
+    def __getitem__(self, key: str) -> str:
+        if key in ("role", "content", "thinking"):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def refs(self) -> List[str]:
+        return [ref for ref in (self.content_ref, self.thinking_ref) if ref]
+
+    def to_dict(self) -> Dict[str, str]:
+        """Nội dung đầy đủ (đọc cả blob) cho client ngoài, vd. GET /v1/history."""
+        return {"role": self.role, "content": self.content, "thinking": self.thinking}
+
+    def to_record(self) -> Dict[str, Any]:
+        """Dòng JSONL: nội dung lớn chỉ ghi hash."""
+        rec: Dict[str, Any] = {"role": self.role}
+        if self.content_ref:
+            rec["content_ref"] = self.content_ref
+            rec["content_len"] = self.content_len
+        else:
+            rec["content"] = self._content
+        if self.thinking_ref:
+            rec["thinking_ref"] = self.thinking_ref
+        elif self._thinking:
+            rec["thinking"] = self._thinking
+        return rec
+
+    @classmethod
+    def from_record(cls, rec: Dict[str, Any], blobs: Optional[BlobStore]) -> "Message":
+        return cls(rec.get("role", "user"), rec.get("content", ""), rec.get("thinking", ""), blobs,
+                   content_ref=rec.get("content_ref"), content_len=rec.get("content_len"),
+                   thinking_ref=rec.get("thinking_ref"))
+
+
+class ConversationStore:
+    def __init__(self, path: str = "chat_history.jsonl", page_size: int = PAGE_SIZE):
+        self.path = Path(path)
+        self.page_size = page_size
+        self.lock = threading.RLock()
+        self.blobs = BlobStore(self.path.with_name(self.path.stem + "_blobs"))
+        # Trang đã đọc (cuối lịch sử); vị trí byte của các dòng cũ hơn chưa đọc
+        self.messages: List[Message] = []
+        self._older = array("q")
+        self.load()
+
+    def _message(self, message: Union[Message, Dict[str, Any]]) -> Message:
+        if isinstance(message, Message):
+            return message
+        return Message(message["role"], message.get("content", ""), message.get("thinking", ""), self.blobs)
+
+    def load(self):
+        """Đọc trang cuối của lịch sử; phần cũ hơn chỉ được index theo offset."""
+        with self.lock:
+            data: List[Message] = []
+            older = array("q")
+            refs: Optional[Set[str]] = None
+            try:
+                if not self.path.exists():
+                    self._migrate_legacy()
+                if self.path.exists():
+                    refs = set()
+                    offsets = self._line_offsets(refs)
+                    split = max(0, len(offsets) - self.page_size)
+                    older = offsets[:split]
+                    data = self._read(offsets[split:])
+            except Exception as e:
+                logging.error(f"[History] Failed to load {self.path}: {e}")
+                refs = None  # không biết hết các dòng: không dọn blob
+            self._older = older
+            # Giữ nguyên object list để các view đang tham chiếu thấy dữ liệu mới
+            self.messages[:] = data
+            if refs is not None:
+                self._sweep_blobs(refs)
+
+    def _line_offsets(self, refs: Optional[Set[str]] = None) -> array:
+        """Vị trí byte đầu mỗi dòng không rỗng; refs nhận hash blob các dòng trỏ tới."""
+        offsets = array("q")
+        pos = 0
+        with self.path.open("rb") as fh:
+            for line in fh:
+                if line.strip():
+                    offsets.append(pos)
+                    if refs is not None:
+                        refs.update(_record_refs(line))
+                pos += len(line)
+        return offsets
+
+    def _sweep_blobs(self, refs: Set[str]):
+        """Xoá blob không còn dòng nào trong file hay tin nhắn nào trong RAM trỏ tới."""
+        for m in self.messages:
+            refs.update(m.refs())
+        try:
+            removed = self.blobs.sweep(refs)
+        except OSError as e:
+            logging.warning(f"[History] Blob cleanup failed: {e}")
+            return
+        if removed:
+            logging.info(f"[History] Removed {removed} unreferenced blobs")
+
+    def _read(self, offsets) -> List[Message]:
+        out: List[Message] = []
+        if not offsets:
+            return out
+        with self.path.open("rb") as fh:
+            for off in offsets:
+                fh.seek(off)
+                out.append(Message.from_record(json.loads(fh.readline()), self.blobs))
+        return out
+
+    def older_count(self) -> int:
+        """Số tin nhắn cũ hơn trang đang có trong RAM."""
+        return len(self._older)
+
+    def load_older(self, count: Optional[int] = None) -> int:
+        """Đọc thêm count tin nhắn cũ hơn vào đầu self.messages; trả về số đã đọc."""
+        with self.lock:
+            count = self.page_size if count is None else count
+            split = max(0, len(self._older) - count)
+            try:
+                data = self._read(self._older[split:])
+            except Exception as e:
+                logging.error(f"[History] Failed to read older messages: {e}")
+                return 0
+            del self._older[split:]
+            self.messages[:0] = data
+            return len(data)
+
+    def _migrate_legacy(self):
+        """chat_history.json cũ ({"messages": [...]}) -> JSONL + blob store."""
+        legacy = self.path.with_suffix(".json")
+        if legacy == self.path or not legacy.exists():
+            return
+        data = [self._message(m) for m in json.loads(legacy.read_text(encoding="utf-8")).get("messages", [])]
+        self.messages[:] = data
+        self._older = array("q")
+        self.save()
+        legacy.replace(legacy.with_suffix(".json.bak"))
+        logging.info(f"[History] Migrated {len(data)} messages from {legacy} to {self.path}")
+
+    def save(self):
+        """Ghi lại toàn bộ file (compaction). append() chỉ ghi thêm một dòng.
+        Các dòng cũ chưa đọc được chép nguyên văn."""
+        with self.lock:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            older = array("q")
+            refs: Set[str] = set()
+            pos = 0
+            with tmp.open("wb") as out:
+                if self._older:
+                    with self.path.open("rb") as src:
+                        for off in self._older:
+                            src.seek(off)
+                            line = src.readline().rstrip(b"\r\n") + b"\n"
+                            refs.update(_record_refs(line))
+                            older.append(pos)
+                            out.write(line)
+                            pos += len(line)
+                for m in self.messages:
+                    out.write((json.dumps(m.to_record(), ensure_ascii=False) + "\n").encode("utf-8"))
+            os.replace(tmp, self.path)
+            self._older = older
+            self._sweep_blobs(refs)
+
+    def append(self, message: Union[Message, Dict[str, Any]], save: bool = True):
+        with self.lock:
+            message = self._message(message)
+            self.messages.append(message)
+            if save:
+                with self.path.open("a", encoding="utf-8") as fh:
+                    fh.write(json.dumps(message.to_record(), ensure_ascii=False) + "\n")
+
+    def pop(self) -> Optional[Message]:
+        """Bỏ tin nhắn cuối (Regenerate): cắt dòng cuối của file thay vì ghi lại cả file.
+        Blob của tin nhắn được dọn ở lần load()/save() sau (có thể vẫn đang hiển thị)."""
+        with self.lock:
+            if not self.messages:
+                return None
+            message = self.messages.pop()
+            try:
+                self._drop_last_line(message)
+            except (OSError, ValueError) as e:
+                logging.warning(f"[History] Cannot truncate {self.path}, rewriting: {e}")
+                self.save()
+            return message
+
+    def _drop_last_line(self, message: Message):
+        if not self.path.exists():
+            return
+        with self.path.open("r+b") as fh:
+            size = fh.seek(0, os.SEEK_END)
+            # Dòng inline dài nhất ~ INLINE_CHARS ký tự UTF-8 + thinking + khoá JSON
+            start = max(0, size - (INLINE_CHARS + INLINE_THINKING_CHARS) * 4 - 4096)
+            fh.seek(start)
+            body = fh.read().rstrip(b"\r\n")
+            cut = body.rfind(b"\n") + 1
+            if cut == 0 and start > 0:
+                raise ValueError("last line longer than expected")
+            # Tin nhắn lỗi (append save=False) không có trên đĩa
+            if body and json.loads(body[cut:]) == message.to_record():
+                fh.truncate(start + cut)
+
+    def clear(self):
+        with self.lock:
+            self._older = array("q")
+            del self.messages[:]
+            self.save()
+            self.blobs.clear()
+
+    def context_messages(self, query: str, memory=None, history_messages: int = 8,
+                         retrieval_k: int = 4) -> List[Union[Message, Dict[str, str]]]:
+        """Messages gửi cho model (ChatWindow và daemon): history_messages tin
+        nhắn gần nhất + các đoạn liên quan từ semantic index (memory) chèn vào
+        tin nhắn cuối. Chỉ dùng trang đang có trong RAM, không đọc lịch sử cũ."""
+        with self.lock:
+            window = self.messages[-history_messages:]
+        if not memory or not window:
+            return window
+        recent = {m["content"] for m in window if m["role"] == "user"}
+        hits = memory.recall(query, retrieval_k, exclude=lambda m: m.get("question") in recent)
+        if not hits:
+            return window
+        snippets = "\n\n".join(f"[{h['kind']}] {h['text']}" for h in hits)
+        last = window[-1]
+        return window[:-1] + [{
+            "role": last["role"],
+            "content": f"Ngữ cảnh liên quan từ lịch sử:\n{snippets}\n\n---\n{last['content']}",
+        }]
+
+    def snapshot(self) -> List[Message]:
+        """Toàn bộ lịch sử (cả phần chưa đọc vào RAM, không giữ lại sau khi trả về)."""
+        with self.lock:
+            return self._read(self._older) + list(self.messages)
@@ -0,0 +1,310 @@
+# daemon.py
+"""
+Daemon HTTP cục bộ (asyncio, không cần thư viện ngoài) cho Chrome extension
+và các client khác. Dùng chung SummarizerEngine (provider, scheduler, result
+cache, conversation store) với tray app.
+
+Endpoints:
+    GET  /v1/health
+    GET  /v1/history                      lịch sử chat dùng chung
+    POST /v1/summarize {"text", "action"?, "prompt"?, "stream"?, "use_cache"?}
+    POST /v1/chat      {"message", "conversation"?, "stream"?}   (ghi vào lịch sử)
+                       {"messages": [...], "stream"?}           (stateless)
+
+Khi "stream": true, response là server-sent events:
+    data: {"type": "content"|"thinking", "text": "..."}
+    data: {"type": "done", "prompt_tokens", "completion_tokens", "finish_reason"}
+          | {"type": "error", "message": "..."}
+Kết quả lấy từ result cache: finish_reason "cached" kèm "cached": true, "similar".
+
+Mọi kết nối chạy trên một event loop; lời gọi model chạy trong worker của
+scheduler nên số thread không tăng theo số client.
+"""
+import asyncio
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from engine import SummarizerEngine
+from provider_registry import provider_info
+from providers import StreamCancel
+from stream_decoder import StreamChunk
+
+MAX_BODY = 8 * 1024 * 1024
+STATUS_TEXT = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class DaemonServer:
+    def __init__(self, engine: SummarizerEngine, host: str = "127.0.0.1", port: int = 8765):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- lifecycle ----
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logging.info(f"[Daemon] Listening on http://{self.host}:{self.port}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    def run_forever(self):
+        """Chạy blocking (chế độ headless)."""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    def start_in_thread(self):
+        """Chạy nền cùng tray app (một thread cho event loop)."""
+        self._thread = threading.Thread(target=self.run_forever, name="daemon-loop", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self.loop and self._server:
+            self.loop.call_soon_threadsafe(self._server.close)
+
+    # ---- HTTP ----
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        origin = ""
+        try:
+            method, path, headers, body = await self._read_request(reader)
+            origin = headers.get("origin", "")
+            if method == "OPTIONS":
+                await self._send(writer, 204, b"", origin=origin)
+                return
+            route = self._route(method, path)
+            payload = json.loads(body) if body else {}
+            if not isinstance(payload, dict):
+                raise HTTPError(400, "JSON body must be an object")
+            await route(reader, writer, payload, origin)
+        except HTTPError as e:
+            await self._send_json(writer, e.status, {"error": str(e)}, origin)
+        except json.JSONDecodeError as e:
+            await self._send_json(writer, 400, {"error": f"Invalid JSON: {e}"}, origin)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logging.error(f"[Daemon] Request failed: {e}", exc_info=True)
+            try:
+                await self._send_json(writer, 500, {"error": str(e)}, origin)
+            except Exception:
+                pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY:
+            raise HTTPError(413, "Body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], headers, body
+
+    def _route(self, method: str, path: str) -> Callable:
+        routes = {
+            ("GET", "/v1/health"): self._health,
+            ("GET", "/v1/history"): self._history,
+            ("POST", "/v1/summarize"): self._summarize,
+            ("POST", "/v1/chat"): self._chat,
+        }
+        if (method, path) in routes:
+            return routes[(method, path)]
+        if any(p == path for _m, p in routes):
+            raise HTTPError(405, f"{method} not allowed on {path}")
+        raise HTTPError(404, f"Unknown path {path}")
+
+    def _headers(self, status: int, content_type: str, length: Optional[int], origin: str) -> bytes:
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", f"Content-Type: {content_type}",
+                 "Connection: close", "Cache-Control: no-cache"]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        # Chỉ cho phép extension gọi cross-origin
+        if origin.startswith("chrome-extension://"):
+            lines += [f"Access-Control-Allow-Origin: {origin}",
+                      "Access-Control-Allow-Methods: GET, POST, OPTIONS",
+                      "Access-Control-Allow-Headers: Content-Type"]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send(self, writer, status: int, body: bytes, content_type: str = "application/json", origin: str = ""):
+        writer.write(self._headers(status, content_type, len(body), origin) + body)
+        await writer.drain()
+
+    async def _send_json(self, writer, status: int, data: Any, origin: str = ""):
+        await self._send(writer, status, json.dumps(data, ensure_ascii=False).encode("utf-8"), origin=origin)
+
+    async def _send_sse(self, reader, writer, gen_factory: Callable[[StreamCancel], Iterator[StreamChunk]],
+                        origin: str) -> Dict[str, str]:
+        """Chạy generator trong scheduler, đẩy từng chunk ra client dạng SSE.
+        Trả về text đã gom (content/thinking). Client ngắt kết nối sẽ huỷ generation:
+        StreamCancel đóng HTTP stream tới model ngay, kể cả khi model chưa trả token nào."""
+        writer.write(self._headers(200, "text/event-stream; charset=utf-8", None, origin))
+        await writer.drain()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancel = StreamCancel()
+        loop = asyncio.get_running_loop()
+
+        def pump():
+            try:
+                if cancel.cancelled:
+                    return
+                for chunk in gen_factory(cancel):
+                    if cancel.cancelled:
+                        break  # đóng generator -> đóng HTTP stream tới model
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except Exception as e:
+                if not cancel.cancelled:
+                    loop.call_soon_threadsafe(queue.put_nowait, {"type": "error", "message": str(e)})
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        async def watch_client():
+            # Client không gửi gì thêm sau body: EOF/RST = đã ngắt kết nối
+            try:
+                while await reader.read(4096):
+                    pass
+            except ConnectionError:
+                pass
+            cancel.cancel()
+
+        self.engine.scheduler.submit(pump)
+        watcher = asyncio.ensure_future(watch_client())
+        collected = {"content": "", "thinking": "", "error": ""}
+        done: Dict[str, Any] = {"type": "done"}
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    if cancel.cancelled:
+                        raise ConnectionError("client disconnected")
+                    break
+                if isinstance(chunk, dict):  # lỗi từ pump()
+                    collected["error"] = chunk["message"]
+                    event = chunk
+                elif chunk.type == "done":
+                    done = chunk.to_dict()
+                    if chunk.finish_reason == "cached":
+                        done.update(cached=True, similar=chunk.raw.get("similar"))
+                    continue
+                else:
+                    collected[chunk.type] += chunk.text
+                    event = chunk.to_dict()
+                writer.write(b"data: " + json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n\n")
+                await writer.drain()
+            writer.write(b"data: " + json.dumps(done, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            cancel.cancel()
+            raise
+        finally:
+            watcher.cancel()
+        return collected
+
+    # ---- routes ----
+
+    async def _health(self, reader, writer, payload, origin):
+        cfg = self.engine.provider_cfg()
+        await self._send_json(writer, 200, {
+            "ok": True, "provider": self.engine.cfg["provider"], "model": cfg.get("model"),
+            "capabilities": sorted(provider_info(self.engine.cfg["provider"])["capabilities"]),
+            "scheduler": self.engine.scheduler.stats(),
+        }, origin)
+
+    async def _history(self, reader, writer, payload, origin):
+        messages = [m.to_dict() for m in self.engine.conversations.snapshot()]
+        await self._send_json(writer, 200, {"messages": messages}, origin)
+
+    async def _summarize(self, reader, writer, payload, origin):
+        text = payload.get("text", "")
+        if not isinstance(text, str) or not text.strip():
+            raise HTTPError(400, "text is required (string)")
+        action = payload.get("action", "summary")
+        prompt = payload.get("prompt", "")
+        if not isinstance(action, str) or not isinstance(prompt, str):
+            raise HTTPError(400, "action and prompt must be strings")
+        use_cache = payload.get("use_cache", True)
+        if payload.get("stream"):
+            # prepare_action (rút gọn văn bản dài) chạy trong worker, không chặn event loop
+            await self._send_sse(reader, writer, lambda cancel: self.engine.stream_action(
+                self.engine.prepare_action(action, text, prompt), use_cache, cancel=cancel), origin)
+            return
+        fut = self.engine.submit_action(action, text, prompt, use_cache=use_cache)
+        res = await asyncio.wrap_future(fut)
+        await self._send_json(writer, 200, res, origin)
+
+    async def _chat(self, reader, writer, payload, origin):
+        store = self.engine.conversations
+        stateful = "messages" not in payload
+        if stateful:
+            message = payload.get("message", "")
+            if not isinstance(message, str) or not message.strip():
+                raise HTTPError(400, "message is required (string)")
+            store.append({"role": "user", "content": message})
+            # Như ChatWindow: vài lượt gần nhất + đoạn liên quan từ semantic index
+            # (embed câu hỏi -> dựng trong worker, không trên event loop)
+            context = lambda: self.engine.chat_context(message)
+        else:
+            messages = payload["messages"]
+            if not isinstance(messages, list) or not messages:
+                raise HTTPError(400, "messages must be a non-empty list")
+            context = lambda: messages
+
+        if payload.get("stream"):
+            collected = await self._send_sse(reader, writer,
+                                             lambda cancel: self.engine.stream_chat(context(), cancel), origin)
+        else:
+            def run():
+                out = {"content": "", "thinking": "", "error": ""}
+                for chunk in self.engine.stream_chat(context()):
+                    if chunk.type in out:
+                        out[chunk.type] += chunk.text
+                return out
+            collected = await asyncio.wrap_future(self.engine.scheduler.submit(run))
+            await self._send_json(writer, 200, {"text": collected["content"], "thinking": collected["thinking"]}, origin)
+
+        if stateful and not collected["error"]:
+            store.append({"role": "assistant", "content": collected["content"], "thinking": collected["thinking"]})
+
+
+def run_daemon(cfg: Dict[str, Any], host: Optional[str] = None, port: Optional[int] = None):
+    """Chế độ headless: `python app.py --daemon`."""
+    dcfg = cfg.get("daemon", {})
+    engine = SummarizerEngine(cfg)
+    server = DaemonServer(engine, host or dcfg.get("host", "127.0.0.1"), port or dcfg.get("port", 8765))
+    print(f"AI Summarizer daemon: http://{server.host}:{server.port}")
+    try:
+        server.run_forever()
+    finally:
+        engine.shutdown()
@@ -0,0 +1,323 @@
+# engine.py
+"""
+Lớp dịch vụ dùng chung cho tray app, daemon HTTP và các chế độ headless:
+provider hiện tại + scheduler + result cache + conversation store.
+Không import Qt.
+"""
+import contextlib
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, List, Optional
+
+from action_profiles import (GENERATION_KEYS, get_profile, build_messages, build_shared_prefix_messages,
+                             apply_profile, check_latency)
+from conversation_store import ConversationStore
+from near_duplicate import NearDuplicateIndex
+from provider_registry import EMBEDDINGS, KV_REUSE, PARALLEL_SLOTS, load_plugins, provider_config
+from providers import ProviderBase, StreamCancel, make_provider
+from result_cache import ResultCache, request_key
+from scheduler import Scheduler, PRIORITY_INTERACTIVE
+from semantic_index import SemanticIndex, SemanticMemory
+from sessions import ActionSession
+from stream_decoder import StreamChunk, StreamDone
+from text_reducer import reduce_text
+from translation_memory import TranslationMemory
+from traffic_trace import start_recording
+
+# Khoảng trắng cuối dòng (trừ chính ký tự xuống dòng)
+_TRAILING_SPACE = re.compile(r"[^\S\n]+(?=\n|$)")
+
+
+def _normalize_text(text: str) -> str:
+    """Chuẩn hoá xuống dòng (\\r\\n, \\r -> \\n) và bỏ khoảng trắng cuối dòng/đầu-cuối
+    văn bản, để cùng một nội dung (clipboard Windows, file đọc từ đĩa) có cùng cache key."""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return _TRAILING_SPACE.sub("", text).strip()
+
+
+class SummarizerEngine:
+    def __init__(self, cfg: Dict[str, Any]):
+        self.cfg = cfg
+        eng = cfg.get("engine", {})
+        load_plugins(cfg.get("provider_plugins", []))
+        self.provider: ProviderBase = make_provider(cfg["provider"])
+        # Ghi request/response của provider để phát lại offline (traffic_trace.py)
+        if cfg.get("trace", {}).get("record"):
+            start_recording(cfg["trace"].get("dir", "traces"))
+        self.scheduler = Scheduler(self._concurrency())
+        self._watch_slots()
+        # Lời gọi model tương tác chạy ngoài scheduler (chat của ChatWindow)
+        self._interactive = 0
+        self._interactive_lock = threading.Lock()
+        self.cache = ResultCache(eng.get("cache_path", "result_cache.sqlite")) if eng.get("cache", True) else None
+        self.conversations = ConversationStore(eng.get("history_path", "chat_history.jsonl"))
+        # Action nối tiếp trên cùng văn bản tái dùng context token (Ollama)
+        self.sessions = ActionSession() if eng.get("context_reuse", True) else None
+        # Input gần trùng với input trước đó (cùng action) dùng lại kết quả trong cache
+        self.similar = (NearDuplicateIndex(eng.get("near_duplicate_threshold", 0.85))
+                        if self.cache and eng.get("near_duplicate", True) else None)
+        self.memory = self._make_memory(eng)
+        # Bộ nhớ dịch theo câu: chỉ câu mới mới được gửi cho model
+        self.tm = TranslationMemory(eng.get("tm_path", "translation_memory.sqlite")) \
+            if eng.get("translation_memory", True) else None
+
+    def _make_memory(self, eng: Dict[str, Any]):
+        """Chỉ mục ngữ nghĩa của các kết quả cũ (None nếu tắt hoặc thiếu NumPy)."""
+        if not eng.get("semantic_index", True):
+            return None
+        if not self.provider.has(EMBEDDINGS) or not self.provider_cfg().get("embeddings", True):
+            logging.info(f"[Engine] Semantic index disabled: {self.cfg['provider']} has no embeddings")
+            return None
+        try:
+            index = SemanticIndex(eng.get("index_path", "semantic_index"))
+        except Exception as e:
+            logging.warning(f"[Engine] Semantic index disabled: {e}")
+            return None
+        return SemanticMemory(
+            index,
+            embed=lambda texts: self.provider.embed(texts, self.provider_cfg()),
+            model=lambda: f"{self.cfg['provider']}:{self.provider_cfg().get('embed_model', '')}",
+            scheduler=Scheduler(1, name="embed"),
+            busy=self.busy,
+        )
+
+    @contextlib.contextmanager
+    def interactive(self):
+        """Bọc một lời gọi model tương tác không đi qua scheduler để busy() thấy nó."""
+        with self._interactive_lock:
+            self._interactive += 1
+        try:
+            yield
+        finally:
+            with self._interactive_lock:
+                self._interactive -= 1
+
+    def busy(self) -> bool:
+        """Có lời gọi model đang chạy hoặc chờ (scheduler hoặc interactive())."""
+        stats = self.scheduler.stats()
+        return bool(stats["queued"] or stats["active"] or self._interactive)
+
+    # ---- config ----
+
+    def _concurrency(self) -> int:
+        """Số worker của scheduler: engine.max_concurrency, hoặc "auto" = số
+        request provider chạy song song được (slots của llama.cpp, còn lại 1)."""
+        limit = self.cfg.get("engine", {}).get("max_concurrency", "auto")
+        if limit in ("auto", None, 0):
+            return self.provider.parallel_slots(self.provider_cfg())
+        return int(limit)
+
+    def _watch_slots(self):
+        """llama.cpp chưa chạy khi dựng scheduler: đổi số worker khi đọc được số slot."""
+        if self.provider.has(PARALLEL_SLOTS) and hasattr(self.provider, "on_slots"):
+            self.provider.on_slots = lambda _count: self.scheduler.resize(self._concurrency())
+
+    def set_provider(self, name: str):
+        self.cfg["provider"] = name
+        self.provider = make_provider(name)
+        self._watch_slots()
+        if self.sessions:
+            self.sessions.clear()
+        # Hỏi số slot có thể phải gọi server: không chặn thread gọi (menu tray)
+        threading.Thread(target=lambda: self.scheduler.resize(self._concurrency()),
+                         name="provider-slots", daemon=True).start()
+
+    def provider_cfg(self) -> Dict[str, Any]:
+        cfg = provider_config(self.cfg, self.cfg["provider"])
+        cfg["summary_language"] = self.cfg.get("ui", {}).get("summary_language", "vi")
+        cfg["actions"] = self.cfg.get("actions", {})
+        return cfg
+
+    # ---- quick actions ----
+
+    def prepare_action(self, action: str, text: str, prompt: str = "") -> Dict[str, Any]:
+        """Dựng request cho action: profile, messages, cfg sinh và cache key."""
+        base = self.provider_cfg()
+        profile = get_profile(action, base["actions"])
+        text = _normalize_text(text)
+        # Văn bản quá dài: rút gọn trích xuất (TextRank) trước khi gửi cho model
+        model_text, reduced = text, {}
+        if profile.get("reduce_tokens"):
+            model_text, reduced = reduce_text(text, profile["reduce_tokens"])
+        messages = build_messages(profile, model_text, base["summary_language"], prompt)
+        cfg = apply_profile(base, profile, model_text)
+        params = {k: cfg.get(k) for k in GENERATION_KEYS}
+        model = f"{self.cfg['provider']}:{cfg.get('model')}"
+        key = request_key(model, messages, params)
+        # Mọi thứ trừ văn bản: chỉ tái dùng kết quả gần trùng trong cùng scope
+        scope = request_key(model, [{"role": "system", "content": messages[0]["content"]}],
+                            {**params, "action": action, "prompt": prompt})
+        return {"action": action, "text": text, "model_text": model_text, "reduced": reduced,
+                "prompt": prompt, "lang": base["summary_language"],
+                "profile": profile, "messages": messages, "cfg": cfg, "key": key, "scope": scope}
+
+    def prepare_fanout(self, action: str, text: str) -> Dict[str, Any]:
+        """Job cho một action của "Chạy tất cả" (popup), chạy bằng stream_fanout().
+
+        Dịch qua bộ nhớ dịch và action trên provider có context token (session)
+        chạy như action thường - session của Ollama đã cho các action sau chỉ
+        evaluate chỉ dẫn mới. Các job còn lại được stream; với provider kv_reuse,
+        messages đặt văn bản trước chỉ dẫn để các action có chung prefix, kèm
+        cache key và scope gần trùng riêng cho dạng prompt này."""
+        job = self.prepare_action(action, text)
+        job["stream"] = not ((action == "translate" and self.tm)
+                             or (self.sessions and self.provider.supports_context))
+        if job["stream"] and self.provider.has(KV_REUSE):
+            messages = build_shared_prefix_messages(job["profile"], job["model_text"], job["lang"])
+            params = {k: job["cfg"].get(k) for k in GENERATION_KEYS}
+            model = f"{self.cfg['provider']}:{job['cfg'].get('model')}"
+            job["messages"] = messages
+            job["key"] = request_key(model, messages, params)
+            job["scope"] = request_key(model, messages[:1], {**params, "action": action, "prompt": "",
+                                                             "fanout": True})
+        return job
+
+    def cached(self, job: Dict[str, Any]):
+        """Kết quả trong cache cho job: khớp chính xác, hoặc của một input gần
+        trùng (khi đó có thêm "similar": độ tương đồng ước lượng)."""
+        if not self.cache:
+            return None
+        hit = self.cache.get(job["key"])
+        if hit:
+            logging.info(f"[Engine] cache hit for {job['action']}")
+        else:
+            match = self.similar.find(job["scope"], job["model_text"]) if self.similar is not None else None
+            hit = self.cache.get(match[0]) if match else None
+            if hit:
+                logging.info(f"[Engine] near-duplicate hit for {job['action']} (similarity {match[1]:.2f})")
+                hit["similar"] = round(match[1], 2)
+        if hit:
+            hit["cached"] = True
+            if job["reduced"]:
+                hit["reduced"] = job["reduced"]
+        return hit
+
+    def with_context(self, text: str, context: str) -> str:
+        """Văn bản kèm ngữ cảnh MCP (rút gọn nếu dài); ngữ cảnh được ghi nhớ để chat tra cứu."""
+        if not context:
+            return text
+        if self.memory:
+            self.memory.remember("mcp", context)
+        mcp_text, _ = reduce_text(context, self.cfg.get("mcp", {}).get("max_result_tokens", 1500))
+        return (text + "\n\n---\nNgữ cảnh MCP:\n" + mcp_text).strip()
+
+    def submit_action(self, action: str, text: str, prompt: str = "",
+                      priority: int = PRIORITY_INTERACTIVE, use_cache: bool = True, context: str = "") -> Future:
+        # Rút gọn văn bản dài / ngữ cảnh MCP và chữ ký gần trùng tốn hàng chục ms
+        # với input lớn: chạy trong worker, không trên thread gọi (GUI, event loop daemon)
+        return self.scheduler.submit(self._run_action, action, text, prompt, use_cache, context, priority=priority)
+
+    def submit_job(self, job: Dict[str, Any], priority: int = PRIORITY_INTERACTIVE,
+                   use_cache: bool = True) -> Future:
+        """Như submit_action với job đã dựng sẵn (prepare_action)."""
+        return self.scheduler.submit(self._run_job, job, use_cache, priority=priority)
+
+    def _run_action(self, action: str, text: str, prompt: str, use_cache: bool, context: str = "") -> Dict[str, Any]:
+        return self._run_job(self.prepare_action(action, self.with_context(text, context), prompt), use_cache)
+
+    def _run_job(self, job: Dict[str, Any], use_cache: bool) -> Dict[str, Any]:
+        job["use_cache"] = use_cache
+        hit = self.cached(job) if use_cache else None
+        return hit or self._execute(job)
+
+    def run_action(self, action: str, text: str, prompt: str = "",
+                   priority: int = PRIORITY_INTERACTIVE, use_cache: bool = True) -> Dict[str, Any]:
+        """Blocking: trả về {"text", "cached", "prompt_tokens", "completion_tokens", "elapsed_ms"}
+        (+ "saved_prompt_tokens" khi chạy qua session)."""
+        return self.submit_action(action, text, prompt, priority, use_cache).result()
+
+    def _execute(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        if job["action"] == "translate" and self.tm:
+            res = self._translate(job)
+        elif self.sessions and self.provider.supports_context:
+            res = self.sessions.run(self.provider, job)
+        else:
+            res = self.provider.complete(job["messages"], job["cfg"])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        check_latency(job["profile"], elapsed_ms)
+        res = {**res, "cached": False, "elapsed_ms": round(elapsed_ms)}
+        if job["reduced"]:
+            res["reduced"] = job["reduced"]
+        self._store(job, res)
+        return res
+
+    def _translate(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Dịch qua bộ nhớ dịch; mỗi lô câu mới là một lời gọi complete() với profile translate."""
+        def translate_batch(prompt: str) -> Dict[str, Any]:
+            messages = build_messages(job["profile"], prompt, job["lang"])
+            return self.provider.complete(messages, apply_profile(job["cfg"], job["profile"], prompt))
+
+        model = f"{self.cfg['provider']}:{job['cfg'].get('model')}"
+        return self.tm.translate(job["text"], job["lang"], model, translate_batch,
+                                 use_memory=job.get("use_cache", True))
+
+    def _store(self, job: Dict[str, Any], res: Dict[str, Any]):
+        if self.cache and res.get("text") and not res.get("unparsed"):
+            meta = {k: res.get(k, 0) for k in ("prompt_tokens", "completion_tokens")}
+            self.cache.put(job["key"], job["action"], res["text"], meta)
+            if self.similar is not None:
+                self.similar.add(job["scope"], job["model_text"], job["key"])
+        # Kết quả tóm tắt/giải thích được ghi nhớ để chat tra cứu lại
+        if self.memory and res.get("text") and job["action"] in ("summary", "explain", "custom"):
+            self.memory.remember(job["action"], res["text"], source=job["text"][:200])
+
+    def stream_action(self, job: Dict[str, Any], use_cache: bool = True,
+                      cancel: Optional[StreamCancel] = None) -> Iterator[StreamChunk]:
+        """Stream kết quả action (chạy trên thread gọi; daemon đặt nó vào scheduler).
+        Yields StreamChunk của provider; cache hit trả về toàn bộ kết quả trong một
+        chunk, kèm StreamDone(finish_reason="cached")."""
+        hit = self.cached(job) if use_cache else None
+        if hit:
+            yield StreamChunk("content", hit["text"])
+            yield StreamDone(finish_reason="cached", raw={"similar": hit.get("similar")})
+            return
+        started = time.perf_counter()
+        first_token_ms = None
+        parts: List[str] = []
+        usage: Dict[str, Any] = {}
+        for chunk in self.provider.chat_stream(job["messages"], job["cfg"], cancel=cancel):
+            if chunk.type == "done":
+                usage = {"prompt_tokens": chunk.prompt_tokens, "completion_tokens": chunk.completion_tokens}
+            elif first_token_ms is None:
+                first_token_ms = (time.perf_counter() - started) * 1000
+            if chunk.type == "content":
+                parts.append(chunk.text)
+            yield chunk
+        check_latency(job["profile"], (time.perf_counter() - started) * 1000, first_token_ms)
+        self._store(job, {"text": "".join(parts).strip(), **usage})
+
+    def stream_fanout(self, job: Dict[str, Any], cancel: Optional[StreamCancel] = None) -> Iterator[StreamChunk]:
+        """Kết quả job của prepare_fanout(): stream, hoặc một chunk khi job đi
+        qua bộ nhớ dịch / session (StreamDone.raw là kết quả đầy đủ)."""
+        if job["stream"]:
+            yield from self.stream_action(job, cancel=cancel)
+            return
+        res = self._run_job(job, use_cache=True)
+        yield StreamChunk("content", res["text"])
+        yield StreamDone(res.get("prompt_tokens", 0), res.get("completion_tokens", 0),
+                         "cached" if res.get("cached") else None, raw=res)
+
+    # ---- chat ----
+
+    def stream_chat(self, messages: List[Dict[str, str]],
+                    cancel: Optional[StreamCancel] = None) -> Iterator[StreamChunk]:
+        return self.provider.chat_stream(messages, self.provider_cfg(), cancel=cancel)
+
+    def chat_context(self, message: str) -> List[Dict[str, str]]:
+        """Context cho lượt chat mới nhất trong lịch sử dùng chung (như ChatWindow)."""
+        chat_cfg = self.cfg.get("chat", {})
+        return self.conversations.context_messages(message, self.memory, chat_cfg.get("history_messages", 8),
+                                                   chat_cfg.get("retrieval_k", 4))
+
+    def shutdown(self):
+        self.scheduler.shutdown()
+        if self.memory and self.memory.scheduler:
+            self.memory.scheduler.shutdown()
+        if self.cache:
+            self.cache.close()
+        if self.tm:
+            self.tm.close()
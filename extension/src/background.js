@@ -1,5 +1,278 @@
 // src/background.js
 
+// Shared line buffer for NDJSON/SSE streams
+importScripts('stream_render.js');
+
+// Max tokens (≈ 4 chars each) per page section for "Read Entire Page"
+const PAGE_SECTION_TOKENS = 1500;
+
+// ---- LLM requests (all extension model traffic goes through here) ----
+
+const LLM_DEFAULT_CONFIG = {
+    provider: "ollama",
+    endpoint: "http://127.0.0.1:11434",
+    model: "gemma:2b",
+    language: "vi",
+    automation_enabled: false
+};
+
+// Local models serve one generation at a time well; the rest wait in the queue
+const MAX_CONCURRENT_GENERATIONS = 1;
+
+// Quick actions the Python daemon knows (prompts live in action_profiles.py)
+const DAEMON_ACTIONS = { summary: 'summary', explain: 'explain', translate: 'translate', rewrite: 'rewrite', read_page: 'summary' };
+
+// Streams one generation from the configured provider. Resolves with the full
+// text; rejects on HTTP/network errors and when `signal` is aborted.
+const fetchGeneration = async (config, prompt, request, signal, onChunk) => {
+    const apiEndpoint = config.endpoint.replace(/\/$/, ''); // Remove trailing slash
+    let url = `${apiEndpoint}/api/generate`;
+    let body = {
+        model: config.model,
+        prompt: prompt,
+        stream: true
+    };
+
+    if (config.provider === 'daemon') {
+        // Python app daemon: shared prompts, result cache and chat history
+        if (request && DAEMON_ACTIONS[request.action]) {
+            url = `${apiEndpoint}/v1/summarize`;
+            body = { action: DAEMON_ACTIONS[request.action], text: request.text, stream: true };
+        } else {
+            url = `${apiEndpoint}/v1/chat`;
+            body = { message: prompt, stream: true };
+        }
+    }
+    // LM Studio compatibility check (basic)
+    else if (config.provider === 'lmstudio') {
+        // OpenAI compatible endpoint
+        url = `${apiEndpoint}/chat/completions`;
+
+        let systemPrompt = `You are a helpful assistant. Please answer in ${config.language}.`;
+
+        // Add automation instructions if enabled
+        if (config.automation_enabled) {
+            systemPrompt += `\n\nYou can control the browser by outputting JSON commands. Available commands:
+- {"action": "scroll_down"} - Scroll down the page
+- {"action": "scroll_up"} - Scroll up the page
+- {"action": "scroll_to_top"} - Scroll to top
+- {"action": "scroll_to_bottom"} - Scroll to bottom
+- {"action": "click", "selector": "CSS_SELECTOR"} - Click an element
+- {"action": "type", "selector": "CSS_SELECTOR", "text": "TEXT"} - Type into an input
+- {"action": "read_element", "selector": "CSS_SELECTOR"} - Read element content
+- {"action": "get_page_structure"} - Get page headings, links, buttons
+
+Output commands on a separate line. Example:
+{"action": "scroll_down"}`;
+        }
+
+        body = {
+            model: config.model,
+            messages: [
+                { role: "system", content: systemPrompt },
+                { role: "user", content: prompt }
+            ],
+            stream: true
+        };
+    }
+
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body),
+        signal
+    });
+
+    if (!response.ok) {
+        throw new Error(`API Error: ${response.statusText}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const lineBuffer = createLineBuffer();
+    let fullText = "";
+
+    const handleLine = (line) => {
+        if (!line.trim()) return;
+
+        try {
+            let textChunk = "";
+
+            // Handle Ollama format
+            if (config.provider === 'ollama') {
+                const json = JSON.parse(line);
+                if (json.done) return;
+                textChunk = json.response;
+            }
+            // Handle daemon SSE format: data: {"type": "content"|"thinking"|"error"|"done", ...}
+            else if (config.provider === 'daemon') {
+                if (!line.startsWith('data: ')) return;
+                const json = JSON.parse(line.slice(6));
+                if (json.type === 'content') {
+                    textChunk = json.text;
+                } else if (json.type === 'error') {
+                    textChunk = `\n\nError: ${json.message}`;
+                }
+            }
+            // Handle LM Studio / OpenAI format
+            else if (line.startsWith('data: ')) {
+                const dataStr = line.slice(6);
+                if (dataStr === '[DONE]') return;
+                const json = JSON.parse(dataStr);
+                const delta = json.choices[0].delta;
+                if (delta && delta.content) {
+                    textChunk = delta.content;
+                }
+            }
+
+            if (textChunk) {
+                fullText += textChunk;
+                onChunk(textChunk);
+            }
+        } catch (e) {
+            console.warn('Error parsing chunk', e);
+        }
+    };
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        // Lines split across network chunks are carried over by the buffer
+        lineBuffer.push(decoder.decode(value, { stream: true })).forEach(handleLine);
+    }
+    lineBuffer.push(decoder.decode()).forEach(handleLine);
+    lineBuffer.flush().forEach(handleLine);
+
+    return fullText;
+};
+
+// Queue of generation jobs. A job may have several subscribers (side panel
+// ports asking for the identical prompt); it is aborted when none is left.
+const jobs = [];
+let runningJobs = 0;
+
+const notifyJob = (job, message) => {
+    for (const { port, id } of job.subscribers) {
+        try {
+            port.postMessage({ ...message, id });
+        } catch (e) {
+            // Port already closed
+        }
+    }
+};
+
+const removeJob = (job) => {
+    const index = jobs.indexOf(job);
+    if (index !== -1) jobs.splice(index, 1);
+};
+
+const runJob = async (job) => {
+    job.state = 'running';
+    const config = await chrome.storage.local.get(LLM_DEFAULT_CONFIG);
+    try {
+        const text = await fetchGeneration(config, job.prompt, job.request, job.controller.signal, (delta) => {
+            job.text += delta;
+            notifyJob(job, { type: 'chunk', text: delta });
+        });
+        notifyJob(job, { type: 'done', text });
+    } catch (error) {
+        if (job.controller.signal.aborted) {
+            notifyJob(job, { type: 'cancelled' });
+        } else {
+            console.error(error);
+            notifyJob(job, { type: 'error', message: `${error.message}. Please check your connection to ${config.provider}.` });
+        }
+    } finally {
+        removeJob(job);
+    }
+};
+
+const pumpJobs = () => {
+    while (runningJobs < MAX_CONCURRENT_GENERATIONS) {
+        const job = jobs.find(j => j.state === 'queued');
+        if (!job) break;
+        runningJobs++;
+        runJob(job).finally(() => {
+            runningJobs--;
+            pumpJobs();
+        });
+    }
+};
+
+// Removes the matching subscriptions of `port`; jobs left without
+// subscribers are aborted (running) or dropped (queued)
+const dropSubscriptions = (port, predicate, notifyCancelled) => {
+    for (const job of [...jobs]) {
+        const dropped = job.subscribers.filter(s => s.port === port && predicate(s));
+        if (!dropped.length) continue;
+        job.subscribers = job.subscribers.filter(s => !dropped.includes(s));
+        if (notifyCancelled) {
+            dropped.forEach(({ id }) => {
+                try { port.postMessage({ type: 'cancelled', id }); } catch (e) { /* closed */ }
+            });
+        }
+        if (!job.subscribers.length) {
+            job.controller.abort();
+            if (job.state === 'queued') removeJob(job);
+        }
+    }
+};
+
+chrome.runtime.onConnect.addListener((port) => {
+    if (port.name !== 'llm') return;
+
+    port.onMessage.addListener((msg) => {
+        if (msg.type === 'generate') {
+            // A new send from the same panel supersedes its earlier generations
+            if (msg.supersede) {
+                dropSubscriptions(port, () => true, true);
+            }
+            const key = JSON.stringify([msg.prompt, msg.request || null]);
+            let job = jobs.find(j => j.key === key && !j.controller.signal.aborted);
+            if (job) {
+                // Identical request already queued/running: share it
+                job.subscribers.push({ port, id: msg.id });
+                if (job.text) port.postMessage({ type: 'chunk', id: msg.id, text: job.text });
+            } else {
+                job = {
+                    key,
+                    prompt: msg.prompt,
+                    request: msg.request || null,
+                    text: '',
+                    state: 'queued',
+                    controller: new AbortController(),
+                    subscribers: [{ port, id: msg.id }]
+                };
+                jobs.push(job);
+            }
+            pumpJobs();
+        } else if (msg.type === 'cancel') {
+            dropSubscriptions(port, s => s.id === msg.id, true);
+        }
+    });
+
+    // Panel closed: abandon everything it was waiting for
+    port.onDisconnect.addListener(() => dropSubscriptions(port, () => true, false));
+});
+
+// ---- Context menu ----
+
+// Identical context-menu actions (double clicks, repeated menu picks) within
+// this window are ignored
+const ACTION_DEDUP_MS = 3000;
+const recentActions = new Map();
+
+const isDuplicateAction = (key) => {
+    const now = Date.now();
+    for (const [k, t] of recentActions) {
+        if (now - t > ACTION_DEDUP_MS) recentActions.delete(k);
+    }
+    if (recentActions.has(key)) return true;
+    recentActions.set(key, now);
+    return false;
+};
+
 // Setup context menus on installation
 chrome.runtime.onInstalled.addListener(() => {
     chrome.contextMenus.create({
@@ -41,13 +314,18 @@ chrome.contextMenus.onClicked.addListener(async (info, tab) => {
     if (info.menuItemId === "read_page") {
         // Request page content from content script
         try {
-            const response = await chrome.tabs.sendMessage(tab.id, { action: 'getPageContent' });
+            // Main content only, pre-split into token-bounded sections
+            const response = await chrome.tabs.sendMessage(tab.id, { action: 'getPageContent', maxTokens: PAGE_SECTION_TOKENS });
+            if (isDuplicateAction(`read_page\u0000${response.url}\u0000${response.hash}`)) return;
 
             chrome.storage.local.set({
                 "pending_action": {
                     type: "read_page",
                     text: response.content,
-                    title: response.title
+                    title: response.title,
+                    url: response.url,
+                    hash: response.hash,
+                    sections: response.sections
                 }
             });
 
@@ -57,6 +335,8 @@ chrome.contextMenus.onClicked.addListener(async (info, tab) => {
             console.error('Error getting page content:', error);
         }
     } else if (info.menuItemId && info.selectionText) {
+        if (isDuplicateAction(`${info.menuItemId}\u0000${info.selectionText}`)) return;
+
         // Open side panel to show result
         // Note: We need to pass the data to the side panel. 
         // We can use runtime.sendMessage or storage.
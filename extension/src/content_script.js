@@ -83,23 +83,153 @@ const executeCommand = (command) => {
     }
 };
 
+// ---- Readable content extraction ("Read Entire Page") ----
+
+const SKIP_TAGS = new Set(['SCRIPT', 'STYLE', 'NOSCRIPT', 'SVG', 'CANVAS', 'IFRAME', 'NAV', 'FOOTER', 'ASIDE', 'FORM', 'BUTTON', 'SELECT', 'TEMPLATE']);
+const BLOCK_TAGS = new Set(['P', 'PRE', 'LI', 'BLOCKQUOTE', 'TD', 'DD', 'DT', 'FIGCAPTION', 'H1', 'H2', 'H3', 'H4', 'H5', 'H6']);
+const POSITIVE_HINT = /article|body|content|entry|main|post|text|blog|story/i;
+const NEGATIVE_HINT = /comment|footer|nav|sidebar|menu|share|social|related|banner|promo|cookie|subscribe|\bads?\b/i;
+
+// Small, fast string hash (cyrb53) - content fingerprint, not security
+const hashText = (str) => {
+    let h1 = 0xdeadbeef, h2 = 0x41c6ce57;
+    for (let i = 0; i < str.length; i++) {
+        const ch = str.charCodeAt(i);
+        h1 = Math.imul(h1 ^ ch, 2654435761);
+        h2 = Math.imul(h2 ^ ch, 1597334677);
+    }
+    h1 = Math.imul(h1 ^ (h1 >>> 16), 2246822507) ^ Math.imul(h2 ^ (h2 >>> 13), 3266489909);
+    h2 = Math.imul(h2 ^ (h2 >>> 16), 2246822507) ^ Math.imul(h1 ^ (h1 >>> 13), 3266489909);
+    return (4294967296 * (2097151 & h2) + (h1 >>> 0)).toString(16);
+};
+
+const isBoilerplate = (el) => {
+    if (SKIP_TAGS.has(el.tagName)) return true;
+    if (el.hidden || el.getAttribute('aria-hidden') === 'true') return true;
+    const role = el.getAttribute('role');
+    if (role === 'navigation' || role === 'banner' || role === 'contentinfo' || role === 'complementary') return true;
+    const hint = `${el.id} ${typeof el.className === 'string' ? el.className : ''}`;
+    return hint.trim() !== '' && NEGATIVE_HINT.test(hint) && !POSITIVE_HINT.test(hint);
+};
+
+// Readability-style scoring: paragraphs vote for their parent/grandparent
+const findMainContent = () => {
+    const scores = new Map();
+    const addScore = (el, value) => {
+        if (!el || el === document.documentElement) return;
+        if (!scores.has(el)) {
+            const hint = `${el.id} ${typeof el.className === 'string' ? el.className : ''}`;
+            let base = 0;
+            if (POSITIVE_HINT.test(hint)) base += 25;
+            if (NEGATIVE_HINT.test(hint)) base -= 25;
+            if (el.tagName === 'ARTICLE' || el.tagName === 'MAIN') base += 30;
+            scores.set(el, base);
+        }
+        scores.set(el, scores.get(el) + value);
+    };
+
+    document.querySelectorAll('p, pre, td, blockquote').forEach(p => {
+        const text = p.textContent.trim();
+        if (text.length < 25) return;
+        const score = 1 + text.split(',').length + Math.min(Math.floor(text.length / 100), 3);
+        addScore(p.parentElement, score);
+        if (p.parentElement) addScore(p.parentElement.parentElement, score / 2);
+    });
+
+    let best = null, bestScore = 0;
+    scores.forEach((score, el) => {
+        const textLen = el.textContent.length || 1;
+        let linkLen = 0;
+        el.querySelectorAll('a').forEach(a => { linkLen += a.textContent.length; });
+        const adjusted = score * (1 - linkLen / textLen);
+        if (adjusted > bestScore) {
+            best = el;
+            bestScore = adjusted;
+        }
+    });
+    return best || document.querySelector('article, main, [role="main"]') || document.body;
+};
+
+// Walks `root` and returns text blocks [{heading, text}], skipping boilerplate
+const collectBlocks = (root) => {
+    const blocks = [];
+    const walk = (el) => {
+        for (const child of el.children) {
+            if (isBoilerplate(child)) continue;
+            if (BLOCK_TAGS.has(child.tagName)) {
+                const text = child.innerText.replace(/\s+\n/g, '\n').trim();
+                if (text) blocks.push({ heading: /^H[1-6]$/.test(child.tagName), text });
+            } else {
+                walk(child);
+            }
+        }
+    };
+    walk(root);
+    // Pages built from bare divs: fall back to the text of the root
+    if (!blocks.length) {
+        const text = root.innerText.trim();
+        if (text) blocks.push({ heading: false, text });
+    }
+    return blocks;
+};
+
+// Groups blocks into sections of at most ~maxTokens (≈ 4 chars / token),
+// starting a new section at headings once the current one has some content
+const splitSections = (blocks, maxTokens) => {
+    const maxChars = maxTokens * 4;
+    const sections = [];
+    let current = [];
+    let size = 0;
+    const push = () => {
+        if (!current.length) return;
+        const text = current.join('\n\n');
+        sections.push({ hash: hashText(text), text });
+        current = [];
+        size = 0;
+    };
+    for (const block of blocks) {
+        let pieces = [block.text];
+        if (block.text.length > maxChars) {
+            // Oversized block: split on sentence boundaries
+            pieces = block.text.match(new RegExp(`[\\s\\S]{1,${maxChars}}(?:[.!?。]\\s|$)|[\\s\\S]{1,${maxChars}}`, 'g')) || [block.text];
+        }
+        for (const piece of pieces) {
+            if ((block.heading && size > maxChars / 4) || size + piece.length > maxChars) push();
+            current.push(piece);
+            size += piece.length + 2;
+        }
+    }
+    push();
+    return sections;
+};
+
+const extractReadableContent = (maxTokens = 1500) => {
+    const blocks = collectBlocks(findMainContent());
+    const sections = splitSections(blocks, maxTokens);
+    return {
+        title: document.title,
+        url: location.href.split('#')[0],
+        hash: hashText(sections.map(s => s.hash).join(':')),
+        sections,
+        content: sections.map(s => s.text).join('\n\n')
+    };
+};
+
 // Listen for messages from background script and sidepanel
 chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
     if (request.action === 'getSelectedText') {
         const selectedText = window.getSelection().toString();
         sendResponse({ text: selectedText });
     } else if (request.action === 'getPageContent') {
-        // Get readable content from the page
-        const pageContent = document.body.innerText;
-        const pageTitle = document.title;
-        sendResponse({
-            title: pageTitle,
-            content: pageContent
-        });
+        // Main content only (no nav/footer/scripts), split into token-bounded sections
+        sendResponse(extractReadableContent(request.maxTokens));
     } else if (request.action === 'executeCommand') {
         // Execute automation command
         const result = executeCommand(request.command);
         sendResponse(result);
+    } else if (request.action === 'executeCommands') {
+        // Execute a batch of commands in order, one round trip
+        sendResponse(request.commands.map(executeCommand));
     }
     return true; // Keep the message channel open for async response
 });
@@ -49,6 +49,9 @@ document.getElementById('provider').addEventListener('change', (e) => {
     const endpointInput = document.getElementById('endpoint');
     if (e.target.value === 'lmstudio') {
         endpointInput.value = 'http://127.0.0.1:1234/v1';
+    } else if (e.target.value === 'daemon') {
+        // Local HTTP API of the Python app (shares cache + chat history)
+        endpointInput.value = 'http://127.0.0.1:8765';
     } else {
         endpointInput.value = 'http://127.0.0.1:11434';
     }
@@ -47,113 +47,109 @@ document.addEventListener('DOMContentLoaded', async () => {
         return contentDiv; // Return content div for streaming updates
     };
 
-    const streamResponse = async (prompt, onChunk, onComplete) => {
-        try {
-            const apiEndpoint = config.endpoint.replace(/\/$/, ''); // Remove trailing slash
-            let url = `${apiEndpoint}/api/generate`;
-            let body = {
-                model: config.model,
-                prompt: prompt,
-                stream: true
-            };
-
-            // LM Studio compatibility check (basic)
-            if (config.provider === 'lmstudio') {
-                // OpenAI compatible endpoint
-                url = `${apiEndpoint}/chat/completions`;
-
-                let systemPrompt = `You are a helpful assistant. Please answer in ${config.language}.`;
-
-                // Add automation instructions if enabled
-                if (config.automation_enabled) {
-                    systemPrompt += `\n\nYou can control the browser by outputting JSON commands. Available commands:
-- {"action": "scroll_down"} - Scroll down the page
-- {"action": "scroll_up"} - Scroll up the page
-- {"action": "scroll_to_top"} - Scroll to top
-- {"action": "scroll_to_bottom"} - Scroll to bottom
-- {"action": "click", "selector": "CSS_SELECTOR"} - Click an element
-- {"action": "type", "selector": "CSS_SELECTOR", "text": "TEXT"} - Type into an input
-- {"action": "read_element", "selector": "CSS_SELECTOR"} - Read element content
-- {"action": "get_page_structure"} - Get page headings, links, buttons
-
-Output commands on a separate line. Example:
-{"action": "scroll_down"}`;
+    // Model calls go through the background service worker over a long-lived
+    // port: one shared queue, and generations are aborted when superseded or
+    // when this panel closes.
+    let llmPort = null;
+    let jobSeq = 0;
+    const pendingJobs = new Map();
+
+    const getLlmPort = () => {
+        if (!llmPort) {
+            llmPort = chrome.runtime.connect({ name: 'llm' });
+            llmPort.onMessage.addListener((msg) => {
+                const job = pendingJobs.get(msg.id);
+                if (job) job.handle(msg);
+            });
+            llmPort.onDisconnect.addListener(() => {
+                llmPort = null;
+                for (const job of pendingJobs.values()) {
+                    job.handle({ type: 'error', message: 'Background worker disconnected' });
                 }
+            });
+        }
+        return llmPort;
+    };
 
-                body = {
-                    model: config.model,
-                    messages: [
-                        { role: "system", content: systemPrompt },
-                        { role: "user", content: prompt }
-                    ],
-                    stream: true
-                };
-            }
-
-            const response = await fetch(url, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(body)
+    // Resolves with 'done' | 'error' | 'cancelled' once the generation ends.
+    // `supersede`: cancel this panel's earlier generations (a new user send).
+    const streamResponse = (prompt, onChunk, onComplete, request = null, supersede = true) => {
+        return new Promise((resolve) => {
+            const id = ++jobSeq;
+            let fullText = '';
+            pendingJobs.set(id, {
+                handle: (msg) => {
+                    if (msg.type === 'chunk') {
+                        fullText += msg.text;
+                        onChunk(msg.text, fullText);
+                        return;
+                    }
+                    pendingJobs.delete(id);
+                    if (msg.type === 'error') {
+                        const errorText = `Error: ${msg.message}`;
+                        onChunk(errorText, errorText);
+                        onComplete();
+                    } else {
+                        onComplete(fullText);
+                    }
+                    resolve(msg.type);
+                }
             });
+            getLlmPort().postMessage({ type: 'generate', id, prompt, request, supersede });
+        });
+    };
 
-            if (!response.ok) {
-                throw new Error(`API Error: ${response.statusText}`);
-            }
+    // Automation commands without side effects: consecutive ones share one round trip
+    const READ_ONLY_COMMANDS = new Set(['read_element', 'get_page_structure']);
+    const commandQueue = [];
+    let commandsRunning = false;
 
-            const reader = response.body.getReader();
-            const decoder = new TextDecoder();
-            let fullText = "";
-
-            while (true) {
-                const { done, value } = await reader.read();
-                if (done) break;
-
-                const chunk = decoder.decode(value, { stream: true });
-                const lines = chunk.split('\n');
-
-                for (const line of lines) {
-                    if (!line.trim()) continue;
-
-                    try {
-                        let textChunk = "";
-
-                        // Handle Ollama format
-                        if (config.provider === 'ollama') {
-                            const json = JSON.parse(line);
-                            if (json.done) continue;
-                            textChunk = json.response;
-                        }
-                        // Handle LM Studio / OpenAI format
-                        else if (line.startsWith('data: ')) {
-                            const dataStr = line.slice(6);
-                            if (dataStr === '[DONE]') continue;
-                            const json = JSON.parse(dataStr);
-                            const delta = json.choices[0].delta;
-                            if (delta && delta.content) {
-                                textChunk = delta.content;
-                            }
-                        }
-
-                        if (textChunk) {
-                            fullText += textChunk;
-                            onChunk(fullText);
-                        }
-                    } catch (e) {
-                        console.warn('Error parsing chunk', e);
+    const showCommandResult = (result) => {
+        const resultIcon = result.success ? '✅' : '❌';
+        appendMessage('assistant', `${resultIcon} ${result.message}`);
+
+        // If command returned data, show it
+        if (result.data) {
+            appendMessage('assistant', `Data: ${JSON.stringify(result.data, null, 2)}`);
+        }
+    };
+
+    // Runs queued commands in order via the content script; side-effecting
+    // commands (click, type, scroll) are sent one at a time
+    const dispatchCommands = async (commands) => {
+        commandQueue.push(...commands);
+        if (commandsRunning || !commandQueue.length) return;
+        commandsRunning = true;
+        try {
+            while (commandQueue.length) {
+                const batch = [commandQueue.shift()];
+                if (READ_ONLY_COMMANDS.has(batch[0].action)) {
+                    while (commandQueue.length && READ_ONLY_COMMANDS.has(commandQueue[0].action)) {
+                        batch.push(commandQueue.shift());
                     }
                 }
+                const [tab] = await chrome.tabs.query({ active: true, currentWindow: true });
+                if (!tab) {
+                    commandQueue.length = 0;
+                    break;
+                }
+                try {
+                    const results = await chrome.tabs.sendMessage(tab.id, {
+                        action: 'executeCommands',
+                        commands: batch
+                    });
+                    results.forEach(showCommandResult);
+                } catch (e) {
+                    console.warn('Command execution error:', e);
+                    showCommandResult({ success: false, message: `Error: ${e.message}` });
+                }
             }
-
-            onComplete(fullText);
-
-        } catch (error) {
-            console.error(error);
-            onChunk(`Error: ${error.message}. Please check your connection to ${config.provider}.`);
-            onComplete();
+        } finally {
+            commandsRunning = false;
         }
     };
 
-    const handleSend = async () => {
+    const handleSend = async (request = null) => {
         const text = inputArea.value.trim();
         if (!text) return;
 
@@ -166,57 +162,28 @@ Output commands on a separate line. Example:
         // Create Assistant Placeholder
         const assistantContentDiv = appendMessage('assistant', '...');
 
+        // Incremental renderer: re-parses only the last open markdown block, once per frame
+        const renderer = createStreamingMarkdown(assistantContentDiv, messagesContainer);
+        const commandExtractor = config.automation_enabled ? createCommandExtractor() : null;
+        let result = '';
+
         // Stream Response
-        await streamResponse(text, async (currentText) => {
-            if (typeof marked !== 'undefined') {
-                assistantContentDiv.innerHTML = marked.parse(currentText);
-            } else {
-                assistantContentDiv.textContent = currentText;
-            }
-            messagesContainer.scrollTop = messagesContainer.scrollHeight;
-
-            // Detect and execute commands if automation is enabled
-            if (config.automation_enabled) {
-                const commandRegex = /\{[^}]*"action"\s*:\s*"[^"]+"/g;
-                const matches = currentText.match(commandRegex);
-
-                if (matches) {
-                    for (const match of matches) {
-                        try {
-                            // Try to parse the command
-                            const commandStr = match + (match.includes('}') ? '' : '}');
-                            const command = JSON.parse(commandStr);
-
-                            // Execute command via content script
-                            const [tab] = await chrome.tabs.query({ active: true, currentWindow: true });
-                            if (tab) {
-                                const result = await chrome.tabs.sendMessage(tab.id, {
-                                    action: 'executeCommand',
-                                    command: command
-                                });
-
-                                // Show result in chat
-                                const resultIcon = result.success ? '✅' : '❌';
-                                const resultMsg = `${resultIcon} ${result.message}`;
-                                appendMessage('assistant', resultMsg);
-
-                                // If command returned data, show it
-                                if (result.data) {
-                                    appendMessage('assistant', `Data: ${JSON.stringify(result.data, null, 2)}`);
-                                }
-                            }
-                        } catch (e) {
-                            console.warn('Command parse error:', e);
-                        }
-                    }
-                }
+        await streamResponse(text, (delta, currentText) => {
+            renderer.append(delta);
+
+            // Detect and execute commands if automation is enabled (new text only, each command once)
+            if (commandExtractor) {
+                dispatchCommands(commandExtractor.push(delta));
             }
         }, (finalText) => {
+            renderer.finish();
+            result = finalText || '';
             console.log('Stream complete');
-        });
+        }, request);
+        return result;
     };
 
-    sendBtn.addEventListener('click', handleSend);
+    sendBtn.addEventListener('click', () => handleSend());
     inputArea.addEventListener('keydown', (e) => {
         if (e.key === 'Enter' && !e.shiftKey) {
             e.preventDefault();
@@ -224,42 +191,128 @@ Output commands on a separate line. Example:
         }
     });
 
+    // Generates a reply without rendering it (used for per-section page summaries)
+    // Returns null when the generation was cancelled
+    const generateText = async (prompt, request = null) => {
+        let result = '';
+        const status = await streamResponse(prompt, () => {}, (finalText) => { result = finalText || ''; }, request, false);
+        return status === 'cancelled' ? null : result;
+    };
+
+    // "Read Entire Page": cache per URL, keyed by content hash.
+    // Unchanged page -> cached summary, no model call; changed page -> only
+    // sections whose hash is new are re-summarized.
+    const PAGE_CACHE_PREFIX = 'page_cache:';
+    const PAGE_CACHE_INDEX = 'page_cache_index';
+    const PAGE_CACHE_LIMIT = 50;
+
+    const savePageCache = async (url, entry) => {
+        const key = PAGE_CACHE_PREFIX + url;
+        const { [PAGE_CACHE_INDEX]: index = [] } = await chrome.storage.local.get(PAGE_CACHE_INDEX);
+        const newIndex = [url, ...index.filter(u => u !== url)];
+        const evicted = newIndex.splice(PAGE_CACHE_LIMIT).map(u => PAGE_CACHE_PREFIX + u);
+        await chrome.storage.local.set({ [key]: entry, [PAGE_CACHE_INDEX]: newIndex });
+        if (evicted.length) await chrome.storage.local.remove(evicted);
+    };
+
+    const readPage = async (pending) => {
+        const title = pending.title || "this page";
+        const url = pending.url || title;
+        const sections = pending.sections || [{ hash: pending.hash, text: pending.text }];
+        const cacheKey = PAGE_CACHE_PREFIX + url;
+        const { [cacheKey]: cache = { sections: {} } } = await chrome.storage.local.get(cacheKey);
+
+        if (pending.hash && cache.hash === pending.hash && cache.summary) {
+            appendMessage('user', `Read page: ${title}`);
+            appendMessage('assistant', `${cache.summary}\n\n_(cached - page unchanged)_`);
+            return;
+        }
+
+        let summary = '';
+        const sectionSummaries = {};
+        if (sections.length <= 1) {
+            const content = sections.length ? sections[0].text : '';
+            inputArea.value = `Analyze and summarize the following webpage (${title}):\n\n${content}`;
+            summary = await handleSend({ action: 'read_page', text: content });
+            if (sections.length && summary) sectionSummaries[sections[0].hash] = summary;
+        } else {
+            const progress = appendMessage('assistant', `Reading ${sections.length} sections...`);
+            const parts = [];
+            let reused = 0;
+            for (let i = 0; i < sections.length; i++) {
+                const section = sections[i];
+                let part = cache.sections[section.hash] || sectionSummaries[section.hash];
+                if (part) {
+                    reused++;
+                } else {
+                    progress.textContent = `Summarizing section ${i + 1}/${sections.length}...`;
+                    part = await generateText(
+                        `Summarize section ${i + 1}/${sections.length} of the webpage (${title}):\n\n${section.text}`,
+                        { action: 'summary', text: section.text }
+                    );
+                    if (part === null) {
+                        progress.textContent = 'Page reading cancelled.';
+                        return;
+                    }
+                }
+                if (part) sectionSummaries[section.hash] = part;
+                parts.push(`Section ${i + 1}:\n${part}`);
+            }
+            progress.textContent = `${sections.length} sections, ${reused} reused from cache.`;
+            const combined = parts.join('\n\n');
+            inputArea.value = `Combine these section summaries of the webpage (${title}) into one coherent summary:\n\n${combined}`;
+            summary = await handleSend({ action: 'summary', text: combined });
+        }
+
+        // Only sections of the current version are kept
+        await savePageCache(url, {
+            hash: pending.hash,
+            title,
+            sections: sectionSummaries,
+            summary: summary || '',
+            updated: Date.now()
+        });
+    };
+
+    const runPendingAction = (pending) => {
+        const { type, text } = pending;
+
+        if (type === "read_page") {
+            readPage(pending);
+            return;
+        }
+
+        let prompt = "";
+        switch (type) {
+            case "summary":
+                prompt = `Summarize the following text:\n\n"${text}"`;
+                break;
+            case "explain":
+                prompt = `Explain the following text in simple terms:\n\n"${text}"`;
+                break;
+            case "translate":
+                prompt = `Translate the following text to Vietnamese:\n\n"${text}"`;
+                break;
+            case "rewrite":
+                prompt = `Rewrite the following text to be more professional:\n\n"${text}"`;
+                break;
+            default: // 'ai_summarizer_root' or unknown
+                prompt = text;
+                break;
+        }
+
+        // Trigger send automatically
+        inputArea.value = prompt; // Optional: show what we are asking
+        handleSend({ action: type, text });
+    };
+
     // Check for pending actions from Context Menu
     const checkPendingAction = async () => {
         const data = await chrome.storage.local.get("pending_action");
         if (data.pending_action) {
-            const { type, text } = data.pending_action;
-
             // Clear it immediately so it doesn't run again on reload
             await chrome.storage.local.remove("pending_action");
-
-            let prompt = "";
-            switch (type) {
-                case "summary":
-                    prompt = `Summarize the following text:\n\n"${text}"`;
-                    break;
-                case "explain":
-                    prompt = `Explain the following text in simple terms:\n\n"${text}"`;
-                    break;
-                case "translate":
-                    prompt = `Translate the following text to Vietnamese:\n\n"${text}"`;
-                    break;
-                case "rewrite":
-                    prompt = `Rewrite the following text to be more professional:\n\n"${text}"`;
-                    break;
-                case "read_page":
-                    const pageTitle = data.pending_action.title || "this page";
-                    const content = text.length > 10000 ? text.substring(0, 10000) + "\n\n[Content truncated...]" : text;
-                    prompt = `Analyze and summarize the following webpage (${pageTitle}):\n\n${content}`;
-                    break;
-                default: // 'ai_summarizer_root' or unknown
-                    prompt = text;
-                    break;
-            }
-
-            // Trigger send automatically
-            inputArea.value = prompt; // Optional: show what we are asking
-            handleSend();
+            runPendingAction(data.pending_action);
         }
     };
 
@@ -268,38 +321,9 @@ Output commands on a separate line. Example:
     // Listen for storage changes (when panel is already open)
     chrome.storage.onChanged.addListener((changes, areaName) => {
         if (areaName === 'local' && changes.pending_action && changes.pending_action.newValue) {
-            const { type, text } = changes.pending_action.newValue;
-
             // Clear it immediately
             chrome.storage.local.remove("pending_action");
-
-            let prompt = "";
-            switch (type) {
-                case "summary":
-                    prompt = `Summarize the following text:\n\n"${text}"`;
-                    break;
-                case "explain":
-                    prompt = `Explain the following text in simple terms:\n\n"${text}"`;
-                    break;
-                case "translate":
-                    prompt = `Translate the following text to Vietnamese:\n\n"${text}"`;
-                    break;
-                case "rewrite":
-                    prompt = `Rewrite the following text to be more professional:\n\n"${text}"`;
-                    break;
-                case "read_page":
-                    const pageTitle = changes.pending_action.newValue.title || "this page";
-                    const content = text.length > 10000 ? text.substring(0, 10000) + "\n\n[Content truncated...]" : text;
-                    prompt = `Analyze and summarize the following webpage (${pageTitle}):\n\n${content}`;
-                    break;
-                default:
-                    prompt = text;
-                    break;
-            }
-
-            // Trigger send automatically
-            inputArea.value = prompt;
-            handleSend();
+            runPendingAction(changes.pending_action.newValue);
         }
     });
 });
@@ -0,0 +1,168 @@
+// src/stream_render.js - Streaming helpers shared by the side panel (and the service worker)
+
+// Splits a stream of decoded text into complete lines.
+// A line that straddles two network chunks is kept until its '\n' arrives.
+const createLineBuffer = () => {
+    let pending = '';
+    return {
+        // Returns the complete lines contained in `text` (plus any carried-over prefix)
+        push(text) {
+            pending += text;
+            const lines = pending.split('\n');
+            pending = lines.pop();
+            return lines.map(l => l.replace(/\r$/, ''));
+        },
+        // Returns the last unterminated line (if any) at end of stream
+        flush() {
+            const rest = pending.replace(/\r$/, '');
+            pending = '';
+            return rest ? [rest] : [];
+        }
+    };
+};
+
+// Incremental markdown renderer for a streaming assistant message.
+// Completed blocks (ended by a blank line outside a code fence) are parsed once
+// and frozen; only the last open block is re-parsed. DOM writes are batched
+// into one requestAnimationFrame per frame.
+const createStreamingMarkdown = (container, scrollContainer) => {
+    const hasMarked = typeof marked !== 'undefined';
+    let text = '';
+    let committed = 0;      // text[0:committed] is already rendered into frozen blocks
+    let scheduled = false;
+    let started = false;
+    const tail = document.createElement('div');
+
+    const renderInto = (el, src) => {
+        if (hasMarked) {
+            el.innerHTML = marked.parse(src);
+        } else {
+            el.textContent = src;
+        }
+    };
+
+    // Index just after the last block boundary in text[committed:], or -1
+    const lastBoundary = () => {
+        let inFence = false;
+        let boundary = -1;
+        let pos = committed;
+        while (pos < text.length) {
+            let end = text.indexOf('\n', pos);
+            if (end === -1) break; // unterminated last line is never a boundary
+            const line = text.slice(pos, end);
+            if (/^\s{0,3}(```|~~~)/.test(line)) {
+                inFence = !inFence;
+            } else if (!inFence && line.trim() === '' && pos > committed) {
+                boundary = end + 1;
+            }
+            pos = end + 1;
+        }
+        return boundary;
+    };
+
+    const flush = () => {
+        scheduled = false;
+        if (!started) {
+            container.textContent = '';
+            container.appendChild(tail);
+            started = true;
+        }
+        const boundary = lastBoundary();
+        if (boundary > committed) {
+            const block = document.createElement('div');
+            block.className = 'md-block';
+            renderInto(block, text.slice(committed, boundary));
+            container.insertBefore(block, tail);
+            committed = boundary;
+        }
+        renderInto(tail, text.slice(committed));
+        if (scrollContainer) {
+            scrollContainer.scrollTop = scrollContainer.scrollHeight;
+        }
+    };
+
+    return {
+        append(delta) {
+            if (!delta) return;
+            text += delta;
+            if (!scheduled) {
+                scheduled = true;
+                requestAnimationFrame(flush);
+            }
+        },
+        // Render synchronously (end of stream)
+        finish() {
+            if (text || !started) flush();
+        },
+        get text() {
+            return text;
+        }
+    };
+};
+
+// Incremental extractor for automation commands ({"action": "...", ...}) in a
+// streaming reply. Only text after the last consumed position is scanned, so
+// every command is returned exactly once, in order, as soon as its closing
+// brace arrives.
+const createCommandExtractor = (maxCommandLength = 2000) => {
+    let text = '';
+    let pos = 0;  // text[0:pos] has been consumed
+
+    // End index (exclusive) of the balanced JSON object starting at `start`,
+    // -1 if it is not complete yet
+    const objectEnd = (start) => {
+        let depth = 0;
+        let inString = false;
+        for (let i = start; i < text.length; i++) {
+            const ch = text[i];
+            if (inString) {
+                if (ch === '\\') i++;
+                else if (ch === '"') inString = false;
+            } else if (ch === '"') {
+                inString = true;
+            } else if (ch === '{') {
+                depth++;
+            } else if (ch === '}') {
+                depth--;
+                if (depth === 0) return i + 1;
+            }
+        }
+        return -1;
+    };
+
+    return {
+        push(delta) {
+            text += delta;
+            const commands = [];
+            while (true) {
+                const start = text.indexOf('{', pos);
+                if (start === -1) {
+                    pos = text.length;
+                    break;
+                }
+                const end = objectEnd(start);
+                if (end === -1) {
+                    // Wait for more text unless this brace is clearly not a command
+                    pos = (text.length - start > maxCommandLength) ? start + 1 : start;
+                    if (pos === start) break;
+                    continue;
+                }
+                try {
+                    const obj = JSON.parse(text.slice(start, end));
+                    if (obj && typeof obj.action === 'string') {
+                        commands.push(obj);
+                        pos = end;
+                        continue;
+                    }
+                } catch (e) {
+                    // Not JSON - skip this brace only, a command may be nested in it
+                }
+                pos = start + 1;
+            }
+            // Drop consumed text so each push only costs the new/pending part
+            text = text.slice(pos);
+            pos = 0;
+            return commands;
+        }
+    };
+};
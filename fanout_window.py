@@ -0,0 +1,211 @@
+# fanout_window.py
+"""
+"Chạy tất cả" trong popup quick action: nhiều action trên cùng văn bản đã
+chọn, chạy đồng thời qua scheduler của engine (số worker = số request
+provider chạy song song được, xem provider_registry), kết quả stream vào
+một cửa sổ, mỗi action một tab.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, List
+
+from PySide6 import QtWidgets, QtCore
+
+from providers import StreamCancel
+from scheduler import PRIORITY_INTERACTIVE
+
+ACTION_TITLES = {
+    "summary": "📝 Tóm tắt",
+    "explain": "🤔 Giải thích",
+    "translate": "🌐 Dịch",
+    "rewrite": "✍️ Viết lại",
+}
+
+
+class FanoutRun(QtCore.QObject):
+    """Các job của một lần "Chạy tất cả". Job được chuẩn bị trong worker
+    (engine.prepare_fanout). Như ChatGeneration: text được gom trong worker,
+    mỗi action có tối đa một signal `progress` đang chờ và GUI lấy phần mới
+    bằng take()."""
+    progress = QtCore.Signal(int)
+    finished = QtCore.Signal(int, str)  # index, "" hoặc thông báo lỗi
+
+    def __init__(self, engine, actions: List[str], text: str, context: str = ""):
+        super().__init__()
+        self.engine = engine
+        self.actions = actions
+        self.text_in = text
+        # Ngữ cảnh MCP được ghép (engine.with_context) một lần, trong worker đầu tiên cần nó
+        self._context = context
+        self._model_text = text
+        self._input_lock = threading.Lock()
+        self.cancels = [StreamCancel() for _ in actions]
+        # Thông tin từ StreamDone + thời gian, cho dòng trạng thái
+        self.meta: List[Dict[str, Any]] = [{} for _ in actions]
+        self._lock = threading.Lock()
+        self._parts: List[List[str]] = [[] for _ in actions]
+        self._taken = [0] * len(actions)
+        self._signalled = [False] * len(actions)
+
+    def start(self):
+        # Job vào hàng đợi theo thứ tự: provider chỉ chạy được một request thì
+        # các action chạy lần lượt trên cùng prefix (văn bản đã có trong KV cache)
+        for i in range(len(self.actions)):
+            self.engine.scheduler.submit(self._run, i, priority=PRIORITY_INTERACTIVE)
+
+    def stop(self):
+        for cancel in self.cancels:
+            cancel.cancel()
+
+    def take(self, i: int) -> str:
+        """Phần text của action i nhận được từ lần take() trước."""
+        with self._lock:
+            self._signalled[i] = False
+            parts = self._parts[i][self._taken[i]:]
+            self._taken[i] = len(self._parts[i])
+        return "".join(parts)
+
+    def text(self, i: int) -> str:
+        with self._lock:
+            return "".join(self._parts[i])
+
+    def _input(self) -> str:
+        with self._input_lock:
+            if self._context:
+                self._model_text = self.engine.with_context(self.text_in, self._context)
+                self._context = ""
+            return self._model_text
+
+    def _run(self, i: int):
+        cancel = self.cancels[i]
+        error = ""
+        started = time.perf_counter()
+        try:
+            if cancel.cancelled:
+                return
+            job = self.engine.prepare_fanout(self.actions[i], self._input())
+            for chunk in self.engine.stream_fanout(job, cancel=cancel):
+                if cancel.cancelled:
+                    break
+                if chunk.type == "done":
+                    raw = chunk.raw or {}
+                    self.meta[i] = {"completion_tokens": chunk.completion_tokens,
+                                    "cached": chunk.finish_reason == "cached",
+                                    "tm_hits": raw.get("tm_hits"),
+                                    "tm_segments": raw.get("tm_segments")}
+                    continue
+                if chunk.type != "content":
+                    continue
+                with self._lock:
+                    self._parts[i].append(chunk.text)
+                    notify = not self._signalled[i]
+                    self._signalled[i] = True
+                if notify:
+                    self.progress.emit(i)
+        except Exception as e:
+            if not cancel.cancelled:
+                logging.error(f"[Fanout] {self.actions[i]} failed: {e}", exc_info=True)
+                error = str(e) or type(e).__name__
+        finally:
+            self.meta[i]["elapsed_ms"] = round((time.perf_counter() - started) * 1000)
+            self.finished.emit(i, "⏹ Đã dừng" if cancel.cancelled and not error else error)
+
+
+class FanoutWindow(QtWidgets.QDialog):
+    """Kết quả "Chạy tất cả": mỗi action một tab, text stream vào tab của nó."""
+    chatRequested = QtCore.Signal(str)
+
+    def __init__(self, run: FanoutRun, parallel: int, parent=None):
+        super().__init__(parent)
+        self.run = run
+        self.setWindowTitle("Kết quả AI – Chạy tất cả")
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+        self._pending = set(range(len(run.actions)))
+
+        lay = QtWidgets.QVBoxLayout(self)
+        self.tabs = QtWidgets.QTabWidget()
+        self.editors: List[QtWidgets.QPlainTextEdit] = []
+        for action in run.actions:
+            editor = QtWidgets.QPlainTextEdit()
+            editor.setReadOnly(True)
+            self.editors.append(editor)
+            self.tabs.addTab(editor, f"⏳ {ACTION_TITLES.get(action, action)}")
+        lay.addWidget(self.tabs, 1)
+
+        self.lblStatus = QtWidgets.QLabel(f"{len(run.actions)} action, tối đa {parallel} chạy song song")
+        self.lblStatus.setStyleSheet("color: #666;")
+        lay.addWidget(self.lblStatus)
+
+        btns = QtWidgets.QHBoxLayout()
+        self.btnChat = QtWidgets.QPushButton("💬 Chat")
+        self.btnStop = QtWidgets.QPushButton("⏹ Dừng")
+        self.btnCopy = QtWidgets.QPushButton("Copy")
+        self.btnClose = QtWidgets.QPushButton("Đóng")
+        btns.addWidget(self.btnChat); btns.addWidget(self.btnStop)
+        btns.addStretch(1)
+        btns.addWidget(self.btnCopy); btns.addWidget(self.btnClose)
+        lay.addLayout(btns)
+
+        self.btnChat.clicked.connect(lambda: self.chatRequested.emit(self._current_text()))
+        self.btnStop.clicked.connect(self.run.stop)
+        self.btnCopy.clicked.connect(lambda: QtWidgets.QApplication.clipboard().setText(self._current_text()))
+        self.btnClose.clicked.connect(self.close)
+        self.tabs.currentChanged.connect(lambda _i: self._update_status())
+        run.progress.connect(self._on_progress)
+        run.finished.connect(self._on_finished)
+        self.resize(700, 500)
+
+    def _current_text(self) -> str:
+        return self.editors[self.tabs.currentIndex()].toPlainText()
+
+    def _on_progress(self, i: int):
+        editor = self.editors[i]
+        bar = editor.verticalScrollBar()
+        follow = bar.value() >= bar.maximum() - 4
+        cursor = editor.textCursor()
+        cursor.movePosition(cursor.MoveOperation.End)
+        cursor.insertText(self.run.take(i))
+        if follow:
+            bar.setValue(bar.maximum())
+
+    def _on_finished(self, i: int, error: str):
+        self._on_progress(i)
+        self._pending.discard(i)
+        action = self.run.actions[i]
+        title = ACTION_TITLES.get(action, action)
+        meta = self.run.meta[i]
+        if error:
+            icon = "⏹" if error.startswith("⏹") else "❌"
+            if icon == "❌":
+                self.editors[i].appendPlainText(f"\n❌ Lỗi gọi model: {error}")
+        else:
+            icon = "♻️" if meta.get("cached") else "✅"
+            # Bản dịch / bản viết lại: đặt văn bản gốc lên trên như popup từng action
+            if action in ("translate", "rewrite"):
+                separator = "=" * 60
+                label = "🌐 BẢN DỊCH" if action == "translate" else "✍️ BẢN VIẾT LẠI"
+                self.editors[i].setPlainText(f"📄 VĂN BẢN GỐC:\n{separator}\n{self.run.text_in}\n\n"
+                                             f"{label}:\n{separator}\n{self.run.text(i).strip()}")
+        self.tabs.setTabText(i, f"{icon} {title}")
+        if not self._pending:
+            self.btnStop.setEnabled(False)
+        self._update_status()
+
+    def _update_status(self):
+        i = self.tabs.currentIndex()
+        meta = self.run.meta[i] if i >= 0 else {}
+        done = len(self.run.actions) - len(self._pending)
+        parts = [f"{done}/{len(self.run.actions)} action xong"]
+        if "elapsed_ms" in meta and i not in self._pending:
+            if meta.get("cached"):
+                parts.append("tab này lấy từ cache")
+            else:
+                parts.append(f"tab này: {meta['elapsed_ms'] / 1000:.1f}s, {meta.get('completion_tokens', 0)} token")
+            if meta.get("tm_segments"):
+                parts.append(f"{meta['tm_hits']}/{meta['tm_segments']} câu từ bộ nhớ dịch")
+        self.lblStatus.setText(" · ".join(parts))
+
+    def closeEvent(self, event):
+        self.run.stop()
+        super().closeEvent(event)
@@ -0,0 +1,164 @@
+# idle_prefetch.py
+"""
+Tóm tắt trước (pre-summarize) các file trong thư mục theo dõi khi máy rảnh.
+
+Một thread nền quét định kỳ (mtime/size) các thư mục cấu hình - mặc định là
+ROOT_PATH của MCP filesystem server - và đưa file mới/đã đổi vào hàng đợi.
+Mỗi file chỉ được tóm tắt khi:
+  - người dùng không thao tác trong `idle_seconds` (Windows: GetLastInputInfo),
+  - không có lời gọi model nào đang chạy/chờ (scheduler, chat - engine.busy()),
+  - CPU dưới `max_cpu_percent` (psutil nếu có, nếu không thì load average).
+Kết quả nằm trong result cache nên lần tóm tắt tương tác đầu tiên trả về ngay.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from scheduler import PRIORITY_BACKGROUND
+
+try:
+    import psutil
+except ImportError:  # psutil không bắt buộc
+    psutil = None
+
+DEFAULT_EXTS = [".txt", ".md", ".rst", ".html", ".htm", ".csv", ".log"]
+
+
+def idle_seconds() -> Optional[float]:
+    """Số giây kể từ lần nhập liệu cuối (None nếu không đo được trên hệ điều hành này)."""
+    if sys.platform != "win32":
+        return None
+    import ctypes
+    from ctypes import wintypes
+
+    class LASTINPUTINFO(ctypes.Structure):
+        _fields_ = [("cbSize", wintypes.UINT), ("dwTime", wintypes.DWORD)]
+
+    info = LASTINPUTINFO()
+    info.cbSize = ctypes.sizeof(info)
+    if not ctypes.windll.user32.GetLastInputInfo(ctypes.byref(info)):
+        return None
+    millis = (ctypes.windll.kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF
+    return millis / 1000.0
+
+
+def cpu_percent() -> Optional[float]:
+    if psutil is not None:
+        return psutil.cpu_percent(interval=None)
+    if hasattr(os, "getloadavg"):
+        return os.getloadavg()[0] / (os.cpu_count() or 1) * 100
+    return None
+
+
+def watched_folders(cfg: Dict[str, Any]) -> List[str]:
+    """Thư mục trong prefetch.folders, hoặc ROOT_PATH của các MCP filesystem server."""
+    folders = list(cfg.get("prefetch", {}).get("folders") or [])
+    if not folders:
+        for server in cfg.get("mcp", {}).get("servers", []):
+            root = (server.get("env") or {}).get("ROOT_PATH")
+            if root:
+                folders.append(root)
+    return folders
+
+
+class IdlePrefetcher:
+    def __init__(self, engine, cfg: Dict[str, Any]):
+        self.engine = engine
+        pcfg = cfg.get("prefetch", {})
+        self.folders = [Path(f) for f in watched_folders(cfg)]
+        self.exts = {e.lower() for e in pcfg.get("extensions", DEFAULT_EXTS)}
+        self.action = pcfg.get("action", "summary")
+        self.poll_seconds = pcfg.get("poll_seconds", 30)
+        self.idle_seconds = pcfg.get("idle_seconds", 120)
+        self.max_cpu_percent = pcfg.get("max_cpu_percent", 50)
+        self.max_file_bytes = pcfg.get("max_file_kb", 2048) * 1024
+        # (mtime, size) của file đã tóm tắt xong; file lỗi được thử lại ở lần quét sau
+        self._seen: Dict[str, Tuple[float, int]] = {}
+        self._pending: Dict[Path, Tuple[float, int]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if not self.folders:
+            logging.info("[Prefetch] No folders to watch")
+            return
+        self._thread = threading.Thread(target=self._run, name="idle-prefetch", daemon=True)
+        self._thread.start()
+        logging.info(f"[Prefetch] Watching {', '.join(map(str, self.folders))}")
+
+    def stop(self):
+        self._stop.set()
+
+    # ---- loop ----
+
+    def _run(self):
+        cpu_percent()  # lần gọi đầu của psutil luôn trả 0
+        while not self._stop.is_set():
+            try:
+                self._scan()
+                while self._pending and not self._stop.is_set() and self._can_run():
+                    path = next(iter(self._pending))
+                    sig = self._pending.pop(path)
+                    if self._summarize(path):
+                        self._seen[str(path)] = sig
+            except Exception as e:
+                logging.error(f"[Prefetch] {e}", exc_info=True)
+            self._stop.wait(self.poll_seconds)
+
+    def _scan(self):
+        for folder in self.folders:
+            if not folder.is_dir():
+                continue
+            for path in folder.rglob("*"):
+                if path.suffix.lower() not in self.exts or not path.is_file():
+                    continue
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                sig = (st.st_mtime, st.st_size)
+                key = str(path)
+                if self._seen.get(key) != sig and 0 < st.st_size <= self.max_file_bytes:
+                    self._pending[path] = sig
+
+    def _can_run(self) -> bool:
+        """Chỉ chạy khi người dùng rảnh, không có lời gọi model nào và CPU không bận."""
+        idle = idle_seconds()
+        if idle is not None and idle < self.idle_seconds:
+            return False
+        if self.engine.busy():
+            return False
+        cpu = cpu_percent()
+        if cpu is not None and cpu > self.max_cpu_percent:
+            return False
+        return True
+
+    def _summarize(self, path: Path) -> bool:
+        """True nếu file đã có kết quả (hoặc không có gì để tóm tắt)."""
+        try:
+            text = path.read_text(encoding="utf-8", errors="replace")
+        except OSError as e:
+            logging.warning(f"[Prefetch] Cannot read {path}: {e}")
+            return False
+        if not text.strip():
+            return True
+        job = self.engine.prepare_action(self.action, text)
+        if self.engine.cached(job):
+            return True
+        started = time.perf_counter()
+        try:
+            # Dùng lại job vừa dựng (không rút gọn văn bản lần hai), cache vừa tra xong
+            res = self.engine.submit_job(job, priority=PRIORITY_BACKGROUND, use_cache=False).result()
+        except Exception as e:
+            logging.warning(f"[Prefetch] {path.name} failed: {e}")
+            return False
+        if not res.get("text"):
+            # Kết quả rỗng không được cache: thử lại ở lần quét sau
+            logging.warning(f"[Prefetch] {path.name}: empty result")
+            return False
+        logging.info(f"[Prefetch] {self.action} {path.name} in {time.perf_counter() - started:.1f}s")
+        return True
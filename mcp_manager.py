@@ -20,7 +20,7 @@ class MCPManager:
 
     def start(self):
         logging.info("Starting MCPManager...")
-        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread = threading.Thread(target=self._run_loop, name="mcp-loop", daemon=True)
         self._thread.start()
 
     def _run_loop(self):
@@ -0,0 +1,223 @@
+# profiler.py
+"""
+Profiling theo yêu cầu (menu tray → "🩺 Bắt đầu profiling"), chạy được cả
+trong bản PyInstaller.
+
+- SamplingProfiler: thread nền lấy mẫu stack của mọi thread (Qt main thread,
+  MCP loop, scheduler workers, daemon...) qua sys._current_frames() mỗi
+  `interval_ms`. Không cần cProfile / tracing nên overhead thấp và đều.
+- StallWatchdog: QTimer heartbeat trên main thread + thread canh; khi event
+  loop Qt không chạy quá `stall_ms`, log cảnh báo kèm stack của main thread
+  tại thời điểm bị treo.
+
+Khi dừng, ghi vào thư mục `profiles/`:
+  profile_<thời gian>.collapsed  stack gộp (định dạng "a;b;c count", mở bằng
+                                 speedscope / flamegraph.pl)
+  profile_<thời gian>.txt        tóm tắt: top-N hotspot, các lần treo UI
+Cả hai đều là file text tự chứa, người dùng đính kèm vào bug report.
+"""
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Lá stack là các hàm chờ (queue, socket, select, event loop) -> thread đang rảnh
+IDLE_FUNCS = {
+    "wait", "get", "select", "poll", "accept", "readinto", "recv_into", "_run_once",
+    "serve_forever", "_wait_for_tstate_lock", "run_forever", "exec", "<module>",
+}
+
+Frame = Tuple[str, str, int]  # (function, file, first line)
+
+
+def _stack(frame) -> List[Frame]:
+    """Stack từ ngoài vào trong, mỗi phần tử là một hàm."""
+    out: List[Frame] = []
+    while frame is not None:
+        code = frame.f_code
+        out.append((code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    out.reverse()
+    return out
+
+
+def _label(f: Frame) -> str:
+    return f"{f[0]} ({f[1]}:{f[2]})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms: float = 5.0):
+        self.interval = interval_ms / 1000.0
+        self.stacks: Counter = Counter()  # (thread, tuple(stack)) -> samples
+        self.samples = 0
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        self.duration = time.perf_counter() - self._t0
+
+    def _run(self):
+        own = {threading.get_ident()}
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, f"thread-{ident}")
+                if ident in own or name.startswith("profiler-"):
+                    continue
+                self.stacks[(name, tuple(_stack(frame)))] += 1
+            self.samples += 1
+
+
+class StallWatchdog:
+    """Phát hiện event loop Qt bị chặn lâu hơn stall_ms (phải start từ main thread)."""
+
+    def __init__(self, stall_ms: float = 200.0, beat_ms: int = 50):
+        self.stall = stall_ms / 1000.0
+        self.beat_ms = beat_ms
+        self.stalls: List[Dict[str, Any]] = []
+        self._beat = time.perf_counter()
+        self._main_ident = threading.main_thread().ident
+        self._stop = threading.Event()
+        self._timer = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        from PySide6 import QtCore
+
+        self._t0 = time.perf_counter()
+        self._beat = self._t0
+        self._timer = QtCore.QTimer()
+        self._timer.timeout.connect(self._on_beat)
+        self._timer.start(self.beat_ms)
+        self._thread = threading.Thread(target=self._watch, name="profiler-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._timer:
+            self._timer.stop()
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def _on_beat(self):
+        self._beat = time.perf_counter()
+
+    def _watch(self):
+        current: Optional[Dict[str, Any]] = None
+        while not self._stop.wait(0.02):
+            beat = self._beat
+            blocked = time.perf_counter() - beat
+            if current is not None and beat != current["_beat"]:
+                # Event loop chạy lại: chốt độ dài lần treo
+                current["ms"] = round((beat - current["_beat"]) * 1000)
+                current.pop("_beat")
+                logging.warning(f"[Profiler] UI stall {current['ms']} ms at +{current['at_s']:.1f}s:\n"
+                                + "".join(current["stack"]))
+                current = None
+            if current is None and blocked > self.stall:
+                frame = sys._current_frames().get(self._main_ident)
+                current = {
+                    "_beat": beat,
+                    "at_s": round(beat - self._t0, 2),
+                    "ms": None,
+                    "stack": traceback.format_stack(frame) if frame else [],
+                }
+                self.stalls.append(current)
+        if current is not None:
+            current["ms"] = round((time.perf_counter() - current.pop("_beat")) * 1000)
+
+
+class ProfileSession:
+    """Một phiên profiling: sampler + watchdog, ghi báo cáo khi dừng."""
+
+    def __init__(self, cfg: Dict[str, Any]):
+        self.dir = Path(cfg.get("dir", "profiles"))
+        self.top_n = cfg.get("top_n", 25)
+        self.sampler = SamplingProfiler(cfg.get("interval_ms", 5))
+        self.watchdog = StallWatchdog(cfg.get("stall_ms", 200))
+
+    def start(self):
+        self.sampler.start()
+        self.watchdog.start()
+        logging.info("[Profiler] Session started")
+
+    def stop(self) -> Tuple[Path, str]:
+        """Dừng và ghi báo cáo. Trả về (đường dẫn file tóm tắt, nội dung tóm tắt)."""
+        self.watchdog.stop()
+        self.sampler.stop()
+        self.dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.sampler.started_at))
+        collapsed = self.dir / f"profile_{stamp}.collapsed"
+        with collapsed.open("w", encoding="utf-8") as fh:
+            for (thread, stack), n in self.sampler.stacks.most_common():
+                fh.write(";".join([thread] + [_label(f) for f in stack]) + f" {n}\n")
+        summary = self.summary(collapsed.name)
+        path = self.dir / f"profile_{stamp}.txt"
+        path.write_text(summary, encoding="utf-8")
+        logging.info(f"[Profiler] Session written to {path}")
+        return path, summary
+
+    def summary(self, collapsed_name: str = "") -> str:
+        s = self.sampler
+        per_thread: Counter = Counter()
+        idle: Counter = Counter()
+        self_time: Counter = Counter()
+        total_time: Counter = Counter()
+        active = 0
+        for (thread, stack), n in s.stacks.items():
+            per_thread[thread] += n
+            if not stack or stack[-1][0] in IDLE_FUNCS:
+                idle[thread] += n
+                continue
+            active += n
+            self_time[(_label(stack[-1]), thread)] += n
+            for label in {_label(f) for f in stack}:
+                total_time[(label, thread)] += n
+
+        lines = [
+            "AI Summarizer - profile",
+            f"Started: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(s.started_at))}, "
+            f"duration {s.duration:.1f}s, interval {s.interval * 1000:g} ms, {s.samples} ticks",
+            f"Python {platform.python_version()} on {platform.platform()}, "
+            f"frozen={bool(getattr(sys, 'frozen', False))}, cpus={os.cpu_count()}",
+        ]
+        if collapsed_name:
+            lines.append(f"Stacks: {collapsed_name}")
+        lines += ["", "Threads (samples, idle):"]
+        for thread, n in per_thread.most_common():
+            lines.append(f"  {thread:<28} {n:>7} {idle[thread]:>7}")
+
+        stalls = self.watchdog.stalls
+        lines += ["", f"UI stalls > {self.watchdog.stall * 1000:.0f} ms: {len(stalls)}"]
+        for st in sorted(stalls, key=lambda x: -(x["ms"] or 0))[:10]:
+            lines.append(f"  +{st['at_s']:.1f}s  {st['ms']} ms")
+            lines += ["    " + l for l in "".join(st["stack"][-8:]).rstrip().splitlines()]
+
+        lines += ["", f"Top {self.top_n} hotspots (self, active samples = {active}):",
+                  f"  {'%self':>6} {'%total':>7} {'samples':>8}  function  [thread]"]
+        for (label, thread), n in self_time.most_common(self.top_n):
+            pct = 100.0 * n / max(active, 1)
+            tot = 100.0 * total_time[(label, thread)] / max(active, 1)
+            lines.append(f"  {pct:>5.1f}% {tot:>6.1f}% {n:>8}  {label}  [{thread}]")
+
+        lines += ["", f"Top {self.top_n} by total (inclusive):"]
+        for (label, thread), n in total_time.most_common(self.top_n):
+            lines.append(f"  {100.0 * n / max(active, 1):>6.1f}% {n:>8}  {label}  [{thread}]")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,118 @@
+# provider_registry.py
+"""
+Registry các backend LLM: tên, nhãn trên menu tray, class, capability và
+config mặc định. Module này không import requests/Qt nên tray menu đọc được
+ngay khi khởi động; class provider chỉ được import khi tạo provider.
+
+Thêm backend mới không cần sửa tray app: viết một ProviderBase con rồi gọi
+register_provider(...) trong module của nó, và liệt kê module đó trong
+config.json: "provider_plugins": ["my_provider"].
+
+Capability (scheduler và các tính năng dựa vào đây, không dựa vào tên provider):
+    streaming       chat_stream()
+    parallel_slots  server chạy song song nhiều request (slots của llama.cpp);
+                    số worker "auto" của scheduler = số slot
+    embeddings      embed() (chỉ mục ngữ nghĩa); config "embeddings": false
+                    tắt khi server không phục vụ embeddings
+    tools           server hỗ trợ function calling
+    kv_reuse        server giữ KV cache của prompt trước, prompt cùng prefix
+                    chỉ phải evaluate phần mới
+    tokenize        tokenize() đếm token chính xác bằng tokenizer của model
+"""
+import importlib
+import logging
+from typing import Any, Dict, Iterable, List
+
+STREAMING = "streaming"
+PARALLEL_SLOTS = "parallel_slots"
+EMBEDDINGS = "embeddings"
+TOOLS = "tools"
+KV_REUSE = "kv_reuse"
+TOKENIZE = "tokenize"
+
+PROVIDERS: Dict[str, Dict[str, Any]] = {}
+
+
+def register_provider(name: str, label: str, target: str, capabilities: Iterable[str],
+                      defaults: Dict[str, Any]):
+    """target: "module:Class" (import khi dùng). Đăng ký lại cùng tên sẽ ghi đè."""
+    PROVIDERS[name] = {
+        "name": name,
+        "label": label,
+        "target": target,
+        "capabilities": frozenset(capabilities),
+        "defaults": defaults,
+    }
+
+
+def load_plugins(modules: Iterable[str]):
+    """Import các module provider ngoài (chúng tự gọi register_provider)."""
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logging.error(f"[Providers] Cannot load plugin {module}: {e}")
+
+
+def provider_names() -> List[str]:
+    return list(PROVIDERS)
+
+
+def provider_info(name: str) -> Dict[str, Any]:
+    """Thông tin provider; tên lạ dùng Ollama như make_provider trước đây."""
+    return PROVIDERS.get(name) or PROVIDERS["ollama"]
+
+
+def has_capability(name: str, capability: str) -> bool:
+    return capability in provider_info(name)["capabilities"]
+
+
+def provider_class(name: str):
+    module, _, cls = provider_info(name)["target"].partition(":")
+    return getattr(importlib.import_module(module), cls)
+
+
+def provider_config(cfg: Dict[str, Any], name: str) -> Dict[str, Any]:
+    """Config của provider trong config.json, bổ sung các khoá mặc định còn thiếu
+    (config cũ chưa có mục cho provider mới)."""
+    return {**provider_info(name)["defaults"], **(cfg.get(name) or {})}
+
+
+register_provider(
+    "ollama", "🦙 Ollama", "providers:OllamaProvider",
+    [STREAMING, EMBEDDINGS, TOOLS, KV_REUSE],
+    {
+        "endpoint": "http://127.0.0.1:11434",
+        "model": "gemma:2b",
+        "embed_model": "nomic-embed-text",
+        "temperature": 0.2,
+        "max_tokens": 1024,
+    },
+)
+register_provider(
+    "lmstudio", "🏠 LM Studio", "providers:LMStudioProvider",
+    [STREAMING, EMBEDDINGS, TOOLS],
+    {
+        "endpoint": "http://127.0.0.1:1234/v1",
+        "model": "Meta-Llama-3.1-8B-Instruct-Q4_K_M",
+        "embed_model": "text-embedding-nomic-embed-text-v1.5",
+        "temperature": 0.2,
+        "max_tokens": 1024,
+    },
+)
+register_provider(
+    "llamacpp", "🖥️ llama.cpp server", "providers:LlamaCppProvider",
+    [STREAMING, PARALLEL_SLOTS, EMBEDDINGS, TOOLS, KV_REUSE, TOKENIZE],
+    {
+        "endpoint": "http://127.0.0.1:8080",
+        # llama-server phục vụ một model (-m); tên chỉ dùng cho cache key / log
+        "model": "llama.cpp",
+        "temperature": 0.2,
+        "max_tokens": 1024,
+        # 0 = hỏi server (GET /props -> total_slots, tức --parallel)
+        "slots": 0,
+        "cache_prompt": True,
+        # /v1/embeddings chỉ có khi llama-server chạy với --embeddings
+        "embeddings": False,
+    },
+)
@@ -0,0 +1,579 @@
+# providers.py
+"""
+LLM providers (Ollama, LM Studio, llama.cpp server). Module này không import
+Qt/pynput/win32 để dùng được cả từ tray app lẫn CLI/headless. Tên, nhãn menu,
+capability và config mặc định của từng provider nằm trong provider_registry.py.
+"""
+import contextlib
+import itertools
+import json
+import logging
+import os
+import re
+import socket
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from action_profiles import get_profile, build_messages, apply_profile
+from provider_registry import has_capability, PARALLEL_SLOTS, provider_class
+from stream_decoder import StreamChunk, StreamDone, StreamError, iter_bytes, iter_ndjson, iter_sse
+# requests.post/get, ghi lại request/response khi bật trace (traffic_trace.py)
+from traffic_trace import get as _get, post as _post
+
+def _ollama_options(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    opts = {
+        "temperature": cfg.get("temperature", 0.2),
+        "num_predict": cfg.get("max_tokens", 1024),
+    }
+    if cfg.get("stop"):
+        opts["stop"] = cfg["stop"]
+    # Profile của autotune.py cho model này; khoá đặt tay trong config được ưu tiên.
+    # num_ctx của profile chỉ là mặc định: action profile vẫn quyết định context của action.
+    tuned = (cfg.get("tuning") or {}).get(cfg.get("model"), {})
+    for key in ("num_ctx", "num_thread", "num_batch"):
+        value = cfg.get(key) or tuned.get(key)
+        if value:
+            opts[key] = value
+    return opts
+
+def _openai_params(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    params = {
+        "temperature": cfg.get("temperature", 0.2),
+        "max_tokens": cfg.get("max_tokens", 1024),
+    }
+    if cfg.get("stop"):
+        params["stop"] = cfg["stop"]
+    return params
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+_THINK_BLOCK = re.compile(r"<think>.*?(</think>|$)", re.S)
+# Soft switch của Qwen3 & co. khi server không có tham số tắt reasoning
+NO_THINK_DIRECTIVE = "/no_think"
+
+class ThinkingParser:
+    """Tách reasoning (<think>...</think>) khỏi câu trả lời trong một stream.
+
+    Có trạng thái: tag có thể bị cắt giữa hai chunk ("<thi" + "nk>"), phần
+    đuôi có thể là đầu của một tag được giữ lại tới chunk sau.
+    feed() trả về list StreamChunk (type "thinking" | "content").
+    """
+
+    def __init__(self):
+        self.in_thinking = False
+        self._pending = ""
+
+    def feed(self, text: str) -> List[StreamChunk]:
+        out: List[StreamChunk] = []
+        buf = self._pending + text
+        self._pending = ""
+        while buf:
+            tag = THINK_CLOSE if self.in_thinking else THINK_OPEN
+            idx = buf.find(tag)
+            if idx != -1:
+                self._emit(out, buf[:idx])
+                buf = buf[idx + len(tag):]
+                self.in_thinking = not self.in_thinking
+                continue
+            # Giữ lại phần đuôi có thể là tiền tố của tag
+            keep = 0
+            for n in range(min(len(tag) - 1, len(buf)), 0, -1):
+                if tag.startswith(buf[-n:]):
+                    keep = n
+                    break
+            self._emit(out, buf[:len(buf) - keep])
+            self._pending = buf[len(buf) - keep:]
+            break
+        return out
+
+    def flush(self) -> List[StreamChunk]:
+        out: List[StreamChunk] = []
+        self._emit(out, self._pending)
+        self._pending = ""
+        return out
+
+    def _emit(self, out: List[StreamChunk], text: str):
+        if text:
+            out.append(StreamChunk("thinking" if self.in_thinking else "content", text))
+
+def split_thinking(text: str) -> Dict[str, str]:
+    """Tách một response hoàn chỉnh thành {"content", "thinking"}."""
+    parser = ThinkingParser()
+    parts = {"content": "", "thinking": ""}
+    for chunk in parser.feed(text) + parser.flush():
+        parts[chunk.type] += chunk.text
+    return parts
+
+def context_messages(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Messages gửi lên model: chỉ role/content, bỏ reasoning của các lượt trước."""
+    out = []
+    for m in messages:
+        content = m.get("content", "")
+        if m.get("role") == "assistant" and THINK_OPEN in content:
+            content = _THINK_BLOCK.sub("", content).strip()
+        out.append({"role": m["role"], "content": content})
+    return out
+
+def _with_no_think(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Thêm directive tắt reasoning vào cuối user message cuối cùng."""
+    messages = list(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i]["role"] == "user":
+            messages[i] = {**messages[i], "content": f"{messages[i]['content']}\n\n{NO_THINK_DIRECTIVE}"}
+            break
+    return messages
+
+class StreamCancel:
+    """Huỷ một lần chat_stream từ thread khác. cancel() đóng socket của HTTP
+    response ngay, kể cả khi thread stream đang chờ mạng; generator kết thúc
+    bằng exception của requests (bên gọi kiểm tra .cancelled để bỏ qua)."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._response = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def attach(self, response):
+        with self._lock:
+            self._response = response
+        if self.cancelled:
+            self._abort(response)
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            response = self._response
+        if response is not None:
+            self._abort(response)
+
+    @staticmethod
+    def _abort(response):
+        # shutdown() đánh thức recv() đang chờ (close() thì không, trên Linux)
+        conn = getattr(getattr(response, "raw", None), "_connection", None)
+        sock = getattr(conn, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        try:
+            response.close()
+        except Exception:
+            pass
+
+class ProviderBase:
+    # Tên trong provider_registry (capability, config mặc định)
+    name = ""
+    # True nếu provider có generate(prompt, cfg, system, context) trả về "context"
+    supports_context = False
+
+    def has(self, capability: str) -> bool:
+        return has_capability(self.name, capability)
+
+    def parallel_slots(self, cfg: Dict[str, Any]) -> int:
+        """Số request server xử lý song song được (1 nếu không có PARALLEL_SLOTS)."""
+        return max(1, int(cfg.get("slots") or 1)) if self.has(PARALLEL_SLOTS) else 1
+
+    def tokenize(self, text: str, cfg: Dict[str, Any]) -> List[int]:
+        """Token id theo tokenizer của model (capability TOKENIZE)."""
+        raise NotImplementedError()
+
+    def summarize(self, text: str, cfg: Dict[str, Any]) -> str:
+        return self.run_action("summary", text, cfg)
+
+    def run_action(self, action: str, text: str, cfg: Dict[str, Any], prompt: str = "") -> str:
+        """Run a quick action using its profile from action_profiles.
+        cfg = provider config + "summary_language" (+ optional "actions" overrides)
+        """
+        return self.complete_action(action, text, cfg, prompt)["text"]
+
+    def complete_action(self, action: str, text: str, cfg: Dict[str, Any], prompt: str = "") -> Dict[str, Any]:
+        """Same as run_action but returns the full complete() result (text + usage)."""
+        profile = get_profile(action, cfg.get("actions"))
+        messages = build_messages(profile, text, cfg.get("summary_language", "vi"), prompt)
+        return self.complete(messages, apply_profile(cfg, profile, text))
+    
+    def chat(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]) -> str:
+        """Chat with LLM using message history.
+        messages = [{"role": "system"|"user"|"assistant", "content": "..."}]
+        """
+        return self.complete(messages, cfg)["text"]
+
+    def complete(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]) -> Dict[str, Any]:
+        """Non-streaming chat call.
+        Returns: {"text": "...", "prompt_tokens": int, "completion_tokens": int}
+        (+ "unparsed": True nếu không đọc được câu trả lời, text là response gốc)
+        """
+        raise NotImplementedError()
+    
+    def embed(self, texts: List[str], cfg: Dict[str, Any]) -> List[List[float]]:
+        """Embedding cho từng text, dùng model cfg["embed_model"]."""
+        raise NotImplementedError()
+
+    def chat_stream(self, messages: List[Dict[str, str]], cfg: Dict[str, Any],
+                    cancel: Optional[StreamCancel] = None):
+        """Stream chat response from LLM.
+        Yields: StreamChunk(type="thinking"|"content", text=...), cuối cùng
+        StreamDone (số token, finish_reason) nếu server báo.
+        cfg["think"]: None = mặc định của model, False = yêu cầu model không suy luận.
+        cancel: StreamCancel để dừng từ thread khác (nút Stop của ChatWindow).
+        """
+        raise NotImplementedError()
+
+class OllamaProvider(ProviderBase):
+    name = "ollama"
+    supports_context = True
+
+    def __init__(self):
+        self._chat_prefix: Dict[str, Any] = {"messages": [], "tokens": 0}
+
+    def _payload(self, messages: List[Dict[str, str]], cfg: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+        payload = {
+            "model": cfg["model"],
+            "messages": context_messages(messages),
+            "stream": stream,
+            "options": _ollama_options(cfg)
+        }
+        # think=False: model reasoning (qwen3, deepseek-r1...) trả lời ngay
+        if cfg.get("think") is not None:
+            payload["think"] = bool(cfg["think"])
+        if cfg.get("keep_alive"):
+            payload["keep_alive"] = cfg["keep_alive"]
+        return payload
+
+    def generate(self, prompt: str, cfg: Dict[str, Any], system: str = "",
+                 context: Optional[List[int]] = None) -> Dict[str, Any]:
+        """/api/generate (non-streaming). Truyền `context` của lần trước để chỉ
+        evaluate phần prompt mới. Trả về như complete() kèm "context"."""
+        endpoint = cfg["endpoint"].rstrip("/")
+        payload = {
+            "model": cfg["model"],
+            "prompt": prompt,
+            "stream": False,
+            "options": _ollama_options(cfg),
+        }
+        if system:
+            payload["system"] = system
+        if context:
+            payload["context"] = context
+        if cfg.get("think") is not None:
+            payload["think"] = bool(cfg["think"])
+        if cfg.get("keep_alive"):
+            payload["keep_alive"] = cfg["keep_alive"]
+        r = _post(f"{endpoint}/api/generate", payload)
+        r.raise_for_status()
+        data = r.json()
+        return {
+            "text": split_thinking(data.get("response", ""))["content"].strip(),
+            "prompt_tokens": data.get("prompt_eval_count", 0),
+            "completion_tokens": data.get("eval_count", 0),
+            "context": data.get("context") or [],
+        }
+
+    def embed(self, texts: List[str], cfg: Dict[str, Any]) -> List[List[float]]:
+        endpoint = cfg["endpoint"].rstrip("/")
+        payload = {"model": cfg.get("embed_model", "nomic-embed-text"), "input": texts}
+        r = _post(f"{endpoint}/api/embed", payload, timeout=60)
+        r.raise_for_status()
+        return r.json()["embeddings"]
+
+    def _track_chat(self, sent: List[Dict[str, str]], reply: str, data: Dict[str, Any]):
+        """Ước lượng số token prompt server lấy từ KV cache: nếu lượt này bắt đầu
+        đúng bằng lượt trước + câu trả lời, toàn bộ prefix đó được tái dùng."""
+        prev = self._chat_prefix
+        saved = prev["tokens"] if prev["messages"] and sent[:len(prev["messages"])] == prev["messages"] else 0
+        evaluated = data.get("prompt_eval_count", 0)
+        self._chat_prefix = {
+            "messages": sent + [{"role": "assistant", "content": reply}],
+            "tokens": saved + evaluated + data.get("eval_count", 0),
+        }
+        logging.info(f"[Ollama] chat: evaluated {evaluated} prompt tokens, ~{saved} reused from KV cache")
+
+    def complete(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]) -> Dict[str, Any]:
+        endpoint = cfg["endpoint"].rstrip("/")
+        url = f"{endpoint}/api/chat"
+        r = _post(url, self._payload(messages, cfg, False))
+        r.raise_for_status()
+        data = r.json()
+        parts = split_thinking(data.get("message", {}).get("content", ""))
+        return {
+            "text": parts["content"].strip(),
+            "prompt_tokens": data.get("prompt_eval_count", 0),
+            "completion_tokens": data.get("eval_count", 0),
+        }
+    
+    def chat_stream(self, messages: List[Dict[str, str]], cfg: Dict[str, Any],
+                    cancel: Optional[StreamCancel] = None):
+        endpoint = cfg["endpoint"].rstrip("/")
+        url = f"{endpoint}/api/chat"
+        # Ollama mới trả reasoning trong "thinking"; bản cũ để <think> trong content
+        parser = ThinkingParser()
+        payload = self._payload(messages, cfg, True)
+        reply = []
+        done = None
+        
+        with _post(url, payload, stream=True) as r:
+            if cancel:
+                cancel.attach(r)
+            r.raise_for_status()
+            for data in iter_ndjson(iter_bytes(r)):
+                if "error" in data:
+                    raise StreamError(data["error"])
+                message = data.get("message")
+                if message:
+                    thinking = message.get("thinking")
+                    if thinking:
+                        yield StreamChunk("thinking", thinking)
+                    content = message.get("content")
+                    if content:
+                        for chunk in parser.feed(content):
+                            if chunk.type == "content":
+                                reply.append(chunk.text)
+                            yield chunk
+                if data.get("done"):
+                    done = data
+            for chunk in parser.flush():
+                if chunk.type == "content":
+                    reply.append(chunk.text)
+                yield chunk
+        if done:
+            self._track_chat(payload["messages"], "".join(reply), done)
+            yield StreamDone(done.get("prompt_eval_count", 0), done.get("eval_count", 0),
+                             done.get("done_reason"), done)
+
+class LMStudioProvider(ProviderBase):
+    """Server OpenAI-compatible (LM Studio; LlamaCppProvider kế thừa)."""
+
+    name = "lmstudio"
+    log_tag = "LMStudio"
+
+    def _base(self, cfg: Dict[str, Any]) -> str:
+        return cfg["endpoint"].rstrip("/")
+
+    def _messages(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]) -> List[Dict[str, str]]:
+        # API OpenAI-compatible không có tham số tắt reasoning -> dùng prompt directive
+        messages = context_messages(messages)
+        return _with_no_think(messages) if cfg.get("think") is False else messages
+
+    def _payload(self, messages: List[Dict[str, str]], cfg: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+        payload = {
+            "model": cfg["model"],
+            "messages": self._messages(messages, cfg),
+            "stream": stream,
+            **_openai_params(cfg),
+        }
+        if stream:
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    def _slot(self, payload: Dict[str, Any], cfg: Dict[str, Any]):
+        """Context manager bao quanh một request (llama.cpp: giữ một slot)."""
+        return contextlib.nullcontext()
+
+    def complete(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]) -> Dict[str, Any]:
+        url = f"{self._base(cfg)}/chat/completions"
+        payload = self._payload(messages, cfg, False)
+        with self._slot(payload, cfg):
+            r = _post(url, payload)
+            r.raise_for_status()
+            data = r.json()
+        usage = data.get("usage") or {}
+        unparsed = False
+        try:
+            text = split_thinking(data["choices"][0]["message"]["content"])["content"].strip()
+        except Exception:
+            text = json.dumps(data, ensure_ascii=False)
+            unparsed = True
+        res = {
+            "text": text,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+        }
+        if unparsed:
+            res["unparsed"] = True  # text là JSON response gốc, không phải câu trả lời
+        # llama.cpp: timings.cache_n = số token prompt lấy lại từ KV cache của slot
+        timings = data.get("timings") or {}
+        if timings.get("cache_n"):
+            res["saved_prompt_tokens"] = timings["cache_n"]
+        return res
+    
+    def embed(self, texts: List[str], cfg: Dict[str, Any]) -> List[List[float]]:
+        payload = {"model": cfg.get("embed_model", "text-embedding-nomic-embed-text-v1.5"), "input": texts}
+        r = _post(f"{self._base(cfg)}/embeddings", payload, timeout=60)
+        r.raise_for_status()
+        data = sorted(r.json()["data"], key=lambda d: d.get("index", 0))
+        return [d["embedding"] for d in data]
+
+    def chat_stream(self, messages: List[Dict[str, str]], cfg: Dict[str, Any],
+                    cancel: Optional[StreamCancel] = None):
+        url = f"{self._base(cfg)}/chat/completions"
+        payload = self._payload(messages, cfg, True)
+        parser = ThinkingParser()
+        usage: Dict[str, Any] = {}
+        finish_reason = None
+        
+        with self._slot(payload, cfg), _post(url, payload, stream=True) as r:
+            if cancel:
+                cancel.attach(r)
+            r.raise_for_status()
+            for event in iter_sse(iter_bytes(r)):
+                if event.data == b"[DONE]":
+                    break
+                try:
+                    data = event.json()
+                except ValueError:
+                    logging.warning(f"[{self.log_tag}] Malformed SSE data skipped: {event.data[:200]!r}")
+                    continue
+                if event.event == "error" or "error" in data:
+                    error = data.get("error", data)
+                    raise StreamError(error.get("message", error) if isinstance(error, dict) else error)
+                usage = data.get("usage") or usage
+                if data.get("timings"):
+                    usage = {**usage, "timings": data["timings"]}
+                choices = data.get("choices") or [{}]
+                finish_reason = choices[0].get("finish_reason") or finish_reason
+                delta = choices[0].get("delta") or {}
+                # LM Studio có thể tách reasoning sẵn (reasoning_content)
+                reasoning = delta.get("reasoning_content") or delta.get("reasoning")
+                if reasoning:
+                    yield StreamChunk("thinking", reasoning)
+                content = delta.get("content")
+                if content:
+                    yield from parser.feed(content)
+            yield from parser.flush()
+        yield StreamDone(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), finish_reason, usage)
+
+def _shared_prefix(a: List[Tuple[str, str]], b: List[Tuple[str, str]]) -> Tuple[int, int]:
+    """(số message đầu giống hệt nhau, số ký tự chung ở đầu message kế tiếp)."""
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            return n, len(os.path.commonprefix([x[1], y[1]])) if x[0] == y[0] else 0
+        n += 1
+    return n, 0
+
+class SlotPool:
+    """Chọn slot của llama.cpp server cho từng request.
+
+    Mỗi slot giữ KV cache của prompt cuối cùng nó xử lý. Request mới được gắn
+    vào slot đang rảnh có prefix trùng dài nhất (cùng hội thoại; các action
+    trên cùng văn bản), hoà thì slot lâu chưa dùng nhất; hết slot rảnh thì
+    trả -1 để server tự xếp hàng. count = 0: không biết số slot, luôn -1.
+    """
+
+    def __init__(self, count: int):
+        self.count = count
+        self._lock = threading.Lock()
+        self._busy: set = set()
+        self._prompt: Dict[int, List[Tuple[str, str]]] = {i: [] for i in range(count)}
+        self._last_used: Dict[int, int] = {i: 0 for i in range(count)}
+        self._seq = itertools.count(1)
+
+    def acquire(self, messages: List[Dict[str, str]]) -> int:
+        prompt = [(m["role"], m["content"]) for m in messages]
+        with self._lock:
+            free = [i for i in range(self.count) if i not in self._busy]
+            if not free:
+                return -1
+            slot = max(free, key=lambda i: (_shared_prefix(self._prompt[i], prompt), -self._last_used[i]))
+            self._busy.add(slot)
+            self._prompt[slot] = prompt
+            self._last_used[slot] = next(self._seq)
+            return slot
+
+    def release(self, slot: int):
+        if slot < 0:
+            return
+        with self._lock:
+            self._busy.discard(slot)
+
+class LlamaCppProvider(LMStudioProvider):
+    """llama.cpp `llama-server` (API OpenAI-compatible tại /v1).
+
+    Server chạy với `--parallel N` có N slot xử lý song song; provider gắn
+    mỗi request vào một slot (`id_slot`, xem SlotPool) và bật `cache_prompt`
+    để slot chỉ evaluate phần prompt sau prefix đã có trong KV cache.
+    """
+
+    name = "llamacpp"
+    log_tag = "LlamaCpp"
+
+    def __init__(self):
+        self._pools: Dict[str, SlotPool] = {}
+        self._lock = threading.Lock()
+        # Gọi với số slot khi đọc được /props lần đầu (server khởi động sau app)
+        self.on_slots: Optional[Callable[[int], None]] = None
+
+    @staticmethod
+    def _root(cfg: Dict[str, Any]) -> str:
+        root = cfg["endpoint"].rstrip("/")
+        return root[:-3] if root.endswith("/v1") else root
+
+    def _base(self, cfg: Dict[str, Any]) -> str:
+        return f"{self._root(cfg)}/v1"
+
+    def _messages(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]) -> List[Dict[str, str]]:
+        # think=False đi qua chat template (enable_thinking), không sửa prompt
+        return context_messages(messages)
+
+    def _payload(self, messages: List[Dict[str, str]], cfg: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+        payload = super()._payload(messages, cfg, stream)
+        payload["cache_prompt"] = cfg.get("cache_prompt", True)
+        if cfg.get("think") is False:
+            payload["chat_template_kwargs"] = {"enable_thinking": False}
+        return payload
+
+    def _pool(self, cfg: Dict[str, Any]) -> SlotPool:
+        root = self._root(cfg)
+        with self._lock:
+            pool = self._pools.get(root)
+        if pool is not None:
+            return pool
+        count = int(cfg.get("slots") or 0) or self._probe_slots(root)
+        if not count:
+            return SlotPool(0)  # server chưa chạy: hỏi lại lần sau
+        with self._lock:
+            created = root not in self._pools
+            pool = self._pools.setdefault(root, SlotPool(count))
+        if created and self.on_slots:
+            self.on_slots(count)
+        return pool
+
+    def _probe_slots(self, root: str) -> int:
+        try:
+            r = _get(f"{root}/props", timeout=2)
+            r.raise_for_status()
+            count = int(r.json().get("total_slots") or 1)
+        except (requests.RequestException, ValueError) as e:
+            logging.warning(f"[LlamaCpp] Cannot read slots from {root}/props: {e}")
+            return 0
+        logging.info(f"[LlamaCpp] {root}: {count} slots")
+        return count
+
+    def parallel_slots(self, cfg: Dict[str, Any]) -> int:
+        return max(1, self._pool(cfg).count)
+
+    @contextlib.contextmanager
+    def _slot(self, payload: Dict[str, Any], cfg: Dict[str, Any]):
+        pool = self._pool(cfg)
+        slot = pool.acquire(payload["messages"])
+        if slot >= 0:
+            payload["id_slot"] = slot
+        try:
+            yield
+        finally:
+            pool.release(slot)
+
+    def tokenize(self, text: str, cfg: Dict[str, Any]) -> List[int]:
+        r = _post(f"{self._root(cfg)}/tokenize", {"content": text}, timeout=30)
+        r.raise_for_status()
+        return r.json()["tokens"]
+
+def make_provider(name: str) -> ProviderBase:
+    return provider_class(name)()
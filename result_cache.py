@@ -0,0 +1,64 @@
+# result_cache.py
+"""
+Cache kết quả model (SQLite, thread-safe).
+
+Key = sha256 của toàn bộ request đã dựng (model + messages + tham số sinh),
+nên đổi model/profile/prompt sẽ tự động miss thay vì trả kết quả cũ.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+def request_key(model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+    raw = json.dumps({"model": model, "messages": messages, "params": params},
+                     ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path: str = "result_cache.sqlite", max_entries: int = 5000):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, action TEXT, text TEXT, meta TEXT, created REAL, used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_results_used ON results(used)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT text, meta FROM results WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            self._db.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        meta = json.loads(row[1] or "{}")
+        return {"text": row[0], **meta}
+
+    def put(self, key: str, action: str, text: str, meta: Optional[Dict[str, Any]] = None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, action, text, meta, created, used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, action, text, json.dumps(meta or {}, ensure_ascii=False), now, now),
+            )
+            # Bỏ các entry ít dùng nhất khi vượt giới hạn
+            count = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
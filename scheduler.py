@@ -0,0 +1,79 @@
+# scheduler.py
+"""
+Scheduler cho các lời gọi model: số worker cố định (giới hạn số request đồng
+thời tới server model) + hàng đợi ưu tiên (interactive chạy trước background).
+"""
+import itertools
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BACKGROUND = 10
+
+
+class Scheduler:
+    def __init__(self, max_concurrency: int = 1, name: str = "llm"):
+        self.max_concurrency = max(1, max_concurrency)
+        self.name = name
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._worker_ids = itertools.count()
+        self._active = 0
+        self._lock = threading.Lock()
+        for _ in range(self.max_concurrency):
+            self._start_worker()
+
+    def _start_worker(self):
+        t = threading.Thread(target=self._worker, name=f"{self.name}-worker-{next(self._worker_ids)}", daemon=True)
+        t.start()
+
+    def resize(self, max_concurrency: int):
+        """Đổi số worker (vd. provider mới có số slot khác). Worker thừa thoát
+        sau khi xong job đang chạy; job trong hàng đợi không bị huỷ."""
+        n = max(1, max_concurrency)
+        with self._lock:
+            delta = n - self.max_concurrency
+            self.max_concurrency = n
+        for _ in range(delta):
+            self._start_worker()
+        for _ in range(-delta):
+            # Ưu tiên cao hơn mọi job: worker rảnh kế tiếp nhận và thoát
+            self._queue.put((PRIORITY_INTERACTIVE - 1, next(self._seq), None, None, (), {}))
+        if delta:
+            logging.info(f"[Scheduler:{self.name}] {n} workers")
+
+    def submit(self, fn: Callable, *args, priority: int = PRIORITY_NORMAL, **kwargs) -> Future:
+        fut: Future = Future()
+        self._queue.put((priority, next(self._seq), fut, fn, args, kwargs))
+        return fut
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = self._active
+        return {"queued": self._queue.qsize(), "active": active, "workers": self.max_concurrency}
+
+    def _worker(self):
+        while True:
+            _prio, _seq, fut, fn, args, kwargs = self._queue.get()
+            if fn is None:
+                break
+            if not fut.set_running_or_notify_cancel():
+                continue
+            with self._lock:
+                self._active += 1
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                logging.error(f"[Scheduler:{self.name}] job failed: {e}")
+                fut.set_exception(e)
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+    def shutdown(self):
+        for _ in range(self.max_concurrency):
+            self._queue.put((float("inf"), next(self._seq), None, None, (), {}))
@@ -0,0 +1,278 @@
+# semantic_index.py
+"""
+Chỉ mục ngữ nghĩa cục bộ cho các kết quả cũ (tóm tắt, lượt chat, kết quả MCP).
+
+Vector embedding (lấy qua endpoint embeddings của provider) được chuẩn hoá và
+ghi nối tiếp vào một file float32 thô (`<path>.f32`), đọc lại bằng
+np.memmap nên không phải nạp toàn bộ vào RAM; metadata từng dòng nằm trong
+`<path>.jsonl`, RAM chỉ giữ vị trí byte của mỗi dòng (text đọc khi cần).
+Tìm kiếm top-k là một phép nhân ma trận-vector (cosine trên vector đã chuẩn
+hoá) + argpartition.
+
+NumPy là dependency tuỳ chọn: thiếu NumPy thì chỉ mục bị tắt.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy không bắt buộc
+    np = None
+
+from scheduler import PRIORITY_BACKGROUND
+
+MAX_SNIPPET_CHARS = 1500
+# Lane embed chờ lời gọi model tương tác xong, kiểm tra lại sau mỗi khoảng này
+IDLE_POLL_SECONDS = 0.2
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class SemanticIndex:
+    """Ma trận vector append-only + metadata. Thread-safe.
+
+    RAM chỉ giữ vị trí byte của từng dòng metadata và hash của đoạn text (để
+    bỏ qua đoạn đã có); text và các trường khác được đọc từ `<path>.jsonl`
+    khi là kết quả tìm kiếm."""
+
+    def __init__(self, path: str = "semantic_index"):
+        if np is None:
+            raise RuntimeError("NumPy is required for the semantic index")
+        self.vec_path = path + ".f32"
+        self.meta_path = path + ".jsonl"
+        self.info_path = path + ".json"
+        self.lock = threading.RLock()
+        self.dim = 0
+        self.model = ""
+        # Trạng thái nhỏ của bên dùng index (vd. số tin nhắn chat đã index)
+        self.state: Dict[str, Any] = {}
+        self._offsets = array("q")   # vị trí byte của dòng metadata thứ i
+        self._meta_size = 0
+        self._hashes = set()
+        self._matrix = None   # memmap (count, dim), làm mới khi có dòng mới
+        self._load()
+
+    # ---- storage ----
+
+    def _load(self):
+        if os.path.exists(self.info_path):
+            try:
+                with open(self.info_path, "r", encoding="utf-8") as f:
+                    info = json.load(f)
+                self.dim = info.get("dim", 0)
+                self.model = info.get("model", "")
+                self.state = info.get("state", {})
+            except Exception as e:
+                logging.warning(f"[Index] Cannot read {self.info_path}: {e}")
+        pos = 0
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        try:
+                            self._hashes.add(json.loads(line).get("hash"))
+                        except json.JSONDecodeError:
+                            break  # dòng cuối ghi dở
+                        self._offsets.append(pos)
+                    pos += len(line)
+        # Vector và metadata có thể lệch nhau nếu app bị tắt giữa hai lần ghi
+        rows = os.path.getsize(self.vec_path) // (4 * self.dim) if self.dim and os.path.exists(self.vec_path) else 0
+        count = min(rows, len(self._offsets))
+        if count < len(self._offsets):
+            pos = self._offsets[count]
+            del self._offsets[count:]
+            self._hashes = {e.get("hash") for e in self._entries(range(count))}
+        if os.path.exists(self.meta_path) and os.path.getsize(self.meta_path) != pos:
+            with open(self.meta_path, "r+b") as f:
+                f.truncate(pos)
+        self._meta_size = pos
+        if rows > count:
+            with open(self.vec_path, "r+b") as f:
+                f.truncate(count * 4 * self.dim)
+
+    def _write_info(self):
+        with open(self.info_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "model": self.model, "state": self.state}, f)
+
+    def _release_matrix(self):
+        """Bỏ memmap của file vector; Windows không cho xoá file đang được map."""
+        mm = getattr(self._matrix, "_mmap", None)
+        self._matrix = None
+        if mm is not None:
+            try:
+                mm.close()
+            except BufferError:  # còn view khác trỏ vào map: đóng khi view được giải phóng
+                pass
+
+    def _reset(self, dim: int, model: str):
+        if self.dim:
+            logging.warning(f"[Index] Embedding model changed ({self.model}/{self.dim} -> {model}/{dim}), rebuilding index")
+        self._release_matrix()
+        for p in (self.vec_path, self.meta_path):
+            if os.path.exists(p):
+                os.remove(p)
+        self._offsets, self._meta_size, self._hashes, self._matrix = array("q"), 0, set(), None
+        self.dim, self.model, self.state = dim, model, {}
+        self._write_info()
+
+    def set_state(self, key: str, value: Any):
+        with self.lock:
+            self.state[key] = value
+            self._write_info()
+
+    def _entries(self, rows) -> List[Dict[str, Any]]:
+        """Metadata đầy đủ (cả text) của các dòng, đọc từ file."""
+        out = []
+        with open(self.meta_path, "rb") as f:
+            for i in rows:
+                f.seek(self._offsets[i])
+                out.append(json.loads(f.readline()))
+        return out
+
+    def _matrix_view(self):
+        count = len(self._offsets)
+        if not count:
+            return None
+        if self._matrix is None or self._matrix.shape[0] != count:
+            self._release_matrix()
+            self._matrix = np.memmap(self.vec_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+        return self._matrix
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def contains(self, text: str) -> bool:
+        return _text_hash(text) in self._hashes
+
+    # ---- write / search ----
+
+    def add(self, vectors: Sequence[Sequence[float]], metas: List[Dict[str, Any]], model: str = ""):
+        """Nối thêm vector (sẽ được chuẩn hoá) và metadata tương ứng."""
+        vecs = np.asarray(vectors, dtype=np.float32)
+        if vecs.ndim != 2 or not len(vecs):
+            return
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs /= np.maximum(norms, 1e-12)
+        with self.lock:
+            if vecs.shape[1] != self.dim or (model and model != self.model):
+                self._reset(vecs.shape[1], model)
+            with open(self.vec_path, "ab") as f:
+                f.write(vecs.tobytes())
+            with open(self.meta_path, "ab") as f:
+                for m in metas:
+                    line = (json.dumps(m, ensure_ascii=False) + "\n").encode("utf-8")
+                    f.write(line)
+                    self._offsets.append(self._meta_size)
+                    self._meta_size += len(line)
+            self._hashes.update(m.get("hash") for m in metas)
+
+    def search(self, query: Sequence[float], k: int = 4, min_score: float = 0.0,
+               exclude: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
+        """Top-k theo cosine. Trả về metadata kèm "score", giảm dần."""
+        with self.lock:
+            matrix = self._matrix_view()
+            if matrix is None:
+                return []
+            q = np.asarray(query, dtype=np.float32)
+            if q.shape != (self.dim,):
+                return []
+            q = q / max(float(np.linalg.norm(q)), 1e-12)
+            scores = matrix @ q
+            # Lấy dư để còn đủ k sau khi lọc
+            n = min(len(scores), k * 4 if exclude else k)
+            top = np.argpartition(-scores, n - 1)[:n]
+            top = [int(i) for i in top[np.argsort(-scores[top])] if scores[i] >= min_score]
+            out = []
+            for i, m in zip(top, self._entries(top)):
+                if exclude and exclude(m):
+                    continue
+                out.append({**m, "score": float(scores[i])})
+                if len(out) >= k:
+                    break
+            return out
+
+
+class SemanticMemory:
+    """Ghép chỉ mục với hàm embedding của provider hiện tại.
+
+    remember() embed trên lane riêng (scheduler một worker của index, không
+    chiếm worker của lời gọi model) và chỉ chạy khi busy() báo không có lời
+    gọi model tương tác nào; recall() embed câu hỏi rồi tìm top-k (không có kết
+    quả khi index được dựng bằng embedding model khác model hiện tại).
+    """
+
+    def __init__(self, index: SemanticIndex, embed: Callable[[List[str]], List[List[float]]],
+                 model: Callable[[], str], scheduler=None, busy: Optional[Callable[[], bool]] = None):
+        self.index = index
+        self.embed = embed
+        self.model = model
+        self.scheduler = scheduler
+        self.busy = busy
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def remember(self, kind: str, text: str, **meta) -> Optional[Future]:
+        """Xếp đoạn text vào lane embed. Trả về Future (True nếu đã vào index,
+        False nếu embed lỗi), hoặc None khi không có gì để làm (rỗng / đã có)."""
+        text = (text or "").strip()[:MAX_SNIPPET_CHARS]
+        if not text or self.index.contains(text):
+            return None
+        entry = {"kind": kind, "text": text, "hash": _text_hash(text), "ts": int(time.time()), **meta}
+        with self._lock:
+            # Đoạn đang chờ embed: không xếp hàng lần nữa
+            if entry["hash"] in self._pending:
+                return self._pending[entry["hash"]]
+            if self.scheduler:
+                fut = self.scheduler.submit(self._add, entry, priority=PRIORITY_BACKGROUND)
+            else:
+                fut = Future()
+            self._pending[entry["hash"]] = fut
+        if not self.scheduler:
+            fut.set_result(self._add(entry))
+        return fut
+
+    def _add(self, entry: Dict[str, Any]) -> bool:
+        try:
+            # Lane ưu tiên thấp nhất: nhường server model cho request tương tác
+            while self.busy and self.busy():
+                time.sleep(IDLE_POLL_SECONDS)
+            if not self.index.contains(entry["text"]):
+                vectors = self.embed([entry["text"]])
+                self.index.add(vectors, [entry], self.model())
+            return True
+        except Exception as e:
+            logging.warning(f"[Index] Cannot embed {entry['kind']} entry: {e}")
+            return False
+        finally:
+            with self._lock:
+                self._pending.pop(entry["hash"], None)
+
+    def recall(self, query: str, k: int = 4, min_score: float = 0.35,
+               exclude: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
+        if not len(self.index) or not query.strip():
+            return []
+        if self.index.model != self.model():
+            # Vector của model khác không so được với câu hỏi; index được dựng
+            # lại ở lần remember() kế tiếp
+            logging.info(f"[Index] Built with {self.index.model or 'unknown model'}, "
+                         f"current is {self.model()}: skipping recall")
+            return []
+        try:
+            vector = self.embed([query[:MAX_SNIPPET_CHARS]])[0]
+        except Exception as e:
+            logging.warning(f"[Index] Cannot embed query: {e}")
+            return []
+        started = time.perf_counter()
+        hits = self.index.search(vector, k, min_score, exclude)
+        logging.info(f"[Index] {len(hits)} hits from {len(self.index)} entries "
+                     f"in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return hits
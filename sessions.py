@@ -0,0 +1,81 @@
+# sessions.py
+"""
+Session cho các quick action nối tiếp trên cùng một đoạn văn bản
+(vd. "summary" rồi "explain" ngay sau đó).
+
+Với provider hỗ trợ context token (Ollama /api/generate), lần gọi đầu trả về
+mảng `context`; các action sau trên cùng văn bản gửi lại mảng đó kèm chỉ dẫn
+mới, nên server chỉ phải evaluate phần prompt mới thay vì cả văn bản.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict
+
+from action_profiles import followup_prompt
+
+
+class ActionSession:
+    def __init__(self, max_entries: int = 8, ttl_s: float = 600.0, max_ctx_ratio: float = 0.8):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        # Bắt đầu lại khi context chiếm quá tỷ lệ này của num_ctx
+        self.max_ctx_ratio = max_ctx_ratio
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.saved_tokens = 0
+
+    def _key(self, job: Dict[str, Any]) -> str:
+        cfg = job["cfg"]
+        raw = f"{cfg.get('endpoint')}\0{cfg.get('model')}\0{job['text']}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _reusable(self, entry: Dict[str, Any], job: Dict[str, Any]) -> bool:
+        if not entry or time.time() - entry["ts"] > self.ttl_s:
+            return False
+        # Cùng action lần nữa (regenerate) -> bắt đầu lại, không nối vào câu trả lời cũ
+        if job["action"] in entry["actions"]:
+            return False
+        num_ctx = job["cfg"].get("num_ctx") or 2048
+        budget = num_ctx * self.max_ctx_ratio - job["cfg"].get("max_tokens", 1024)
+        return len(entry["context"]) < budget
+
+    def run(self, provider, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Chạy job qua provider.generate(), nối tiếp context nếu có.
+        Kết quả có thêm "saved_prompt_tokens" (số token prompt không phải evaluate lại)."""
+        key = self._key(job)
+        with self._lock:
+            entry = self._entries.get(key)
+            if not self._reusable(entry, job):
+                entry = None
+
+        if entry:
+            prompt = followup_prompt(job["profile"], job["lang"], job["prompt"])
+            res = provider.generate(prompt, job["cfg"], context=entry["context"])
+            saved = len(entry["context"])
+            actions = entry["actions"] | {job["action"]}
+        else:
+            system, user = job["messages"][0]["content"], job["messages"][-1]["content"]
+            res = provider.generate(user, job["cfg"], system=system)
+            saved = 0
+            actions = {job["action"]}
+
+        context = res.pop("context", None)
+        with self._lock:
+            if context:
+                self._entries[key] = {"context": context, "actions": actions, "ts": time.time()}
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self.saved_tokens += saved
+        if saved:
+            logging.info(f"[Session] {job['action']}: reused {saved} context tokens, "
+                         f"evaluated {res.get('prompt_tokens', 0)} (total saved {self.saved_tokens})")
+        res["saved_prompt_tokens"] = saved
+        return res
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,86 @@
+# startup_report.py
+"""
+Đo thời gian khởi động của tray app: từng nhóm import và từng giai đoạn
+khởi tạo (tray hiện lên, input hook, engine, MCP...).
+
+Mỗi lần chạy ghi `startup_report.json` (giữ lại số liệu lần trước) và log
+cảnh báo khi một giai đoạn chậm hơn hẳn lần trước - cold start chậm đi là
+thấy ngay trong debug.log.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Chậm hơn lần trước cả về tỉ lệ lẫn tuyệt đối mới coi là regression
+REGRESSION_RATIO = 1.5
+REGRESSION_MIN_MS = 50.0
+
+
+def _value(stage: Dict[str, Any]) -> float:
+    """Độ dài của giai đoạn, hoặc thời điểm với mốc."""
+    return stage["at_ms"] if stage["ms"] is None else stage["ms"]
+
+
+class StartupReport:
+    def __init__(self, path: str = "startup_report.json"):
+        self.path = Path(path)
+        self.t0 = time.perf_counter()
+        self.started_at = time.time()
+        self.stages: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def _ms(self, t: float) -> float:
+        return round((t - self.t0) * 1000, 1)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Đo một giai đoạn: with report.stage("import:qt"): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.stages.append({
+                    "name": name,
+                    "at_ms": self._ms(start),
+                    "ms": round((end - start) * 1000, 1),
+                    "thread": threading.current_thread().name,
+                })
+
+    def mark(self, name: str):
+        """Mốc thời gian (không có độ dài), vd "tray_visible"."""
+        with self._lock:
+            self.stages.append({"name": name, "at_ms": self._ms(time.perf_counter()), "ms": None,
+                                "thread": threading.current_thread().name})
+
+    def write(self):
+        """Ghi báo cáo, so với lần chạy trước và log các giai đoạn chậm đi."""
+        previous: Dict[str, float] = {}
+        try:
+            old = json.loads(self.path.read_text(encoding="utf-8"))
+            previous = {s["name"]: _value(s) for s in old.get("stages", [])}
+        except (OSError, ValueError, KeyError):
+            pass
+        with self._lock:
+            stages = list(self.stages)
+        for s in stages:
+            value = _value(s)
+            before = previous.get(s["name"])
+            if before and value > before * REGRESSION_RATIO and value - before > REGRESSION_MIN_MS:
+                logging.warning(f"[Startup] {s['name']} took {value:.0f} ms (previous run {before:.0f} ms)")
+        report = {
+            "started_at": self.started_at,
+            "stages": stages,
+            "previous": previous,
+        }
+        try:
+            self.path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        except OSError as e:
+            logging.warning(f"[Startup] Cannot write {self.path}: {e}")
+        summary = ", ".join(f"{s['name']}={_value(s):.0f}ms" for s in stages)
+        logging.info(f"[Startup] {summary}")
@@ -0,0 +1,202 @@
+# stream_decoder.py
+"""
+Decoder dùng chung cho response stream của các provider (không import Qt).
+
+- NDJSON (Ollama /api/chat, /api/generate): mỗi dòng một object JSON.
+- SSE (OpenAI-compatible: LM Studio /v1/chat/completions): event gồm các
+  dòng "field: value", kết thúc bằng dòng trống; nhiều dòng "data:" trong
+  một event được nối bằng "\\n", hỗ trợ "event:", "id:", comment ":" và cả
+  ba kiểu xuống dòng (\\n, \\r\\n, \\r).
+
+Đọc socket theo khối lớn (read1: trả về ngay phần đã có, không chờ đủ khối
+nên không làm chậm token đầu), tách dòng trên bytes với buffer tăng dần,
+parse JSON bằng orjson nếu có (nhanh hơn ~2-4 lần), không thì json chuẩn.
+
+Provider yield StreamChunk (thinking/content) và cuối cùng một StreamDone
+mang số token / lý do kết thúc. Chunk vẫn đọc được như dict
+(chunk["type"]) để code cũ không phải đổi.
+"""
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson không bắt buộc
+    orjson = None
+
+CHUNK_SIZE = 64 * 1024
+
+loads = orjson.loads if orjson else json.loads
+JSON_BACKEND = "orjson" if orjson else "json"
+
+
+def set_json_backend(name: str) -> str:
+    """Chọn backend JSON ("orjson" | "json"); trả về backend đang dùng."""
+    global loads, JSON_BACKEND
+    if name == "orjson" and orjson is not None:
+        loads, JSON_BACKEND = orjson.loads, "orjson"
+    else:
+        loads, JSON_BACKEND = json.loads, "json"
+    return JSON_BACKEND
+
+
+class StreamChunk:
+    """Một đoạn text của câu trả lời: type là "thinking" hoặc "content"."""
+
+    __slots__ = ("type", "text")
+
+    def __init__(self, type: str, text: str):
+        self.type = type
+        self.text = text
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "text": self.text}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.type!r}, {self.text[:40]!r})"
+
+
+class StreamDone(StreamChunk):
+    """Chunk cuối của stream: số token và lý do dừng do server báo (nếu có)."""
+
+    __slots__ = ("prompt_tokens", "completion_tokens", "finish_reason", "raw")
+
+    def __init__(self, prompt_tokens: int = 0, completion_tokens: int = 0,
+                 finish_reason: Optional[str] = None, raw: Optional[Dict[str, Any]] = None):
+        super().__init__("done", "")
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.finish_reason = finish_reason
+        self.raw = raw or {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": "done", "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens, "finish_reason": self.finish_reason}
+
+
+class SSEEvent:
+    __slots__ = ("event", "data", "id")
+
+    def __init__(self, event: str, data: bytes, id: Optional[str] = None):
+        self.event = event
+        self.data = data
+        self.id = id
+
+    def json(self) -> Any:
+        return loads(self.data)
+
+    @property
+    def text(self) -> str:
+        return self.data.decode("utf-8", errors="replace")
+
+
+class StreamError(RuntimeError):
+    """Server báo lỗi ngay trong stream (HTTP 200 nhưng có object "error")."""
+
+
+def read_chunks(response, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Bytes của response theo khối tối đa chunk_size, trả về ngay khi có dữ liệu."""
+    raw = getattr(response, "raw", None)
+    if getattr(raw, "chunked", False) and hasattr(raw, "read_chunked"):
+        # Transfer-Encoding: chunked (Ollama, LM Studio): mỗi chunk HTTP một lần
+        # đọc, rẻ hơn read1() vốn đi qua toàn bộ lớp buffer của urllib3
+        yield from raw.read_chunked(decode_content=True)
+        return
+    read1 = getattr(raw, "read1", None)
+    if read1 is None:  # urllib3 < 2
+        yield from response.iter_content(chunk_size=chunk_size)
+        return
+    while True:
+        data = read1(chunk_size)
+        if not data:
+            return
+        yield data
+
+
+def iter_bytes(response, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    # RecordedResponse (traffic_trace) tự đọc để ghi lại trace
+    own = getattr(response, "iter_bytes", None)
+    if own is not None:
+        return own(chunk_size)
+    return read_chunks(response, chunk_size)
+
+
+def _malformed(kind: str, raw: bytes):
+    logging.warning(f"[Stream] Malformed {kind} skipped: {raw[:200]!r}")
+
+
+def iter_ndjson(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Object JSON của từng dòng; dòng hỏng được log (không dừng cả stream)."""
+    buf = b""
+    for chunk in chunks:
+        if b"\n" not in chunk:
+            buf += chunk
+            continue
+        lines = (buf + chunk).split(b"\n") if buf else chunk.split(b"\n")
+        buf = lines.pop()
+        for line in lines:
+            if line.strip():
+                try:
+                    yield loads(line)
+                except ValueError:
+                    _malformed("NDJSON line", line)
+    if buf.strip():
+        try:
+            yield loads(buf)
+        except ValueError:
+            _malformed("NDJSON line", buf)
+
+
+def iter_sse(chunks: Iterable[bytes]) -> Iterator[SSEEvent]:
+    """Event SSE theo spec WHATWG (event không có data thì bỏ qua)."""
+    buf = b""
+    event = b""
+    data: List[bytes] = []
+    last_id: Optional[str] = None
+    for chunk in chunks:
+        buf = buf + chunk if buf else chunk
+        if b"\r" in buf:
+            # "\r" cuối khối có thể là nửa đầu của "\r\n": chờ khối sau
+            tail = b"\r" if buf.endswith(b"\r") else b""
+            buf = buf[:len(buf) - len(tail)].replace(b"\r\n", b"\n").replace(b"\r", b"\n") + tail
+        if b"\n" not in buf:
+            continue
+        lines = buf.split(b"\n")
+        buf = lines.pop()
+        for line in lines:
+            if not line:
+                if data:
+                    yield SSEEvent(event.decode("utf-8", errors="replace") if event else "message", b"\n".join(data), last_id)
+                event, data = b"", []
+                continue
+            if line[:6] == b"data: ":  # trường hợp phổ biến, tránh partition
+                data.append(line[6:])
+                continue
+            if line[0] == 58:  # ":" comment / keep-alive
+                continue
+            field, sep, value = line.partition(b":")
+            if sep and value[:1] == b" ":
+                value = value[1:]
+            if field == b"data":
+                data.append(value)
+            elif field == b"event":
+                event = value
+            elif field == b"id":
+                last_id = value.decode("utf-8", errors="replace")
+    line = buf.rstrip(b"\r")
+    if line.startswith(b"data"):
+        value = line.partition(b":")[2]
+        data.append(value[1:] if value[:1] == b" " else value)
+    if data:
+        # Server đóng kết nối không có dòng trống cuối: vẫn giao event dở
+        yield SSEEvent(event.decode("utf-8", errors="replace") if event else "message", b"\n".join(data), last_id)
@@ -0,0 +1,338 @@
+# traffic_trace.py
+"""
+Ghi lại và phát lại traffic giữa app và LLM server để tái hiện lỗi chậm
+mà không cần model/phần cứng gốc.
+
+Ghi: bật `"trace": {"record": true}` trong config.json (hoặc `batch_cli.py
+--record traces`). Mọi request của providers.py (POST và GET, vd. /props của
+llama.cpp) được ghi vào
+`traces/trace_<thời gian>.jsonl.gz`: payload gửi đi, status, và từng dòng
+response (NDJSON / SSE) kèm thời điểm nhận (ms từ lúc gửi request).
+
+Phát lại:
+    python traffic_trace.py show traces/trace_20250101_090000.jsonl.gz
+    python traffic_trace.py replay traces/trace_20250101_090000.jsonl.gz --port 11500 --speed 1
+rồi trỏ endpoint của provider vào http://127.0.0.1:11500 (LM Studio:
+http://127.0.0.1:11500/v1). Server trả lại đúng các dòng đã ghi với nhịp
+thời gian gốc (--speed 2: nhanh gấp đôi, --speed 0: không chờ).
+
+Trace chứa nguyên văn bản người dùng gửi cho model - chỉ chia sẻ khi phù hợp.
+"""
+import argparse
+import gzip
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from stream_decoder import read_chunks
+
+
+class TraceRecorder:
+    def __init__(self, directory: str = "traces"):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.path = Path(directory) / f"trace_{time.strftime('%Y%m%d_%H%M%S')}.jsonl.gz"
+        self._lock = threading.Lock()
+
+    def write(self, exchange: Dict[str, Any]):
+        line = json.dumps(exchange, ensure_ascii=False) + "\n"
+        with self._lock:
+            # Mỗi lần ghi là một gzip member; gzip.open đọc nối tiếp được tất cả
+            with gzip.open(self.path, "at", encoding="utf-8") as fh:
+                fh.write(line)
+
+
+_recorder: Optional[TraceRecorder] = None
+
+
+def start_recording(directory: str = "traces") -> TraceRecorder:
+    global _recorder
+    if _recorder is None:
+        _recorder = TraceRecorder(directory)
+        logging.info(f"[Trace] Recording provider traffic to {_recorder.path}")
+    return _recorder
+
+
+def stop_recording():
+    global _recorder
+    _recorder = None
+
+
+class RecordedResponse:
+    """Bọc requests.Response: ghi lại các dòng đọc qua iter_lines() / body của json()."""
+
+    def __init__(self, response: requests.Response, recorder: TraceRecorder, url: str,
+                 payload: Optional[Dict[str, Any]], stream: bool, started: float, method: str = "POST"):
+        self._r = response
+        self._recorder = recorder
+        self._started = started
+        self._lines: List[List[Any]] = []
+        self._done = False
+        self._exchange: Dict[str, Any] = {
+            "ts": time.time(),
+            "method": method,
+            "url": url,
+            "path": urlsplit(url).path,
+            "request": payload,
+            "stream": stream,
+            "status": response.status_code,
+            "content_type": response.headers.get("Content-Type", ""),
+            "ttfb_ms": self._ms(),
+        }
+
+    def _ms(self) -> float:
+        return round((time.perf_counter() - self._started) * 1000, 2)
+
+    @property
+    def status_code(self) -> int:
+        return self._r.status_code
+
+    @property
+    def headers(self):
+        return self._r.headers
+
+    @property
+    def raw(self):
+        return self._r.raw
+
+    def raise_for_status(self):
+        try:
+            self._r.raise_for_status()
+        except requests.HTTPError:
+            self._finish(body=self._r.text)
+            raise
+
+    def json(self) -> Any:
+        body = self._r.text
+        self._finish(body=body)
+        return json.loads(body)
+
+    def iter_lines(self, *args, **kwargs):
+        for line in self._r.iter_lines(*args, **kwargs):
+            self._lines.append([self._ms(), line.decode("utf-8", errors="replace") if isinstance(line, bytes) else line])
+            yield line
+
+    def iter_bytes(self, chunk_size: int):
+        """Cho stream_decoder: đọc theo khối, ghi lại từng dòng hoàn chỉnh."""
+        partial = b""
+        for data in read_chunks(self._r, chunk_size):
+            ms = self._ms()
+            lines = (partial + data).split(b"\n")
+            partial = lines.pop()
+            for line in lines:
+                self._lines.append([ms, line.rstrip(b"\r").decode("utf-8", errors="replace")])
+            yield data
+        if partial:
+            self._lines.append([self._ms(), partial.decode("utf-8", errors="replace")])
+
+    def close(self):
+        self._finish()
+        self._r.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _finish(self, body: Optional[str] = None):
+        if self._done:
+            return
+        self._done = True
+        ex = self._exchange
+        if body is not None:
+            ex["body"] = body
+            ex["body_ms"] = self._ms()
+        else:
+            ex["lines"] = self._lines
+        ex["duration_ms"] = self._ms()
+        try:
+            self._recorder.write(ex)
+        except OSError as e:
+            logging.warning(f"[Trace] Cannot write trace: {e}")
+
+
+def post(url: str, payload: Dict[str, Any], stream: bool = False, timeout: float = 120):
+    """requests.post cho providers; ghi lại exchange khi đang bật recording."""
+    recorder = _recorder
+    started = time.perf_counter()
+    r = requests.post(url, json=payload, stream=stream, timeout=timeout)
+    if recorder is None:
+        return r
+    return RecordedResponse(r, recorder, url, payload, stream, started)
+
+
+def get(url: str, timeout: float = 120):
+    """requests.get cho providers (vd. /props); ghi lại như post()."""
+    recorder = _recorder
+    started = time.perf_counter()
+    r = requests.get(url, timeout=timeout)
+    if recorder is None:
+        return r
+    return RecordedResponse(r, recorder, url, None, False, started, method="GET")
+
+
+# ---- Đọc / phát lại ----
+
+def load_trace(path: str) -> List[Dict[str, Any]]:
+    out = []
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                out.append(json.loads(line))
+    return out
+
+
+def _first_line_ms(ex: Dict[str, Any]) -> Optional[float]:
+    for ms, line in ex.get("lines") or []:
+        if line:
+            return ms
+    return ex.get("body_ms")
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    exchanges: List[Dict[str, Any]] = []
+    scale = 1.0
+    _used: set = set()
+    _lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _match(self, method: str, path: str, body: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Exchange cùng path + cùng payload chưa dùng; nếu không có thì exchange
+        chưa dùng kế tiếp cùng path; hết thì quay lại exchange cuối cùng path."""
+        with self._lock:
+            # Trace cũ không có "method": đều là POST
+            same_path = [i for i, ex in enumerate(self.exchanges)
+                         if ex["path"] == path and ex.get("method", "POST") == method]
+            if not same_path:
+                return None
+            unused = [i for i in same_path if i not in self._used]
+            exact = [i for i in unused if self.exchanges[i].get("request") == body]
+            pick = (exact or unused or same_path[-1:])[0]
+            self._used.add(pick)
+            return self.exchanges[pick]
+
+    def _sleep_until(self, start: float, ms: float):
+        delay = start + ms * self.scale / 1000.0 - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def do_GET(self):
+        self._replay("GET", time.perf_counter(), None)
+
+    def do_POST(self):
+        start = time.perf_counter()
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            body = {}
+        self._replay("POST", start, body)
+
+    def _replay(self, method: str, start: float, body: Optional[Dict[str, Any]]):
+        ex = self._match(method, self.path.split("?", 1)[0], body)
+        if ex is None:
+            out = json.dumps({"error": f"no recorded exchange for {self.path}"}).encode("utf-8")
+            self.send_response(404)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+            return
+        # ttfb gồm cả thời gian server đọc prompt trước khi trả header
+        self._sleep_until(start, ex.get("ttfb_ms", 0))
+        try:
+            if "body" in ex:
+                out = ex["body"].encode("utf-8")
+                self._sleep_until(start, ex.get("body_ms", 0))
+                self.send_response(ex["status"])
+                self.send_header("Content-Type", ex.get("content_type") or "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+                return
+            self.send_response(ex["status"])
+            self.send_header("Content-Type", ex.get("content_type") or "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for ms, line in ex.get("lines", []):
+                self._sleep_until(start, ms)
+                data = (line + "\n").encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class ReplayServer:
+    def __init__(self, exchanges: List[Dict[str, Any]], host: str = "127.0.0.1", port: int = 11500,
+                 speed: float = 1.0):
+        handler = type("Handler", (ReplayHandler,), {
+            "exchanges": exchanges,
+            "scale": 1.0 / speed if speed > 0 else 0.0,
+            "_used": set(),
+            "_lock": threading.Lock(),
+        })
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, name="trace-replay", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def show(exchanges: List[Dict[str, Any]]):
+    print(f"{'#':>3}  {'path':<24} {'status':>6} {'ttfb':>8} {'first':>8} {'total':>9} {'lines':>6}  model")
+    for i, ex in enumerate(exchanges, 1):
+        first = _first_line_ms(ex)
+        print(f"{i:>3}  {ex['path']:<24} {ex['status']:>6} {ex.get('ttfb_ms', 0):>7.0f}ms "
+              f"{(f'{first:.0f}ms' if first is not None else '-'):>8} {ex.get('duration_ms', 0):>7.0f}ms "
+              f"{len(ex.get('lines') or []):>6}  {(ex.get('request') or {}).get('model', '')}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Record/replay provider traffic")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_show = sub.add_parser("show", help="liệt kê các exchange trong trace")
+    p_show.add_argument("trace")
+    p_replay = sub.add_parser("replay", help="phát lại trace như một LLM server")
+    p_replay.add_argument("trace")
+    p_replay.add_argument("--host", default="127.0.0.1")
+    p_replay.add_argument("--port", type=int, default=11500)
+    p_replay.add_argument("--speed", type=float, default=1.0, help="2 = nhanh gấp đôi, 0 = không chờ")
+    args = ap.parse_args()
+
+    exchanges = load_trace(args.trace)
+    if args.cmd == "show":
+        show(exchanges)
+        return
+    server = ReplayServer(exchanges, args.host, args.port, args.speed)
+    print(f"Replaying {len(exchanges)} exchanges on {server.url} (speed x{args.speed:g})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# translation_memory.py
+"""
+Bộ nhớ dịch theo câu (SQLite, thread-safe) cho action "translate".
+
+Văn bản được tách thành câu (giữ nguyên xuống dòng / khoảng trắng giữa các
+câu); câu đã dịch trước đó (cùng ngôn ngữ đích, cùng model) lấy từ bộ nhớ,
+chỉ các câu mới được gửi cho model theo lô, rồi ghép lại đúng thứ tự.
+"""
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# Ranh giới câu: dấu kết câu + khoảng trắng (giữ lại khoảng trắng để ghép)
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?。！？…])(\s+)")
+_NEWLINES = re.compile(r"(\s*\n\s*)")
+_HAS_LETTER = re.compile(r"[^\W\d_]", re.UNICODE)
+_NUMBERED = re.compile(r"^\s*(\d+)[.)]\s?(.*)$")
+
+BATCH_SENTENCES = 20
+BATCH_CHARS = 2000
+NUMBERED_NOTE = {
+    "vi": "Dịch từng dòng đánh số dưới đây. Giữ nguyên số thứ tự, mỗi dòng một câu, không thêm gì khác.",
+    "en": "Translate each numbered line below. Keep the numbering, one sentence per line, nothing else.",
+}
+
+
+def segment(text: str) -> List[Tuple[str, bool]]:
+    """Tách text thành [(đoạn, cần_dịch)]. Ghép lại các đoạn = text ban đầu."""
+    pieces: List[Tuple[str, bool]] = []
+    for part in _NEWLINES.split(text):
+        if not part:
+            continue
+        if _NEWLINES.fullmatch(part) or not part.strip():
+            pieces.append((part, False))
+            continue
+        core = part.strip()
+        lead = part[:len(part) - len(part.lstrip())]
+        trail = part[len(part.rstrip()):]
+        if lead:
+            pieces.append((lead, False))
+        for i, piece in enumerate(_SENTENCE_BREAK.split(core)):
+            if piece:
+                # Phần lẻ (khoảng trắng) hoặc không có chữ cái (số, ký hiệu) giữ nguyên
+                pieces.append((piece, i % 2 == 0 and bool(_HAS_LETTER.search(piece))))
+        if trail:
+            pieces.append((trail, False))
+    return pieces
+
+
+def numbered_prompt(sentences: List[str], lang: str) -> str:
+    lines = "\n".join(f"{i}. {s}" for i, s in enumerate(sentences, 1))
+    return f"{NUMBERED_NOTE.get(lang, NUMBERED_NOTE['en'])}\n\n{lines}"
+
+
+def parse_numbered(output: str, count: int) -> Optional[List[str]]:
+    """Đọc lại output dạng "1. ...". None nếu model không giữ đúng số dòng."""
+    found: Dict[int, str] = {}
+    for line in output.splitlines():
+        m = _NUMBERED.match(line)
+        if m and 1 <= int(m.group(1)) <= count:
+            found.setdefault(int(m.group(1)), m.group(2).strip())
+    if len(found) != count or not all(found.values()):
+        return None
+    return [found[i] for i in range(1, count + 1)]
+
+
+def _batches(sentences: List[str]) -> List[List[str]]:
+    batches: List[List[str]] = []
+    size = 0
+    for s in sentences:
+        if not batches or len(batches[-1]) >= BATCH_SENTENCES or size + len(s) > BATCH_CHARS:
+            batches.append([])
+            size = 0
+        batches[-1].append(s)
+        size += len(s)
+    return batches
+
+
+class TranslationMemory:
+    def __init__(self, path: str = "translation_memory.sqlite", max_entries: int = 100000):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            " key TEXT PRIMARY KEY, source TEXT, target TEXT, lang TEXT, model TEXT, used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_segments_used ON segments(used)")
+        self._db.commit()
+
+    @staticmethod
+    def key(source: str, lang: str, model: str) -> str:
+        return hashlib.sha256(f"{lang}\0{model}\0{source}".encode("utf-8")).hexdigest()
+
+    def get_many(self, sources: List[str], lang: str, model: str) -> Dict[str, str]:
+        keys = {self.key(s, lang, model): s for s in sources}
+        found: Dict[str, str] = {}
+        with self._lock:
+            items = list(keys)
+            for i in range(0, len(items), 500):
+                chunk = items[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, target FROM segments WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for k, target in rows:
+                    found[keys[k]] = target
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE segments SET used = ? WHERE key = ?",
+                                     [(now, self.key(s, lang, model)) for s in found])
+                self._db.commit()
+        return found
+
+    def put_many(self, pairs: Dict[str, str], lang: str, model: str):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO segments (key, source, target, lang, model, used) VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.key(s, lang, model), s, t, lang, model, now) for s, t in pairs.items()],
+            )
+            count = self._db.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM segments WHERE key IN (SELECT key FROM segments ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._db.commit()
+
+    def translate(self, text: str, lang: str, model: str,
+                  translate_batch: Callable[[str], Dict[str, Any]], use_memory: bool = True) -> Dict[str, Any]:
+        """Dịch text qua bộ nhớ; translate_batch(prompt) gọi model, trả về như complete().
+
+        Lô nhiều câu được gửi dạng danh sách đánh số; nếu model không trả đúng
+        số dòng thì dịch lại từng câu của lô đó.
+        Trả về {"text", "prompt_tokens", "completion_tokens", "tm_segments", "tm_hits", "tm_saved_tokens"}.
+        """
+        pieces = segment(text)
+        sources = list(dict.fromkeys(p for p, translatable in pieces if translatable))
+        known = self.get_many(sources, lang, model) if use_memory else {}
+        new = [s for s in sources if s not in known]
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+
+        def call(prompt: str) -> Tuple[str, bool]:
+            """(text, ok); ok = False khi model không trả về bản dịch (rỗng, response lạ)."""
+            res = translate_batch(prompt)
+            usage["prompt_tokens"] += res.get("prompt_tokens", 0)
+            usage["completion_tokens"] += res.get("completion_tokens", 0)
+            text = res["text"].strip()
+            return text, bool(text) and not res.get("unparsed")
+
+        translated: Dict[str, str] = {}
+        # Câu không có bản dịch hợp lệ: vẫn hiển thị nhưng không ghi vào bộ nhớ
+        failed: Set[str] = set()
+
+        def translate_one(source: str):
+            text, ok = call(source)
+            translated[source] = text or source
+            if not ok:
+                failed.add(source)
+
+        for batch in _batches(new):
+            if len(batch) == 1:
+                translate_one(batch[0])
+                continue
+            text, ok = call(numbered_prompt(batch, lang))
+            lines = parse_numbered(text, len(batch)) if ok else None
+            if lines is None:
+                logging.warning(f"[TM] Batch of {len(batch)} came back misaligned, translating one by one")
+                for s in batch:
+                    translate_one(s)
+                continue
+            translated.update(zip(batch, lines))
+        if failed:
+            logging.warning(f"[TM] {len(failed)} segments came back empty or malformed, not stored")
+        valid = {s: t for s, t in translated.items() if s not in failed}
+        if valid:
+            self.put_many(valid, lang, model)
+
+        known.update(translated)
+        out = "".join(known.get(p, p) if translatable else p for p, translatable in pieces)
+        hits = len(sources) - len(new)
+        # ~4 ký tự / token: câu có sẵn không tốn token prompt lẫn token sinh
+        saved = sum(len(s) + len(known[s]) for s in sources if s not in translated) // 4
+        logging.info(f"[TM] {hits}/{len(sources)} segments from memory, ~{saved} tokens saved")
+        return {"text": out.strip(), **usage, "tm_segments": len(sources), "tm_hits": hits, "tm_saved_tokens": saved}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
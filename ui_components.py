@@ -2,8 +2,11 @@ import json
 import datetime
 import logging
 from pathlib import Path
+from typing import TYPE_CHECKING
 from PySide6 import QtWidgets, QtGui, QtCore
-from mcp_manager import MCPManager
+
+if TYPE_CHECKING:  # MCP SDK chỉ được nạp khi MCP bật (app._start_services)
+    from mcp_manager import MCPManager
 
 # -------- Floating Panel (quick actions) ----------
 
@@ -24,9 +27,10 @@ class PopupPanel(QtWidgets.QWidget):
         self.btnTranslate = QtWidgets.QPushButton("🌐 Dịch (vi↔en)")
         self.btnRewrite = QtWidgets.QPushButton("✍️ Viết lại")
         self.btnCustom = QtWidgets.QPushButton("⚙️ Prompt tùy biến")
+        self.btnFanout = QtWidgets.QPushButton("🧩 Chạy tất cả")
         self.btnClose = QtWidgets.QPushButton("❌ Đóng")
 
-        for b in (self.btnSummary, self.btnExplain, self.btnTranslate, self.btnRewrite, self.btnCustom, self.btnClose):
+        for b in (self.btnSummary, self.btnExplain, self.btnTranslate, self.btnRewrite, self.btnCustom, self.btnFanout, self.btnClose):
             b.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
             self.layout().addWidget(b)
 
@@ -39,6 +43,7 @@ class PopupPanel(QtWidgets.QWidget):
         self.btnTranslate.clicked.connect(lambda: self._do("translate"))
         self.btnRewrite.clicked.connect(lambda: self._do("rewrite"))
         self.btnCustom.clicked.connect(lambda: self._do("custom"))
+        self.btnFanout.clicked.connect(lambda: self._do("fanout"))
         self.btnClose.clicked.connect(self.hide)
 
     def show_at_cursor(self, pos: QtCore.QPoint, text: str, callback):
@@ -57,7 +62,7 @@ class PopupPanel(QtWidgets.QWidget):
 # -------- MCP Panel ----------
 
 class MCPPanel(QtWidgets.QDialog):
-    def __init__(self, mcp_manager: MCPManager, parent=None):
+    def __init__(self, mcp_manager: "MCPManager", parent=None):
         super().__init__(parent)
         self.setWindowTitle("MCP – Chọn server & tool")
         self.resize(720, 520)